@@ -1,26 +1,60 @@
 import os
+import json
+import mimetypes
+import posixpath
+import time
+import base64
+import hashlib
+import hmac
+import logging
+import threading
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from sqlalchemy import create_engine, select, inspect
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship, joinedload
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, flash, send_file, session, jsonify
+from sqlalchemy import create_engine, select, update, inspect, func, or_, and_
+from sqlalchemy.orm import sessionmaker, declarative_base, relationship, joinedload, selectinload
+from werkzeug.http import is_resource_modified
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
 from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, Boolean, DateTime
-import math
-import requests
 from datetime import datetime
-from supabase_service import upload_file_to_supabase, delete_file_from_supabase
+from storage_service import (
+  storage, local_storage, delete_url, UploadResult, MEDIA_KEY_RE, MEDIA_SENDFILE, MEDIA_ACCEL_PREFIX, MEDIA_MAX_AGE,
+)
+from shipping_service import (
+  geocache, haversine_distance, shipping_cost_for_distance, PICKUP_POINT_CEP,
+  get_pickup_coordinates, resolve_pickup_coordinates, record_pickup_coordinates, pickup_retry_due,
+)
+from shipping_table import load_quote_table
+from async_geocoder import async_geocoder
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from cache_service import page_cache, product_page_cache, bump_catalog_generation, bump_stock_version
+from search_service import create_search_backend, setup_search_schema, SEARCH_PAGE_SIZE
+from image_service import (
+  process_uploads_batch, format_srcset, parse_srcset, pick_derivative, CARD_IMAGE_SIZES, DETAIL_IMAGE_SIZES,
+)
+from catalog_snapshot import CatalogReplica, setup_snapshot_schema
+from read_models import Group
+import reservation_service
+import stock_service
+import deletion_service
+from deletion_service import DeletionQueue
+from reservation_service import ReservationError, InsufficientStock, RateLimited, ReservationSweeper
+import metrics_service
+import profiling_service
+import asset_service
+import compression_service
+from logging_config import configure_logging
 
 # Carrega variáveis de ambiente
 load_dotenv()
-DATABASE_URL = os.environ.get("DATABASE_URL")
+logger = logging.getLogger(__name__)
 SECRET = os.environ.get("FLASK_SECRET") or os.environ.get("SECRET_KEY") or "troque_ja"
 
-if not DATABASE_URL:
-  raise SystemExit("Configure DATABASE_URL no .env")
-
-engine = create_engine(DATABASE_URL, future=True, pool_recycle=3600, pool_pre_ping=True)
-SessionLocal = sessionmaker(bind=engine)
+# importar este módulo não conecta ao banco: o engine é criado por create_app()/init_engine()
+# e o esquema é criado/atualizado só pelo comando `flask --app app init-db`
+engine = None
+SessionLocal = sessionmaker()
 
 Base = declarative_base()
 
@@ -42,14 +76,28 @@ class Product(Base):
   # relação com Classification
   classification_id = Column(Integer, ForeignKey("classifications.id"), nullable=True)
   classification = relationship("Classification", back_populates="products")
+  # revisão da página do produto: +1 a cada alteração (admin, estoque, imagens, variações);
+  # define o ETag/Last-Modified e a entrada de /produto/<id> no cache (ver product_detail)
+  revision = Column(Integer, nullable=False, default=1, server_default="1")
+  updated_at = Column(DateTime, default=datetime.utcnow)
 
 class ProductImage(Base):
   __tablename__ = "product_images"
   id = Column(Integer, primary_key=True)
   product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
   image_url = Column(String(300), nullable=False)
+  # derivados WebP redimensionados: "url 320w, url 640w, ..." (ver image_service.py)
+  srcset = Column(Text, nullable=True)
   product = relationship("Product", back_populates="images")
 
+  def derivative_url(self, min_width):
+    """Menor derivado com largura >= min_width; sem derivados, a URL original."""
+    return pick_derivative(self.srcset, min_width) or self.image_url
+
+  def storage_urls(self):
+    """Original + derivados (tudo o que precisa ser apagado do Storage junto com a imagem)."""
+    return [self.image_url] + [url for _, url in parse_srcset(self.srcset)]
+
 class ProductStock(Base):
   __tablename__ = "product_stock"
   id = Column(Integer, primary_key=True)
@@ -75,12 +123,79 @@ class Classification(Base):
   display_order = Column(Integer, default=0)
   products = relationship("Product", back_populates="classification", cascade="all")
 
+class CepGeocache(Base):
+  """Cache persistente CEP -> coordenadas, compartilhado entre os workers."""
+  __tablename__ = "cep_geocache"
+  cep = Column(String(8), primary_key=True)
+  lat = Column(Float, nullable=False)
+  lon = Column(Float, nullable=False)
+  updated_at = Column(DateTime, default=datetime.utcnow)
+
+class StorageDeletion(Base):
+  """Outbox de objetos a remover do Storage (processada após o commit; ver deletion_service.py)."""
+  __tablename__ = "storage_deletions"
+  id = Column(Integer, primary_key=True)
+  url = Column(String(500), nullable=False, index=True)
+  attempts = Column(Integer, default=0)
+  last_error = Column(Text, nullable=True)
+  claim = Column(String(32), nullable=True, index=True)
+  next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+  created_at = Column(DateTime, default=datetime.utcnow)
+
+class StockReservation(Base):
+  """Baixa de estoque feita no checkout; ativa até ser confirmada, liberada ou vencer (TTL)."""
+  __tablename__ = "stock_reservations"
+  id = Column(Integer, primary_key=True)
+  token = Column(String(36), nullable=False, index=True)
+  variant_id = Column(Integer, ForeignKey("product_stock.id", ondelete="CASCADE"), nullable=False)
+  quantity = Column(Integer, nullable=False)
+  status = Column(String(16), nullable=False, default="active", index=True)  # active | confirmed | released
+  client = Column(String(64), index=True)  # IP de quem reservou (limite de reservas por janela)
+  created_at = Column(DateTime, default=datetime.utcnow)
+  expires_at = Column(DateTime, nullable=False, index=True)
+
 
 # =========================================================================
 # FUNÇÕES E INICIALIZAÇÃO
 # =========================================================================
 
-Base.metadata.create_all(engine) # Garante que as tabelas existem
+# pool de conexões (por worker; com gthread, DB_POOL_SIZE >= threads). Sem pre-ping por padrão:
+# em vez de um SELECT 1 a cada checkout, as conexões são recicladas antes do timeout de ociosidade
+# do servidor/pooler (DB_POOL_RECYCLE), a LIFO deixa as sobras ociosas expirarem, o TCP keepalive
+# derruba conexões mortas e, se uma cair mesmo assim, o SQLAlchemy invalida o pool no erro
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "300"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+
+def engine_options(database_url):
+  options = {"future": True, "pool_recycle": DB_POOL_RECYCLE, "pool_pre_ping": DB_POOL_PRE_PING}
+  if database_url.startswith("sqlite"):
+    return options
+  options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT, pool_use_lifo=True)
+  if database_url.startswith(("postgres", "postgresql")):
+    options["connect_args"] = {"keepalives": 1, "keepalives_idle": 30, "keepalives_interval": 10, "keepalives_count": 3}
+  return options
+
+def init_engine(database_url=None):
+  """Cria o engine (uma vez por processo) e liga o SessionLocal a ele."""
+  global engine
+  if engine is None:
+    database_url = database_url or os.environ.get("DATABASE_URL")
+    if not database_url:
+      raise SystemExit("Configure DATABASE_URL no .env")
+    engine = create_engine(database_url, **engine_options(database_url))
+    SessionLocal.configure(bind=engine)
+  return engine
+
+def dispose_engine_after_fork():
+  """
+  Chamado no worker recém-criado (gunicorn post_fork com preload): descarta as conexões
+  herdadas do master sem fechá-las — o socket continua sendo do processo pai.
+  """
+  if engine is not None:
+    engine.dispose(close=False)
 
 def ensure_admin():
   admin_user = os.environ.get("ADMIN_USER", "admin")
@@ -91,7 +206,7 @@ def ensure_admin():
     if not exists:
       db.add(Admin(username=admin_user, password_hash=generate_password_hash(admin_pw)))
       db.commit()
-      print(f"[setup] Admin criado: {admin_user} (senha a partir de ADMIN_PASSWORD)")
+      logger.info("Admin criado: %s (senha a partir de ADMIN_PASSWORD)", admin_user)
 
 def ensure_classification_order_column():
   """Adds display_order column to classifications if missing (SQLite/Postgres safe)."""
@@ -102,16 +217,169 @@ def ensure_classification_order_column():
   try:
     with engine.begin() as conn:
       conn.exec_driver_sql("ALTER TABLE classifications ADD COLUMN display_order INTEGER DEFAULT 0")
-    print("[setup] Column display_order added to classifications")
+    logger.info("Column display_order added to classifications")
   except Exception as e:
-    print(f"[setup] Could not add display_order column: {e}")
+    logger.warning("Could not add display_order column: %s", e)
 
-# chamada de inicialização
-ensure_admin()
-ensure_classification_order_column()
+def ensure_product_image_srcset_column():
+  """Adds srcset column to product_images if missing (SQLite/Postgres safe)."""
+  insp = inspect(engine)
+  cols = [c['name'] for c in insp.get_columns('product_images')]
+  if 'srcset' in cols:
+    return
+  try:
+    with engine.begin() as conn:
+      conn.exec_driver_sql("ALTER TABLE product_images ADD COLUMN srcset TEXT")
+    logger.info("Column srcset added to product_images")
+  except Exception as e:
+    logger.warning("Could not add srcset column: %s", e)
+
+def ensure_product_revision_columns():
+  """Adds revision/updated_at columns to products if missing (SQLite/Postgres safe)."""
+  insp = inspect(engine)
+  cols = [c['name'] for c in insp.get_columns('products')]
+  if 'revision' in cols and 'updated_at' in cols:
+    return
+  try:
+    with engine.begin() as conn:
+      if 'revision' not in cols:
+        conn.exec_driver_sql("ALTER TABLE products ADD COLUMN revision INTEGER NOT NULL DEFAULT 1")
+      if 'updated_at' not in cols:
+        conn.exec_driver_sql("ALTER TABLE products ADD COLUMN updated_at TIMESTAMP")
+        conn.exec_driver_sql("UPDATE products SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL")
+    logger.info("Columns revision/updated_at added to products")
+  except Exception as e:
+    logger.warning("Could not add revision/updated_at columns: %s", e)
+
+def ensure_reservation_client_column():
+  """Adds client column to stock_reservations if missing (SQLite/Postgres safe)."""
+  insp = inspect(engine)
+  cols = [c['name'] for c in insp.get_columns('stock_reservations')]
+  if 'client' in cols:
+    return
+  try:
+    with engine.begin() as conn:
+      conn.exec_driver_sql("ALTER TABLE stock_reservations ADD COLUMN client VARCHAR(64)")
+      conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_stock_reservations_client ON stock_reservations (client)")
+    logger.info("Column client added to stock_reservations")
+  except Exception as e:
+    logger.warning("Could not add client column: %s", e)
+
+def init_db(database_url=None):
+  """Cria/atualiza o esquema e o admin inicial (idempotente). Rodar uma vez por deploy."""
+  configure_logging()
+  init_engine(database_url)
+  Base.metadata.create_all(engine) # Garante que as tabelas existem
+  ensure_admin()
+  ensure_classification_order_column()
+  ensure_product_image_srcset_column()
+  ensure_product_revision_columns()
+  ensure_reservation_client_column()
+  # busca full-text: extensões, coluna, trigger e índices no PostgreSQL
+  setup_search_schema(engine)
+  # réplica do catálogo: NOTIFY nas escritas do catálogo (PostgreSQL)
+  setup_snapshot_schema(engine)
+  # páginas em cache de antes da migração podem não refletir o banco/templates atuais
+  # (aqui, uma vez por deploy — não em create_app, que roda em cada worker e comando)
+  bump_catalog_generation()
+  bump_stock_version()
+
+# estado de execução: preenchido por create_app() (uma vez por processo)
+search_backend = None
+# catálogo em memória, somente leitura, usado pelas rotas de leitura (ver catalog_snapshot.py)
+catalog = None
+ADMIN_SEARCH_PAGE_SIZE = 200
+quote_table = None
+# reservas vencidas voltam ao estoque pelo varredor em segundo plano de cada worker
+reservation_sweeper = None
+# remoções do Storage: gravadas na outbox junto com o commit e executadas em lote, em segundo plano
+deletion_queue = None
+_initialized = False
+_init_lock = threading.Lock()
+
+def cache_metrics():
+  """Acertos/erros dos caches deste worker, para o /metrics."""
+  page, product, geo = page_cache.stats(), product_page_cache.stats(), geocache.stats()
+  return [
+    ("cache_requests_total", {"cache": "page", "result": "hit"}, page["hits"]),
+    ("cache_requests_total", {"cache": "page", "result": "miss"}, page["misses"]),
+    ("cache_requests_total", {"cache": "product_page", "result": "hit"}, product["hits"]),
+    ("cache_requests_total", {"cache": "product_page", "result": "miss"}, product["misses"]),
+    ("cache_requests_total", {"cache": "geocode", "result": "memory_hit"}, geo["memory_hits"]),
+    ("cache_requests_total", {"cache": "geocode", "result": "db_hit"}, geo["db_hits"]),
+    ("cache_requests_total", {"cache": "geocode", "result": "miss"}, geo["misses"]),
+  ]
+
+def create_app(database_url=None):
+  """
+  Inicializa o app para servir requisições (idempotente) e o retorna.
+  Não altera o esquema: use `flask --app app init-db` antes do primeiro deploy/atualização.
+  """
+  global search_backend, catalog, quote_table, reservation_sweeper, deletion_queue, _initialized
+  if _initialized:
+    return app
+  with _init_lock:
+    if _initialized:
+      return app
+    configure_logging()
+    init_engine(database_url)
+    # métricas: consultas SQL por rota e acertos dos caches (ver metrics_service.py)
+    metrics_service.instrument_engine(engine)
+    metrics_service.registry.register_collector(cache_metrics)
+    # cache de geocodificação: liga a tabela persistente e resolve o ponto de retirada uma única vez
+    geocache.bind(SessionLocal, CepGeocache)
+    resolve_pickup_coordinates()
+    # busca de produtos: tsvector/pg_trgm no PostgreSQL, índice invertido em memória nos demais
+    search_backend = create_search_backend(engine, SessionLocal, setup=False)
+    catalog = CatalogReplica(engine)
+    # tabela pré-calculada de fretes por prefixo de CEP (opcional; ver shipping_table.py)
+    quote_table = load_quote_table()
+    reservation_sweeper = ReservationSweeper(engine, on_release=bump_stock_version)
+    deletion_queue = DeletionQueue(engine)
+    _initialized = True
+  return app
+
+# nº de proxies reversos na frente do gunicorn (balanceador da hospedagem, nginx...): com ele,
+# request.remote_addr é o IP real do cliente (X-Forwarded-For), usado no limite de reservas.
+# 0 = gunicorn exposto direto (X-Forwarded-* ignorados: o cliente poderia forjá-los)
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
 
 app = Flask(__name__)
 app.secret_key = SECRET
+if TRUSTED_PROXY_HOPS > 0:
+  app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+# primeiro hook registrado: a latência medida inclui os demais before_request
+metrics_service.init_app(app)
+# perfilamento sob demanda (PROFILING_ENABLED); desligado, não registra hooks
+profiling_service.init_app(app)
+# /static com hash no nome e variantes .br/.gz pré-geradas (flask --app app build-assets)
+asset_service.init_app(app)
+# br/gzip das respostas dinâmicas, com nível por classe de rota (ver compression_service.py)
+compression_service.init_app(app)
+
+@app.before_request
+def ensure_initialized():
+  # `gunicorn app:app` / `flask run` sem create_app(): inicializa no primeiro request
+  if not _initialized:
+    create_app()
+
+@app.cli.command("init-db")
+def init_db_command():
+  """Cria/atualiza as tabelas, colunas, índices de busca e o admin inicial."""
+  init_db()
+  logger.info("Esquema do banco atualizado")
+
+@app.cli.command("build-assets")
+def build_assets_command():
+  """Minifica e versiona os arquivos de static/ em static/build/ (com .gz/.br) e grava o manifesto."""
+  configure_logging()
+  asset_service.build(app.static_folder)
+  # as páginas em cache apontam para os arquivos do build anterior
+  bump_catalog_generation()
+# /media (e /static) entregues pelo servidor web via X-Sendfile (Apache/lighttpd)
+app.config["USE_X_SENDFILE"] = MEDIA_SENDFILE == "x-sendfile"
+# `sizes` dos <img srcset> gerados a partir de ProductImage.srcset
+app.jinja_env.globals.update(CARD_IMAGE_SIZES=CARD_IMAGE_SIZES, DETAIL_IMAGE_SIZES=DETAIL_IMAGE_SIZES)
 
 # UPLOAD CONFIG (Desativado - agora usa Supabase Storage)
 # UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), "static", "images")
@@ -123,108 +391,43 @@ HOST = os.environ.get("FLASK_HOST", "0.0.0.0")
 PORT = int(os.environ.get("FLASK_PORT", "5000"))
 DEBUG = os.environ.get("FLASK_DEBUG", "true").lower() in ("1", "true", "yes")
 
+# frete: geocodificação assíncrona (o worker espera no máximo SHIPPING_WAIT_BUDGET segundos;
+# depois responde 202 e o cliente tenta de novo, já encontrando o CEP no cache)
+SHIPPING_ASYNC = os.environ.get("SHIPPING_ASYNC", "true").lower() in ("1", "true", "yes")
+SHIPPING_WAIT_BUDGET = float(os.environ.get("SHIPPING_WAIT_BUDGET", "0.3"))
+SHIPPING_RETRY_AFTER_MS = int(os.environ.get("SHIPPING_RETRY_AFTER_MS", "700"))
+
+def shipping_pending():
+  """Resposta 202: a geocodificação continua em segundo plano e o cliente tenta de novo."""
+  return jsonify({
+    'success': False,
+    'pending': True,
+    'retry_after_ms': SHIPPING_RETRY_AFTER_MS,
+    'shipping_cost': 0.0,
+    'distance_km': 0.0,
+    'message': 'Calculando frete...'
+  }), 202
+
+def get_pickup_coordinates_async():
+  """
+  Ponto de retirada sem consulta externa na thread da requisição: se falhou na inicialização,
+  nova tentativa pelo async_geocoder (mesmo orçamento de espera), com backoff entre falhas.
+  Retorna (lat, lon) ou None; levanta FutureTimeoutError se a consulta ainda está em andamento.
+  """
+  coords = get_pickup_coordinates(resolve=False)
+  if coords is not None or not pickup_retry_due():
+    return coords
+  coords = geocache.get(PICKUP_POINT_CEP)
+  if coords is None:
+    wait = 0 if async_geocoder.is_pending(PICKUP_POINT_CEP) else SHIPPING_WAIT_BUDGET
+    coords = async_geocoder.submit(PICKUP_POINT_CEP).result(timeout=wait)
+  return record_pickup_coordinates(coords)
+
 # rota simples para checagem de saúde (útil para debug rápido)
 @app.route("/health")
 def health():
     return "ok", 200
 
-# CONSTANTES DE FRETE
-PICKUP_POINT_CEP = "65606-530"  # Caxias
-COST_PER_KM = 0.1724  # R$ por km
-
-def get_cep_coordinates(cep):
-    """
-    Obtém latitude/longitude de um CEP usando a API ViaCEP + Nominatim.
-    Retorna tuple (lat, lon) ou None se não encontrar.
-    """
-    try:
-        cep_clean = cep.replace('-', '').replace(' ', '').strip()
-        if len(cep_clean) != 8 or not cep_clean.isdigit():
-            print(f"[warn] CEP inválido: {cep_clean}")
-            return None
-            
-        # Busca dados do CEP na ViaCEP
-        url = f"https://viacep.com.br/ws/{cep_clean}/json/"
-        resp = requests.get(url, timeout=5)
-        
-        if resp.status_code == 200:
-            data = resp.json()
-            if not data.get('erro'):
-                # ViaCEP retorna logradouro, localidade, uf
-                logradouro = data.get('logradouro', '')
-                localidade = data.get('localidade', '')
-                uf = data.get('uf', '')
-                
-                # Usa Nominatim para converter endereço em coordenadas
-                return get_coordinates_nominatim(logradouro, localidade, uf)
-            else:
-                print(f"[warn] CEP não encontrado: {cep_clean}")
-                return None
-        else:
-            print(f"[warn] ViaCEP retornou status {resp.status_code}")
-            return None
-    except Exception as e:
-        print(f"[warn] Erro ao buscar CEP {cep}: {e}")
-        return None
-
-def get_coordinates_nominatim(street, city, state):
-    """
-    Usa Nominatim (OpenStreetMap) para obter coordenadas a partir do endereço.
-    Retorna tuple (lat, lon) ou None se não encontrar.
-    """
-    try:
-        if not city:
-            print("[warn] Cidade não fornecida")
-            return None
-            
-        # Monta query para nominatim
-        addr = f"{city}, {state}, Brasil"
-        if street:
-            addr = f"{street}, {addr}"
-            
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': addr,
-            'format': 'json',
-            'limit': 1
-        }
-        headers = {'User-Agent': 'AM-Conceito-Fitness-Shop'}
-        
-        resp = requests.get(url, params=params, headers=headers, timeout=5)
-        
-        if resp.status_code == 200:
-            data = resp.json()
-            if data and len(data) > 0:
-                lat = float(data[0]['lat'])
-                lon = float(data[0]['lon'])
-                print(f"[info] Coordenadas encontradas: ({lat}, {lon}) para {addr}")
-                return (lat, lon)
-            else:
-                print(f"[warn] Nominatim não encontrou coordenadas para: {addr}")
-                return None
-        else:
-            print(f"[warn] Nominatim retornou status {resp.status_code}")
-            return None
-    except Exception as e:
-        print(f"[warn] Erro ao buscar coordenadas nominatim: {e}")
-        return None
-
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """
-    Calcula distância em km entre dois pontos (lat/lon) usando fórmula de Haversine.
-    """
-    R = 6371  # Raio da Terra em km
-    
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_lat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2
-    c = 2 * math.asin(math.sqrt(a))
-    
-    return R * c
-
 @app.route("/api/calculate-shipping", methods=["POST"])
 def calculate_shipping():
     """
@@ -237,7 +440,7 @@ def calculate_shipping():
         cep = (data.get('cep') or '').strip()
         method = (data.get('method') or 'delivery').strip()
         
-        print(f"[info] calculate_shipping chamado: CEP={cep}, method={method}")
+        logger.debug("calculate_shipping chamado: CEP=%s, method=%s", cep, method)
         
         # Se for retirar no ponto, frete é grátis
         if method == 'pickup':
@@ -257,9 +460,35 @@ def calculate_shipping():
                 'message': 'CEP inválido. Use formato: xxxxx-xxx'
             }), 400
         
-        # Obter coordenadas do CEP do cliente
-        print(f"[info] Buscando coordenadas do cliente para CEP {cep}...")
-        client_coords = get_cep_coordinates(cep)
+        # Caminho rápido: prefixo do CEP na tabela pré-calculada (sem chamadas externas)
+        quote = quote_table.lookup(cep) if quote_table else None
+        if quote:
+            distance_km, shipping_cost = quote
+            return jsonify({
+                'success': True,
+                'shipping_cost': round(shipping_cost, 2),
+                'distance_km': round(distance_km, 2),
+                'message': f'Chega entre entre 1 a 7 dias úteis.'
+            })
+
+        # Obter coordenadas do CEP do cliente (memória -> cep_geocache -> ViaCEP/Nominatim)
+        if SHIPPING_ASYNC:
+            client_coords = geocache.get(cep)
+            if client_coords is None:
+                # consulta externa no loop de fundo: o worker espera só um orçamento curto
+                # se a consulta já está em andamento (nova tentativa do cliente), não espera de novo;
+                # o erro de cache só conta quando uma consulta externa nova vai de fato sair
+                pending = async_geocoder.is_pending(cep)
+                wait = 0 if pending else SHIPPING_WAIT_BUDGET
+                if not pending and not async_geocoder.is_negative(cep):
+                    geocache.record_miss()
+                future = async_geocoder.submit(cep)
+                try:
+                    client_coords = future.result(timeout=wait)
+                except FutureTimeoutError:
+                    return shipping_pending()
+        else:
+            client_coords = geocache.lookup(cep)
         if not client_coords:
             return jsonify({
                 'success': False,
@@ -268,9 +497,14 @@ def calculate_shipping():
                 'message': 'CEP não encontrado. Tente outro.'
             }), 404
         
-        # Obter coordenadas do ponto de retirada
-        print(f"[info] Buscando coordenadas do ponto de retirada...")
-        pickup_coords = get_cep_coordinates(PICKUP_POINT_CEP)
+        # Coordenadas do ponto de retirada (resolvidas na inicialização)
+        if SHIPPING_ASYNC:
+            try:
+                pickup_coords = get_pickup_coordinates_async()
+            except FutureTimeoutError:
+                return shipping_pending()
+        else:
+            pickup_coords = get_pickup_coordinates()
         if not pickup_coords:
             return jsonify({
                 'success': False,
@@ -286,9 +520,9 @@ def calculate_shipping():
         )
         
         # Calcular custo
-        shipping_cost = (distance_km * COST_PER_KM) + 2
+        shipping_cost = shipping_cost_for_distance(distance_km)
         
-        print(f"[info] Frete calculado: {distance_km:.2f}km = R$ {shipping_cost:.2f}")
+        logger.debug("Frete calculado: %.2fkm = R$ %.2f", distance_km, shipping_cost)
         
         return jsonify({
             'success': True,
@@ -299,7 +533,7 @@ def calculate_shipping():
         })
     
     except Exception as e:
-        print(f"[error] Erro em calculate_shipping: {e}")
+        logger.exception("Erro em calculate_shipping: %s", e)
         return jsonify({
             'success': False,
             'shipping_cost': 0.0,
@@ -307,16 +541,51 @@ def calculate_shipping():
             'message': f'Erro ao calcular frete: {str(e)}'
         }), 500
 
-@app.route("/api/check-stock", methods=["POST"])
+# versão do estoque: muda a cada alteração de quantidade; ETags do /api/check-stock derivam dela
+STOCK_CHECK_MAX_IDS = 200
+STOCK_STREAM_ENABLED = os.environ.get("STOCK_STREAM_ENABLED", "false").lower() in ("1", "true", "yes")
+STOCK_STREAM_POLL_SECONDS = float(os.environ.get("STOCK_STREAM_POLL_SECONDS", "1"))
+STOCK_STREAM_MAX_SECONDS = float(os.environ.get("STOCK_STREAM_MAX_SECONDS", "30"))
+app.config["STOCK_STREAM_ENABLED"] = STOCK_STREAM_ENABLED
+
+def parse_variant_ids(values):
+  """Normaliza a lista de ids (aceita ints ou strings), sem duplicados e ordenada."""
+  ids = set()
+  for value in values or []:
+    try:
+      ids.add(int(value))
+    except (TypeError, ValueError):
+      continue
+  return sorted(ids)
+
+def load_stock_map(variant_ids):
+  """Quantidade por variante via Core (só id e quantity, sem entidades ORM); ausentes = 0."""
+  stmt = select(ProductStock.id, ProductStock.quantity).where(ProductStock.id.in_(variant_ids))
+  with engine.connect() as conn:
+    rows = conn.execute(stmt).all()
+  stock_map = {var_id: 0 for var_id in variant_ids}
+  for row in rows:
+    stock_map[row.id] = int(row.quantity or 0)
+  return stock_map
+
+def stock_etag(version, variant_ids):
+  digest = hashlib.sha1(",".join(map(str, variant_ids)).encode()).hexdigest()[:16]
+  return f"stock-{version}-{digest}"
+
+@app.route("/api/check-stock", methods=["GET", "POST"])
 def check_stock():
     """
     Verifica o estoque disponível para múltiplas variantes.
-    Recebe JSON: { "variant_ids": [1, 2, 3, ...] }
-    Retorna JSON: { "success": bool, "stock": { "variant_id": quantity, ... } }
+    GET  /api/check-stock?ids=1,2,3  (cacheável: ETag + If-None-Match -> 304)
+    POST JSON: { "variant_ids": [1, 2, 3, ...] }
+    Retorna JSON: { "success": bool, "stock": { "variant_id": quantity, ... }, "version": int|str }
     """
     try:
-        data = request.get_json() or {}
-        variant_ids = data.get('variant_ids', [])
+        if request.method == "GET":
+            variant_ids = parse_variant_ids((request.args.get('ids') or '').split(','))
+        else:
+            data = request.get_json(silent=True) or {}
+            variant_ids = parse_variant_ids(data.get('variant_ids', []))
         
         if not variant_ids:
             return jsonify({
@@ -324,80 +593,268 @@ def check_stock():
                 'stock': {},
                 'message': 'Nenhuma variante fornecida'
             }), 400
-        
-        with SessionLocal() as db:
-            # Buscar todas as variantes solicitadas
-            variants = db.query(ProductStock).filter(
-                ProductStock.id.in_(variant_ids)
-            ).all()
-            
-            # Montar mapa de id -> quantidade
-            stock_map = {}
-            for variant in variants:
-                stock_map[variant.id] = variant.quantity
-            
-            # Adicionar variantes não encontradas com quantidade 0
-            for var_id in variant_ids:
-                if var_id not in stock_map:
-                    stock_map[var_id] = 0
-            
-            print(f"[info] Stock check para {len(variant_ids)} variantes: {stock_map}")
-            
+        if len(variant_ids) > STOCK_CHECK_MAX_IDS:
             return jsonify({
+                'success': False,
+                'stock': {},
+                'message': f'Máximo de {STOCK_CHECK_MAX_IDS} variantes por consulta'
+            }), 400
+        
+        # quantidades do snapshot do catálogo; 304 se o estoque não mudou desde a última resposta
+        snapshot = catalog.get()
+        etag = stock_etag(snapshot.stock_tag, variant_ids)
+        # comparação fraca: a resposta comprimida vai com ETag fraco (W/"...")
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify({
                 'success': True,
-                'stock': stock_map
+                'stock': snapshot.stock_map(variant_ids),
+                'version': snapshot.stock_tag
             })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     
     except Exception as e:
-        print(f"[error] Erro em check_stock: {e}")
+        logger.exception("Erro em check_stock: %s", e)
         return jsonify({
             'success': False,
             'stock': {},
             'message': f'Erro ao verificar estoque: {str(e)}'
         }), 500
 
+@app.route("/api/stock-stream")
+def stock_stream():
+    """
+    Server-Sent Events com o estoque das variantes (?ids=1,2,3): envia o estado atual e,
+    a cada mudança da versão do estoque, o novo mapa. A conexão fecha após
+    STOCK_STREAM_MAX_SECONDS e o EventSource reconecta sozinho.
+    Desligado por padrão: cada conexão aberta ocupa um worker/thread (use com gthread).
+    """
+    if not STOCK_STREAM_ENABLED:
+        return jsonify({'success': False, 'message': 'Stream de estoque desativado'}), 404
+    variant_ids = parse_variant_ids((request.args.get('ids') or '').split(','))[:STOCK_CHECK_MAX_IDS]
+    if not variant_ids:
+        return jsonify({'success': False, 'message': 'Nenhuma variante fornecida'}), 400
+
+    def events():
+        last_version = None
+        deadline = time.monotonic() + STOCK_STREAM_MAX_SECONDS
+        yield f"retry: {int(STOCK_STREAM_POLL_SECONDS * 1000) + 1000}\n\n"
+        while time.monotonic() < deadline:
+            snapshot = catalog.get()
+            version = snapshot.stock_tag
+            if version != last_version:
+                # o snapshot só volta ao banco quando a versão do estoque muda
+                payload = json.dumps({'stock': snapshot.stock_map(variant_ids), 'version': version})
+                yield f"event: stock\nid: {version}\ndata: {payload}\n\n"
+                last_version = version
+            else:
+                yield ": keep-alive\n\n"
+            time.sleep(STOCK_STREAM_POLL_SECONDS)
+
+    return Response(events(), mimetype="text/event-stream", headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# reservas de estoque no checkout: baixa atômica (UPDATE condicional) com validade
+@app.before_request
+def start_background_workers():
+  reservation_sweeper.ensure_started()
+  deletion_queue.ensure_started()
+
+@app.route("/api/reservations", methods=["POST"])
+def create_reservation():
+    """
+    Reserva o estoque do carrinho (tudo ou nada) até vencer o TTL ou o admin confirmar o pagamento.
+    POST JSON: { "items": [ { "variant_id": 1, "quantity": 2 }, ... ] }
+    Retorna 201 { "success": true, "token": str, "expires_at": iso }, 409 se faltar estoque
+    ou 429 se este cliente já criou reservas demais na janela.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        reservation = reservation_service.reserve(engine, data.get('items'), client=request.remote_addr or "")
+    except RateLimited as e:
+        resp = jsonify({'success': False, 'message': str(e)})
+        resp.headers['Retry-After'] = str(e.retry_after)
+        return resp, 429
+    except InsufficientStock as e:
+        return jsonify({
+            'success': False,
+            'variant_id': e.variant_id,
+            'stock': load_stock_map([e.variant_id]),
+            'message': str(e)
+        }), 409
+    except ReservationError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    bump_stock_version()
+    return jsonify({
+        'success': True,
+        'token': reservation['token'],
+        'expires_at': reservation['expires_at'].isoformat() + 'Z',
+        'items': reservation['items']
+    }), 201
+
+@app.route("/api/reservations/<token>/release", methods=["POST"])
+def release_reservation(token):
+    """Cancela a reserva e devolve o estoque (idempotente)."""
+    released = reservation_service.release(engine, token)
+    if released:
+        bump_stock_version()
+    return jsonify({'success': True, 'released': released})
+
+# listagem paginada do catálogo (keyset): ordem (display_order da classificação, classificação, produto)
+PRODUCTS_API_DEFAULT_LIMIT = 24
+PRODUCTS_API_MAX_LIMIT = 100
+UNCATEGORIZED_ORDER = 2_000_000_000  # produtos sem classificação vão para o fim
+
+def encode_cursor(*values):
+  return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+  """Retorna a tupla do cursor ou None se ele for inválido."""
+  try:
+    values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    return tuple(int(v) for v in values) if len(values) == 3 else None
+  except (ValueError, TypeError):
+    return None
+
+@app.route("/api/products")
+def api_products():
+  """
+  Lista produtos em páginas com cursor (keyset pagination), com projeção compacta.
+  Query string: ?limit=24&cursor=<next_cursor da página anterior>&in_stock=1 (só produtos com estoque)
+  Retorna JSON: { "items": [ {id, name, price, discount_price, image_url, in_stock, classification}, ... ],
+                  "next_cursor": str | null }
+  """
+  limit = min(max(request.args.get("limit", PRODUCTS_API_DEFAULT_LIMIT, type=int), 1), PRODUCTS_API_MAX_LIMIT)
+  cursor = request.args.get("cursor")
+  after = decode_cursor(cursor) if cursor else None
+  if cursor and after is None:
+    return jsonify({"items": [], "next_cursor": None, "message": "Cursor inválido"}), 400
+
+  sort_order = func.coalesce(Classification.display_order, UNCATEGORIZED_ORDER)
+  sort_class = func.coalesce(Product.classification_id, 0)
+  first_image = (
+    select(ProductImage.image_url)
+    .where(ProductImage.product_id == Product.id)
+    .order_by(ProductImage.id)
+    .limit(1)
+    .scalar_subquery()
+  )
+  # total_stock é mantido pelo stock_service: filtro barato, sem subquery nas variações
+  in_stock = func.coalesce(Product.total_stock, 0) > 0
+  stmt = (
+    select(
+      Product.id, Product.name, Product.price, Product.discount_price,
+      Product.classification_id, Classification.name.label("classification_name"),
+      sort_order.label("sort_order"), sort_class.label("sort_class"),
+      first_image.label("image_url"), in_stock.label("in_stock"),
+    )
+    .outerjoin(Classification, Product.classification_id == Classification.id)
+    .order_by(sort_order, sort_class, Product.id)
+    .limit(limit + 1)
+  )
+  if request.args.get("in_stock") in ("1", "true"):
+    stmt = stmt.where(in_stock)
+  if after:
+    o, c, pid = after
+    stmt = stmt.where(or_(
+      sort_order > o,
+      and_(sort_order == o, sort_class > c),
+      and_(sort_order == o, sort_class == c, Product.id > pid),
+    ))
+
+  with SessionLocal() as db:
+    rows = db.execute(stmt).all()
+
+  has_more = len(rows) > limit
+  rows = rows[:limit]
+  items = [
+    {
+      "id": r.id,
+      "name": r.name,
+      "price": r.price,
+      "discount_price": r.discount_price,
+      "image_url": r.image_url,
+      "in_stock": bool(r.in_stock),
+      "classification": {"id": r.classification_id, "name": r.classification_name} if r.classification_id else None,
+    }
+    for r in rows
+  ]
+  next_cursor = encode_cursor(rows[-1].sort_order, rows[-1].sort_class, rows[-1].id) if has_more else None
+  return jsonify({"items": items, "next_cursor": next_cursor})
+
 # =========================================================================
 # ROTAS PÚBLICAS
 # =========================================================================
 
+def catalog_stmt():
+  """
+  SELECT de produtos com imagens, variações e classificação já carregadas.
+
+  As coleções usam selectinload (uma query extra por coleção, WHERE product_id IN (...))
+  em vez de joinedload, que devolvia uma linha por combinação imagem × variação.
+  """
+  return select(Product).options(
+    selectinload(Product.images),
+    selectinload(Product.stock_variants),
+    joinedload(Product.classification)
+  ).order_by(Product.id)
+
+def search_products(snapshot, q, page=1, per_page=SEARCH_PAGE_SIZE):
+  """
+  Busca ranqueada de produtos: o backend de busca devolve os ids da página e os
+  produtos vêm do snapshot do catálogo, preservando a ordem de relevância.
+  Retorna (produtos, SearchResults).
+  """
+  # a sessão só abre conexão se o backend consultar o banco (PostgreSQL)
+  with SessionLocal() as db:
+    results = search_backend.search(db, q, page=page, per_page=per_page)
+  products = snapshot.products
+  return [products[pid] for pid in results.ids if pid in products], results
+
+# buscas muito longas não entram no cache (evita encher o disco com chaves arbitrárias)
+PAGE_CACHE_MAX_QUERY_LEN = 64
+
 @app.route("/")
 def index():
   q = (request.args.get('q') or "").strip()
-  with SessionLocal() as db:
-    # Eager load de imagens e variações para uso direto nos templates
-    base_stmt = select(Product).options(
-      joinedload(Product.images),
-      joinedload(Product.stock_variants),
-      joinedload(Product.classification)
-    )
-    if q:
-      stmt = base_stmt.filter(Product.name.ilike(f"%{q}%"))
-    else:
-      stmt = base_stmt
-    products = db.scalars(stmt).unique().all()
-    classifications = db.scalars(select(Classification).order_by(Classification.display_order, Classification.name)).all()
-
-  # Agrupa produtos por classificação para exibição na home
-  grouped_products = []
-  for c in classifications:
-    classified = [p for p in products if p.classification and p.classification.id == c.id]
-    if classified:
-      grouped_products.append({"id": c.id, "name": c.name, "products": classified})
-
-  # Inclui produtos sem classificação explícita
-  uncategorized = [p for p in products if not p.classification]
-  if uncategorized:
-    grouped_products.append({"id": None, "name": "Outros", "products": uncategorized})
+  page = request.args.get('page', 1, type=int)
+  only_in_stock = request.args.get('in_stock') in ('1', 'true')
+  # cache da página renderizada, compartilhado entre workers e versionado pela geração do
+  # catálogo e pela versão do estoque (filtro "em estoque" e tamanhos disponíveis nos cards)
+  cacheable = len(q) <= PAGE_CACHE_MAX_QUERY_LEN
+  # q exato na chave: a página repete o termo como foi digitado (campo de busca, paginação)
+  cache_key = f"index?q={q}&page={page}&in_stock={int(only_in_stock)}"
+  generation = page_cache.version.get()
+  if cacheable:
+    cached = page_cache.get(cache_key, generation)
+    if cached is not None:
+      return Response(cached, mimetype="text/html")
+
+  search = None
+  snapshot = catalog.get()
+  if q:
+    # busca ranqueada (nome, descrição, categoria e classificação; sem acentos), paginada;
+    # os resultados ficam em um único grupo, na ordem de relevância
+    products, search = search_products(snapshot, q, page=page)
+    grouped_products = [Group(None, "Resultados da busca", tuple(products))] if products else []
+  else:
+    # grupos por classificação já montados no snapshot ("Outros" = sem classificação)
+    grouped_products = snapshot.groups_in_stock if only_in_stock else snapshot.groups
   brand = "Conforto, autocuidado e amor próprio!🌷🤍"
   insta = "@am_conceitofitness"
-  return render_template(
+  html = render_template(
     "index.html",
-    products=products,
     grouped_products=grouped_products,
     brand=brand,
     insta=insta,
-    q=q
+    q=q,
+    search=search
   )
+  if cacheable:
+    page_cache.set(cache_key, html, generation)
+  return html
 
 @app.route("/login", methods=["GET", "POST"])
 def login():
@@ -418,39 +875,86 @@ def login():
       return redirect(url_for("admin_dashboard"))
   return render_template("login.html")
 
+@app.route("/media/<path:key>")
+def media(key):
+  """
+  Imagens do armazenamento local (STORAGE_BACKEND=local). O nome é o hash do conteúdo,
+  então o arquivo nunca muda: cache imutável de 1 ano e ETag forte = hash; Range suportado.
+  Com MEDIA_SENDFILE, o envio dos bytes fica com o servidor web (X-Sendfile/X-Accel-Redirect).
+  """
+  if not MEDIA_KEY_RE.match(key):
+    abort(404)
+  path = local_storage.path_for_key(key)
+  if not os.path.isfile(path):
+    abort(404)
+  etag = posixpath.splitext(key.split("/")[1])[0]
+  if MEDIA_SENDFILE == "x-accel-redirect":
+    if etag in request.if_none_match:
+      response = Response(status=304)
+    else:
+      # nginx serve o arquivo (e trata Range) a partir da location interna
+      response = Response(mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream")
+      response.headers["X-Accel-Redirect"] = f"{MEDIA_ACCEL_PREFIX}/{key}"
+  else:
+    # send_file trata If-None-Match/If-Range/Range; com USE_X_SENDFILE, devolve X-Sendfile
+    response = send_file(path, conditional=True, etag=etag, max_age=MEDIA_MAX_AGE)
+  response.set_etag(etag)
+  response.cache_control.public = True
+  response.cache_control.max_age = MEDIA_MAX_AGE
+  response.cache_control.immutable = True
+  return response
+
+PRODUCT_PAGE_TEMPLATES = ("product_detail.html", "base.html")
+_product_template_digest = None
+
+def product_etag(product_id, revision):
+  """
+  ETag forte da página; inclui o hash dos templates e a versão dos assets (um deploy que
+  altera qualquer um deles muda o ETag e a chave no cache de páginas de produto).
+  """
+  global _product_template_digest
+  if _product_template_digest is None:
+    digest = hashlib.sha1()
+    for name in PRODUCT_PAGE_TEMPLATES:
+      digest.update(app.jinja_loader.get_source(app.jinja_env, name)[0].encode("utf-8"))
+    digest.update(asset_service.assets.version.encode("utf-8"))
+    _product_template_digest = digest.hexdigest()[:8]
+  return f"p{product_id}-r{revision}-{_product_template_digest}"
+
+def product_page_response(body, etag, updated_at, status=200):
+  # no-cache: navegador/proxy podem guardar, mas revalidam (o estoque da página muda)
+  response = Response(body, status=status, mimetype="text/html")
+  response.set_etag(etag)
+  if updated_at is not None:
+    response.last_modified = updated_at
+  response.cache_control.no_cache = True
+  return response
+
+def touch_product(db, product_id):
+  """Nova revisão da página do produto, na transação de `db` (invalida ETag e cache dela)."""
+  db.execute(
+    update(Product).where(Product.id == product_id)
+    .values(revision=Product.revision + 1, updated_at=datetime.utcnow())
+  )
+
 @app.route("/produto/<int:product_id>")
 def product_detail(product_id):
-  with SessionLocal() as db:
-    # Carrega o produto, as imagens E AS VARIAÇÕES DE ESTOQUE
-    stmt = select(Product).options(joinedload(Product.images), joinedload(Product.stock_variants)).filter_by(id=product_id)
-    product = db.scalar(stmt)
-    if not product:
-      return redirect(url_for('index'))
-
-    # Converte variações para estrutura simples para o JS/Template
-    variant_objs = product.stock_variants
-    variants = [
-      {"id": v.id, "size": v.size, "quantity": int(v.quantity or 0), "is_available": bool(v.is_available), "price": v.price}
-      for v in variant_objs
-    ]
-    # Filtra apenas tamanhos únicos que TÊM ALGUM ESTOQUE
-    available_variants = [v for v in variants if v["quantity"] > 0]
-    
-    sizes = sorted(list({v["size"] for v in available_variants}))
-    
-    # NOTE: Para o Jinja, agora você só verá tamanhos/cores que TÊM ESTOQUE inicial.
-
-    preco_original = product.price
-    preco_promocional = product.discount_price if product.discount_price is not None else product.price
-
-    return render_template(
-      "product_detail.html",
-      product=product,
-      preco_original=preco_original,
-      preco_promocional=preco_promocional,
-      variants=variants, # Envia TODAS as variantes para o JS
-      sizes=sizes
-    )
+  product = catalog.get().products.get(product_id)
+  if product is None:
+    return redirect(url_for('index'))
+  etag = product_etag(product_id, product.revision)
+  # revisita sem alteração no produto: 304 sem renderizar
+  if not is_resource_modified(request.environ, etag=etag, last_modified=product.updated_at):
+    return product_page_response(None, etag, product.updated_at, status=304)
+  cached = product_page_cache.get(product_id, etag)
+  if cached is not None:
+    return product_page_response(cached, etag, product.updated_at)
+
+  # modelo de leitura: tamanhos com estoque e preço efetivo já vêm calculados do snapshot
+  html = render_template("product_detail.html", product=product)
+  product_page_cache.set(product_id, etag, html)
+  return product_page_response(html, etag, product.updated_at)
+
 # =========================================================================
 # ROTAS ADMIN (adições)
 # =========================================================================
@@ -464,22 +968,113 @@ def admin_required(f):
     return f(*args, **kwargs)
   return wrapped
 
+def catalog_write(f):
+  """Rotas admin que alteram o catálogo: invalida o cache de páginas após a alteração."""
+  from functools import wraps
+  @wraps(f)
+  def wrapped(*args, **kwargs):
+    response = f(*args, **kwargs)
+    generation = bump_catalog_generation()
+    bump_stock_version()
+    search_backend.on_catalog_change(generation)
+    return response
+  return wrapped
+
 @app.route("/admin")
 @admin_required
 def admin_dashboard():
   q = (request.args.get('q') or "").strip()
-  with SessionLocal() as db:
-    # BUSCA: Carrega produtos e suas variações e imagens (eager load)
-    base_stmt = select(Product).options(joinedload(Product.stock_variants), joinedload(Product.images), joinedload(Product.classification))
-    if q:
-      stmt = base_stmt.filter(Product.name.ilike(f"%{q}%"))
-    else:
-      stmt = base_stmt
-    products = db.scalars(stmt).unique().all()
-    classifications = db.scalars(select(Classification).order_by(Classification.display_order, Classification.name)).all()
-  return render_template("admin.html", products=products, classifications=classifications, q=q)
+  # fresh: depois de uma alteração, o redirect para cá já mostra o catálogo atualizado
+  snapshot = catalog.get(fresh=True)
+  if q:
+    products, _ = search_products(snapshot, q, page=request.args.get('page', 1, type=int), per_page=ADMIN_SEARCH_PAGE_SIZE)
+  else:
+    products = snapshot.product_list
+  # seções por classificação numa passada só (o template não filtra a lista por seção)
+  products_by_classification = {}
+  for p in products:
+    products_by_classification.setdefault(p.classification_id, []).append(p)
+  return render_template(
+    "admin.html", products_by_classification=products_by_classification,
+    classifications=snapshot.classifications, q=q,
+  )
   # note: template admin.html agora recebe 'classifications' — abaixo ajustaremos template
 
+@app.route("/metrics")
+def metrics():
+  """Métricas no formato do Prometheus, somadas de todos os workers."""
+  if not metrics_service.METRICS_ENABLED:
+    abort(404)
+  # expõe latências por rota e contadores de estoque/chamadas externas: não é público por padrão
+  token = metrics_service.METRICS_TOKEN
+  authorized = (
+    metrics_service.METRICS_PUBLIC
+    or session.get("admin_logged")
+    or (token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"))
+  )
+  if not authorized:
+    abort(401)
+  return Response(metrics_service.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/admin/geocache/stats")
+@admin_required
+def admin_geocache_stats():
+  """Contadores do cache de CEP deste worker (acertos em memória/tabela e consultas externas)."""
+  return jsonify({**geocache.stats(), "async": async_geocoder.stats()})
+
+@app.route("/admin/cache/stats")
+@admin_required
+def admin_cache_stats():
+  """Contadores do cache de páginas deste worker, geração atual do catálogo e estado do snapshot."""
+  return jsonify({**page_cache.stats(), "product_pages": product_page_cache.stats(), "catalog_snapshot": catalog.stats()})
+
+@app.route("/admin/profiles")
+@admin_required
+def admin_profiles():
+  """Perfis de requests gravados recentemente (todos os workers) e o liga/desliga da sessão."""
+  return render_template(
+    "admin_profiles.html",
+    profiles=profiling_service.list_profiles(),
+    enabled=profiling_service.PROFILING_ENABLED,
+    session_mode=session.get(profiling_service.SESSION_KEY),
+    modes=profiling_service.MODES,
+    profile=None,
+  )
+
+@app.route("/admin/profiles/toggle", methods=["POST"])
+@admin_required
+def admin_profiles_toggle():
+  mode = request.form.get("mode")
+  if mode in profiling_service.MODES:
+    session[profiling_service.SESSION_KEY] = mode
+  else:
+    session.pop(profiling_service.SESSION_KEY, None)
+  return redirect(url_for("admin_profiles"))
+
+@app.route("/admin/profiles/<profile_id>")
+@admin_required
+def admin_profile_detail(profile_id):
+  profile = profiling_service.load_profile(profile_id)
+  if profile is None:
+    abort(404)
+  return render_template(
+    "admin_profiles.html",
+    profiles=[],
+    enabled=profiling_service.PROFILING_ENABLED,
+    session_mode=session.get(profiling_service.SESSION_KEY),
+    modes=profiling_service.MODES,
+    profile=profile,
+  )
+
+@app.route("/admin/profiles/<profile_id>/raw")
+@admin_required
+def admin_profile_raw(profile_id):
+  """Arquivo bruto: .prof (python -m pstats / snakeviz) ou .folded (flamegraph.pl / speedscope)."""
+  path = profiling_service.raw_profile_path(profile_id)
+  if path is None:
+    abort(404)
+  return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
 @app.route("/admin/home")
 @admin_required
 def admin_home():
@@ -488,6 +1083,7 @@ def admin_home():
 
 @app.route("/admin/classification/add", methods=["POST"])
 @admin_required
+@catalog_write
 def admin_add_classification():
   name = request.form.get("name")
   if not name:
@@ -509,7 +1105,7 @@ def admin_add_classification():
 
 def save_uploaded_images(files, product_name="produto", existing_count=0):
   """
-  Faz upload de múltiplas imagens para o Supabase Storage.
+  Faz upload de múltiplas imagens para o armazenamento ativo (storage_service), em paralelo.
   Renomeia as imagens com base no nome do produto + timestamp único.
   
   Args:
@@ -517,15 +1113,17 @@ def save_uploaded_images(files, product_name="produto", existing_count=0):
     product_name: Nome do produto (usado para renomear)
     existing_count: Número de imagens já existentes (não usado, mantido por compatibilidade)
   
-  Retorna lista de URLs públicas das imagens.
+  Cada imagem é publicada sem metadados (EXIF/GPS; image_service) e ganha derivados WebP
+  redimensionados, enviados no mesmo lote que os originais. Arquivos que não são imagens
+  válidas não são enviados (resultado com erro).
+  
+  Retorna lista de (UploadResult, srcset) — um por arquivo, na ordem enviada;
+  UploadResult tem .ok, .url, .filename, .error e srcset é None sem derivados.
   """
   import re
-  import uuid
   from pathlib import Path
   from datetime import datetime
   
-  saved_urls = []
-  
   # Normaliza o nome do produto (remove caracteres especiais, espaços -> underscores)
   normalized_name = re.sub(r'[^\w\s-]', '', product_name.lower())
   normalized_name = re.sub(r'[-\s]+', '_', normalized_name)
@@ -534,6 +1132,7 @@ def save_uploaded_images(files, product_name="produto", existing_count=0):
   # Gera timestamp único para este batch de uploads
   timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
   
+  uploads = []
   for idx, f in enumerate(files, start=1):
     if not f or not f.filename:
       continue
@@ -546,19 +1145,33 @@ def save_uploaded_images(files, product_name="produto", existing_count=0):
     # Gera novo nome com timestamp: produto_20251211_143022_01.jpg
     # Isso garante unicidade mesmo após exclusões
     new_filename = f"{normalized_name}_{timestamp}_{idx:02d}{original_ext}"
-    
-    # Upload para Supabase Storage com nome customizado
-    public_url = upload_file_to_supabase(f, folder_path="products", custom_filename=new_filename)
-    
-    if public_url:
-      saved_urls.append(public_url)
-    else:
-      print(f"[warning] Falha ao fazer upload de {f.filename}")
+    uploads.append((f, f"products/{new_filename}"))
   
-  return saved_urls
+  # Originais sem metadados e derivados gerados em paralelo; tudo sobe num único lote para o
+  # backend de armazenamento ativo (Supabase: envios simultâneos em streaming; local: por conteúdo)
+  processed = process_uploads_batch(uploads)
+  batch = [(original, path) for original, path, _ in processed if original is not None]
+  for _, _, derived in processed:
+    batch.extend((d.file, d.path) for d in derived)
+  results = iter(storage.upload_many(batch))
+  
+  # resultados vêm na ordem do lote: primeiro os originais, depois os derivados de cada um
+  originals = [
+    next(results) if original is not None
+    else UploadResult(f.filename, path, None, "arquivo não é uma imagem válida", 0.0)
+    for (f, _), (original, path, _) in zip(uploads, processed)
+  ]
+  saved = []
+  for result, (_, _, derived) in zip(originals, processed):
+    derived_results = [next(results) for _ in derived]
+    uploaded_derivatives = [(d.width, r.url) for d, r in zip(derived, derived_results) if r.ok]
+    srcset = format_srcset(uploaded_derivatives) if result.ok and uploaded_derivatives else None
+    saved.append((result, srcset))
+  return saved
 
 @app.route("/admin/add", methods=["POST"])
 @admin_required
+@catalog_write
 def admin_add():
   name = request.form.get("name")
   description = request.form.get("description")
@@ -584,23 +1197,29 @@ def admin_add():
     )
     db.add(p)
     db.commit()
+    search_backend.reindex_product(db, p.id)
     
     # salvar imagens no Supabase e criar ProductImage com URLs
     if uploaded and uploaded[0].filename:
       # Passa o nome do produto para renomeação inteligente
-      saved_urls = save_uploaded_images(uploaded, product_name=name, existing_count=0)
+      results = save_uploaded_images(uploaded, product_name=name, existing_count=0)
+      saved_urls = [r.url for r, _ in results if r.ok]
+      failed = [r.filename for r, _ in results if not r.ok]
       
-      # Verificar se houve erro no upload
-      if not saved_urls and len(uploaded) > 0:
+      for r, srcset in results:
+        if r.ok:
+          db.add(ProductImage(product_id=p.id, image_url=r.url, srcset=srcset))
+      touch_product(db, p.id)
+      db.commit()
+      # Verificar se houve erro no upload (relatório por arquivo)
+      if failed and not saved_urls:
         flash(f"Produto '{name}' adicionado, mas houve erro ao fazer upload das imagens. ⚠️", "warning")
+      elif failed:
+        flash(f"Produto '{name}' adicionado. {len(saved_urls)} imagem(ns) enviada(s); falha em: {', '.join(failed)} ⚠️", "warning")
+      elif saved_urls:
+        flash(f"Produto '{name}' adicionado com sucesso. {len(saved_urls)} imagem(ns) enviada(s).")
       else:
-        for url in saved_urls:
-          db.add(ProductImage(product_id=p.id, image_url=url))
-        db.commit()
-        if saved_urls:
-          flash(f"Produto '{name}' adicionado com sucesso. {len(saved_urls)} imagem(ns) enviada(s).")
-        else:
-          flash(f"Produto '{name}' adicionado com sucesso.")
+        flash(f"Produto '{name}' adicionado com sucesso.")
     else:
       flash(f"Produto '{name}' adicionado com sucesso. Adicione variações de estoque.")
     
@@ -608,6 +1227,7 @@ def admin_add():
 
 @app.route("/admin/edit/<int:pid>", methods=["POST"])
 @admin_required
+@catalog_write
 def admin_edit(pid):
   with SessionLocal() as db:
     p = db.get(Product, pid)
@@ -637,32 +1257,40 @@ def admin_edit(pid):
     if uploaded and uploaded[0].filename:  # Se há arquivos para upload
       # Conta quantas imagens já existem para incrementar corretamente
       existing_images_count = len(p.images)
-      saved_urls = save_uploaded_images(uploaded, product_name=p.name, existing_count=existing_images_count)
+      results = save_uploaded_images(uploaded, product_name=p.name, existing_count=existing_images_count)
+      saved_urls = [r.url for r, _ in results if r.ok]
+      failed = [r.filename for r, _ in results if not r.ok]
       
-      # Verificar se houve erro no upload
-      if not saved_urls and len(uploaded) > 0:
+      for r, srcset in results:
+        if r.ok:
+          db.add(ProductImage(product_id=p.id, image_url=r.url, srcset=srcset))
+      # Verificar se houve erro no upload (relatório por arquivo)
+      if failed and not saved_urls:
         upload_errors.append("⚠️ Erro ao fazer upload de imagens. Verifique sua conexão com a internet.")
         flash("Produto atualizado, mas houve erro ao fazer upload das imagens.", "warning")
+      elif failed:
+        flash(f"Produto atualizado. {len(saved_urls)} imagem(ns) adicionada(s); falha em: {', '.join(failed)} ⚠️", "warning")
+      elif saved_urls:
+        flash(f"Produto atualizado. {len(saved_urls)} imagem(ns) adicionada(s).")
       else:
-        for url in saved_urls:
-          db.add(ProductImage(product_id=p.id, image_url=url))
-        if saved_urls:
-          flash(f"Produto atualizado. {len(saved_urls)} imagem(ns) adicionada(s).")
-        else:
-          flash("Produto atualizado.")
+        flash("Produto atualizado.")
     else:
       flash("Produto atualizado.")
     
+    touch_product(db, pid)
     db.commit()
+    search_backend.reindex_product(db, pid)
   
   return redirect(url_for("admin_dashboard"))
 
 @app.route("/admin/edit_stock/<int:pid>", methods=["POST"])
 @admin_required
+@catalog_write
 def admin_edit_stock(pid):
   with SessionLocal() as db:
     # Carrega variantes do produto
     variants = db.scalars(select(ProductStock).filter_by(product_id=pid)).all()
+    conn = db.connection()
     for variant in variants:
       qty_field = f"qty_{variant.id}"
       price_field = f"price_{variant.id}"
@@ -675,7 +1303,8 @@ def admin_edit_stock(pid):
           new_quantity = int(new_quantity_str)
         except ValueError:
           new_quantity = variant.quantity or 0
-        variant.quantity = new_quantity
+        # quantidade e total_stock do produto mudam juntos (delta, na mesma transação)
+        stock_service.set_quantity(conn, variant.id, new_quantity)
         # força disponibilidade baseada na quantidade
         variant.is_available = False if new_quantity == 0 else bool(is_available_checked)
       if new_price_str is not None:
@@ -685,12 +1314,8 @@ def admin_edit_stock(pid):
         except ValueError:
           pass
 
-    # Atualiza total_stock do produto
-    product = db.get(Product, pid)
-    if product:
-      total = sum((v.quantity or 0) for v in product.stock_variants)
-      product.total_stock = total
-
+    # preço/disponibilidade das variantes também aparecem na página do produto
+    touch_product(db, pid)
     db.commit()
   flash("Estoque atualizado com sucesso!")
   return redirect(url_for("admin_dashboard"))
@@ -698,6 +1323,7 @@ def admin_edit_stock(pid):
 
 @app.route("/admin/add_variant/<int:pid>", methods=["POST"])
 @admin_required
+@catalog_write
 def admin_add_variant(pid):
   size = (request.form.get("size") or "").strip()
   try:
@@ -722,29 +1348,27 @@ def admin_add_variant(pid):
       flash("Variação de tamanho já existe!")
       return redirect(url_for("admin_dashboard"))
 
-    new_variant = ProductStock(
-      product_id=pid,
-      size=size,
-      color="Único",
-      quantity=quantity,
-      is_available=(quantity > 0),
-      price=price_val
-    )
-    db.add(new_variant)
-
-    # Atualiza total_stock do produto pai
-    product = db.get(Product, pid)
-    if product:
-      product.total_stock = (product.total_stock or 0) + quantity
-
+    # cria a variação e soma a quantidade ao total_stock do produto pai
+    stock_service.add_variant(db.connection(), pid, size, quantity=quantity, color="Único", price=price_val)
     db.commit()
   flash(f"Variação tamanho {size} adicionada com sucesso.")
   return redirect(url_for("admin_dashboard"))
 
 
-# Remover imagem específica (Supabase Storage + registro DB)
+def enqueue_image_deletions(db, images):
+  """
+  Enfileira na outbox (mesma transação de `db`) o original e os derivados das `images`
+  que nenhuma outra imagem usa (no armazenamento local, fotos iguais compartilham o arquivo).
+  Chame deletion_queue.kick() depois do commit.
+  """
+  conn = db.connection()
+  urls = [url for img in images for url in img.storage_urls()]
+  deletion_service.enqueue(conn, deletion_service.unreferenced_urls(conn, [img.id for img in images], urls))
+
+# Remover imagem específica (Storage + registro DB)
 @app.route("/admin/remove_image/<int:image_id>", methods=["POST"])
 @admin_required
+@catalog_write
 def admin_remove_image(image_id):
     with SessionLocal() as db:
         img = db.get(ProductImage, image_id)
@@ -752,44 +1376,45 @@ def admin_remove_image(image_id):
             flash("Imagem não encontrada")
             return redirect(url_for("admin_dashboard"))
         
-        # Remove do Supabase Storage usando a URL pública
-        delete_success = delete_file_from_supabase(img.image_url)
-        
-        if not delete_success:
-            print(f"[warn] Falha ao deletar imagem do Supabase: {img.image_url}")
-        
-        # Remove registro do banco de dados
+        # Original + derivados vão para a outbox na mesma transação que remove o registro
+        enqueue_image_deletions(db, [img])
+        touch_product(db, img.product_id)
         db.delete(img)
         db.commit()
+    # Storage só é tocado depois do commit, em segundo plano e em lote
+    deletion_queue.kick()
     
     flash("Imagem removida com sucesso.")
     return redirect(url_for("admin_dashboard"))
 
 @app.route("/admin/delete/<int:pid>", methods=["POST"])
 @admin_required
+@catalog_write
 def admin_delete(pid):
-    """Deleta um produto completamente (imagens do Supabase, variações e dados)"""
+    """Deleta um produto completamente (imagens do Storage, variações e dados)"""
     with SessionLocal() as db:
         product = db.get(Product, pid)
         if not product:
             flash("Produto não encontrado")
             return redirect(url_for("admin_dashboard"))
         
-        # Remove imagens do Supabase Storage
-        for img in product.images:
-            delete_success = delete_file_from_supabase(img.image_url)
-            if not delete_success:
-                print(f"[warn] Falha ao deletar imagem do Supabase: {img.image_url}")
+        # Imagens vão para a outbox na mesma transação que remove o produto
+        enqueue_image_deletions(db, product.images)
         
         # Remove produto (cascata remove imagens e variações do DB)
         db.delete(product)
         db.commit()
+        search_backend.remove_product(pid)
+    product_page_cache.discard(pid)
+    # Storage só é tocado depois do commit, em segundo plano e em lote
+    deletion_queue.kick()
     
     flash(f"Produto '{product.name}' deletado com sucesso!")
     return redirect(url_for("admin_dashboard"))
 
 @app.route("/admin/delete_variant/<int:variant_id>", methods=["POST"])
 @admin_required
+@catalog_write
 def admin_delete_variant(variant_id):
     """Deleta uma variação de um produto"""
     with SessionLocal() as db:
@@ -798,8 +1423,8 @@ def admin_delete_variant(variant_id):
             flash("Variação não encontrada")
             return redirect(url_for("admin_dashboard"))
         
-        product_id = variant.product_id
-        db.delete(variant)
+        # remove a variação e subtrai a quantidade do total_stock do produto
+        stock_service.delete_variant(db.connection(), variant_id)
         db.commit()
     
     flash("Variação deletada com sucesso!")
@@ -807,6 +1432,7 @@ def admin_delete_variant(variant_id):
 
 @app.route("/admin/delete_classification/<int:class_id>", methods=["POST"])
 @admin_required
+@catalog_write
 def admin_delete_classification(class_id):
     """Deleta uma classificação (se não tiver produtos)"""
     with SessionLocal() as db:
@@ -830,6 +1456,7 @@ def admin_delete_classification(class_id):
 
 @app.route("/admin/reorder_classifications", methods=["POST"])
 @admin_required
+@catalog_write
 def admin_reorder_classifications():
   """Atualiza display_order das classificações a partir do formulário."""
   with SessionLocal() as db:
@@ -847,6 +1474,24 @@ def admin_reorder_classifications():
   flash("Ordem das classificações atualizada")
   return redirect(url_for("admin_dashboard"))
 
+@app.route("/admin/reservations/confirm", methods=["POST"])
+@admin_required
+def admin_confirm_reservation():
+  """Marca o pedido do WhatsApp como pago: torna definitiva a reserva com o código informado."""
+  code = request.form.get("code", "").strip()
+  try:
+    confirmed = reservation_service.confirm_by_code(engine, code)
+  except InsufficientStock as e:
+    flash(f"Reserva '{code}' venceu e a variante {e.variant_id} não tem mais {e.requested} unidade(s) em estoque; ajuste o pedido.", "warning")
+    return redirect(url_for("admin_dashboard"))
+  if confirmed:
+    # reserva vencida reaberta: o estoque baixou de novo
+    bump_stock_version()
+    flash(f"Pedido {code.upper()} marcado como pago; reserva confirmada.")
+  else:
+    flash(f"Reserva '{code}' não encontrada ou já confirmada.", "warning")
+  return redirect(url_for("admin_dashboard"))
+
 @app.route("/logout")
 def logout():
   session.pop("admin_logged", None)
@@ -860,10 +1505,17 @@ def cart():
 
 @app.route("/checkout")
 def checkout():
-  # Página de checkout/entrega/pagamento
-  return render_template("checkout.html")
+  # Página de checkout/entrega/pagamento (limites da reserva: avisados antes de enviar)
+  return render_template(
+    "checkout.html",
+    max_quantity=reservation_service.RESERVATION_MAX_QUANTITY,
+    max_units=reservation_service.RESERVATION_MAX_UNITS,
+  )
 
 
 if __name__ == "__main__":
-  print(f"[startup] Iniciando app em http://{HOST}:{PORT}  (DEBUG={DEBUG})")
+  # desenvolvimento: garante o esquema antes de subir (em produção: flask --app app init-db)
+  init_db()
+  create_app()
+  logger.info("Iniciando app em http://%s:%s  (DEBUG=%s)", HOST, PORT, DEBUG)
   app.run(host=HOST, port=PORT, debug=DEBUG)
\ No newline at end of file
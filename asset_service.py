@@ -0,0 +1,291 @@
+"""
+Arquivos estáticos versionados pelo conteúdo, minificados e pré-comprimidos.
+
+Build (uma vez por deploy, antes de subir o gunicorn; ver start.sh):
+
+    flask --app app build-assets
+
+copia cada arquivo de static/ para static/build/ com o hash do conteúdo no nome
+(css/style.css -> build/css/style.<hash>.css), minificando CSS/JS e gravando ao lado
+as versões .gz e .br (brotli, se o módulo estiver instalado) dos arquivos de texto.
+static/build/manifest.json liga o nome lógico ao arquivo gerado.
+
+No app:
+  * url_for('static', filename='css/style.css') resolve pelo manifesto e devolve a URL
+    com hash (hook url_defaults: vale para templates e código Python);
+  * /static/build/... é servido com Cache-Control: public, max-age=1 ano, immutable e,
+    conforme o Accept-Encoding, a variante .br/.gz já comprimida (Vary: Accept-Encoding);
+  * nomes sem hash (ex.: '/static/images/' + arquivo no cart.js) continuam servidos como antes.
+
+Sem manifesto (desenvolvimento, build não executado) ou com STATIC_BUILD_ENABLED=0,
+url_for devolve os arquivos originais. Builds anteriores não são apagados: páginas em
+cache que ainda apontam para eles continuam funcionando durante o deploy.
+
+Minificação: rcssmin/rjsmin (requirements.txt). Se faltarem, o build avisa (WARNING), o CSS
+passa por um minificador simples (comentários e espaços) e o JS é copiado como está.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só há .gz
+    brotli = None
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+BUILD_PREFIX = "build"
+MANIFEST_NAME = "manifest.json"
+STATIC_BUILD_ENABLED = os.environ.get("STATIC_BUILD_ENABLED", "true").lower() in ("1", "true", "yes")
+ASSET_MAX_AGE = 365 * 24 * 3600
+HASH_LENGTH = 12
+# tipos que valem a pena comprimir (imagens raster já são comprimidas)
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".xml", ".html", ".map")
+# ordem de preferência quando o cliente aceita as duas com a mesma qualidade
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_CSS_TOKEN_RE = re.compile(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')|/\*.*?\*/", re.S)
+_CSS_URL_RE = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+
+
+# =========================================================================
+# BUILD
+# =========================================================================
+
+def _squeeze_css(chunk):
+    chunk = re.sub(r"\s+", " ", chunk)
+    chunk = re.sub(r" ?([{};,]) ?", r"\1", chunk)
+    return chunk.replace(";}", "}")
+
+
+def minify_css(text):
+    """Remove comentários e espaços supérfluos (strings entre aspas preservadas)."""
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    # comentários caem; o texto entre strings é comprimido de uma vez (sem sobrar espaço onde havia comentário)
+    out, pending, pos = [], [], 0
+    for m in _CSS_TOKEN_RE.finditer(text):
+        pending.append(text[pos:m.start()])
+        if m.group(1):
+            out.append(_squeeze_css("".join(pending)))
+            out.append(m.group(1))
+            pending = []
+        pos = m.end()
+    pending.append(text[pos:])
+    out.append(_squeeze_css("".join(pending)))
+    return "".join(out).strip()
+
+
+def minify_js(text):
+    # sem rjsmin, não arrisca: template literals e regex tornam a minificação ingênua insegura
+    return rjsmin.jsmin(text) if rjsmin is not None else text
+
+
+def _rewrite_css_urls(text, logical_name, assets):
+    """url(...) relativos do CSS apontando para os arquivos com hash (relativos ao CSS gerado)."""
+    base = posixpath.dirname(logical_name)
+
+    def replace(m):
+        ref = m.group(2)
+        if ref.startswith(("data:", "http:", "https:", "//", "#")):
+            return m.group(0)
+        path, _, suffix = ref.partition("?")
+        target = posixpath.normpath(posixpath.join(base, path)) if not path.startswith("/") else path.lstrip("/")
+        if target.startswith("static/"):
+            target = target[len("static/"):]
+        entry = assets.get(target)
+        if entry is None:
+            return m.group(0)
+        built = posixpath.relpath(entry["path"], posixpath.dirname(f"{BUILD_PREFIX}/{logical_name}"))
+        return f"url({m.group(1)}{built}{'?' + suffix if suffix else ''}{m.group(1)})"
+
+    return _CSS_URL_RE.sub(replace, text)
+
+
+def _write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.chmod(tmp, 0o644)  # mkstemp cria 0600; o servidor web também lê static/build
+    os.replace(tmp, path)
+
+
+def _compress(path, data):
+    """Grava .gz/.br ao lado do arquivo se ficarem menores; devolve as codificações gravadas."""
+    encodings = []
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=11)
+    for encoding, suffix in ENCODINGS:
+        compressed = variants.get(encoding)
+        if compressed is not None and len(compressed) < len(data):
+            _write_atomic(path + suffix, compressed)
+            encodings.append(encoding)
+    return encodings
+
+
+def _source_files(static_dir):
+    build_dir = os.path.join(static_dir, BUILD_PREFIX)
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(build_dir):
+            dirs[:] = []
+            continue
+        dirs.sort()
+        for name in sorted(files):
+            if not name.startswith("."):
+                yield os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/")
+
+
+def build(static_dir=STATIC_DIR):
+    """
+    Gera static/build/ e o manifesto. Idempotente: arquivos com o mesmo conteúdo geram o
+    mesmo nome. Retorna o manifesto.
+    """
+    build_dir = os.path.join(static_dir, BUILD_PREFIX)
+    os.makedirs(build_dir, exist_ok=True)
+    names = list(_source_files(static_dir))
+    # CSS por último: url(...) dentro dele são reescritos para os arquivos já gerados
+    names.sort(key=lambda name: name.endswith(".css"))
+    assets = {}
+    source_bytes = built_bytes = 0
+    for name in names:
+        with open(os.path.join(static_dir, name), "rb") as f:
+            data = f.read()
+        source_bytes += len(data)
+        ext = posixpath.splitext(name)[1].lower()
+        if ext == ".css":
+            data = minify_css(_rewrite_css_urls(data.decode("utf-8"), name, assets)).encode("utf-8")
+        elif ext == ".js":
+            data = minify_js(data.decode("utf-8")).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        stem, _ = posixpath.splitext(name)
+        built_name = f"{BUILD_PREFIX}/{stem}.{digest}{ext}"
+        path = os.path.join(static_dir, *built_name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        encodings = _compress(path, data) if ext in COMPRESSIBLE_EXTENSIONS else []
+        assets[name] = {"path": built_name, "size": len(data), "encodings": encodings}
+        built_bytes += len(data)
+
+    version = hashlib.sha256(json.dumps(assets, sort_keys=True).encode()).hexdigest()[:HASH_LENGTH]
+    manifest = {"version": version, "assets": assets}
+    _write_atomic(os.path.join(build_dir, MANIFEST_NAME), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    logger.info("Assets: %d arquivo(s), %d -> %d bytes (versão %s)", len(assets), source_bytes, built_bytes, version)
+    missing = [name for name, module in (("brotli", brotli), ("rjsmin", rjsmin), ("rcssmin", rcssmin)) if module is None]
+    if missing:
+        # estão no requirements.txt: faltar aqui é ambiente incompleto (sem .br ou sem minificação)
+        logger.warning("Build de assets sem %s (pip install -r requirements.txt)", ", ".join(missing))
+    return manifest
+
+
+# =========================================================================
+# APP
+# =========================================================================
+
+class AssetManifest:
+    """Manifesto do último build, lido uma vez por processo (o build roda antes do gunicorn)."""
+
+    def __init__(self, static_dir=STATIC_DIR, enabled=STATIC_BUILD_ENABLED):
+        self.static_dir = static_dir
+        self.enabled = enabled
+        self._assets = None
+        self._built = None
+        self._version = ""
+
+    def _load(self):
+        assets, built = {}, {}
+        if self.enabled:
+            try:
+                with open(os.path.join(self.static_dir, BUILD_PREFIX, MANIFEST_NAME), encoding="utf-8") as f:
+                    manifest = json.load(f)
+                assets = {name: entry["path"] for name, entry in manifest["assets"].items()}
+                built = {entry["path"]: tuple(entry["encodings"]) for entry in manifest["assets"].values()}
+                self._version = manifest["version"]
+            except FileNotFoundError:
+                logger.info("Sem %s/%s: arquivos estáticos servidos sem hash", BUILD_PREFIX, MANIFEST_NAME)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Manifesto de assets inválido (%s): arquivos estáticos servidos sem hash", e)
+        self._assets, self._built = assets, built
+
+    @property
+    def version(self):
+        """Versão do build em uso ("" sem manifesto)."""
+        if self._assets is None:
+            self._load()
+        return self._version
+
+    def resolve(self, filename):
+        """Caminho (relativo a static/) do arquivo com hash; o próprio nome se não houver."""
+        if self._assets is None:
+            self._load()
+        return self._assets.get(filename, filename)
+
+    def encodings(self, built_name):
+        """Codificações pré-comprimidas de um arquivo de build (builds antigos: consulta o disco)."""
+        if self._built is None:
+            self._load()
+        known = self._built.get(built_name)
+        if known is not None:
+            return known
+        path = os.path.join(self.static_dir, *built_name.split("/"))
+        return tuple(encoding for encoding, suffix in ENCODINGS if os.path.isfile(path + suffix))
+
+    def stats(self):
+        if self._assets is None:
+            self._load()
+        return {"enabled": self.enabled, "version": self.version, "assets": len(self._assets)}
+
+
+assets = AssetManifest()
+
+
+def init_app(app):
+    """url_for('static', ...) pelo manifesto e rota /static com as variantes pré-comprimidas."""
+    from flask import request, send_from_directory
+
+    manifest = assets
+
+    @app.url_defaults
+    def _fingerprint_static(endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            values["filename"] = manifest.resolve(values["filename"])
+
+    def static(filename):
+        if not filename.startswith(BUILD_PREFIX + "/") or filename.endswith("/" + MANIFEST_NAME):
+            return app.send_static_file(filename)
+        available = manifest.encodings(filename)
+        encoding = request.accept_encodings.best_match([e for e, _ in ENCODINGS if e in available]) if available else None
+        suffix = dict(ENCODINGS)[encoding] if encoding else ""
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        # o nome tem o hash do conteúdo: nunca muda, cache imutável de 1 ano
+        response = send_from_directory(
+            app.static_folder, filename + suffix, mimetype=mimetype, conditional=True, max_age=ASSET_MAX_AGE,
+        )
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if available:
+            response.vary.add("Accept-Encoding")
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions["static"] = static
+    return manifest
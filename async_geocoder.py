@@ -0,0 +1,195 @@
+"""
+Cliente assíncrono de geocodificação (ViaCEP + Nominatim).
+
+Roda um event loop asyncio em uma thread daemon por worker, com uma sessão HTTP
+(httpx.AsyncClient) com keep-alive compartilhada, coalescência de consultas
+(buscas simultâneas pelo mesmo CEP dividem uma única chamada externa) e um limite
+de concorrência para não estourar o rate limit do Nominatim.
+
+As rotas síncronas usam `submit(cep)`, que devolve um concurrent.futures.Future:
+a rota espera no máximo um orçamento curto e, se a consulta ainda não terminou,
+responde "pendente" enquanto o resultado continua sendo resolvido em segundo plano
+e gravado no cache de CEPs.
+
+Resultados negativos (CEP inexistente ou falha do ViaCEP/Nominatim) não vão para o cache
+de CEPs, mas ficam GEOCODER_NEGATIVE_TTL segundos em memória: as novas tentativas do
+cliente (202 -> retry) recebem o 404 sem repetir a consulta externa.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import httpx
+
+from metrics_service import track_outbound
+from shipping_service import VIACEP_URL, NOMINATIM_URL, NOMINATIM_USER_AGENT, normalize_cep, geocache
+
+logger = logging.getLogger(__name__)
+
+GEOCODER_MAX_CONCURRENCY = int(os.environ.get("GEOCODER_MAX_CONCURRENCY", "4"))
+GEOCODER_TIMEOUT = float(os.environ.get("GEOCODER_TIMEOUT", "5"))
+GEOCODER_NEGATIVE_TTL = float(os.environ.get("GEOCODER_NEGATIVE_TTL", "60"))  # segundos
+GEOCODER_NEGATIVE_MAXSIZE = 1024
+
+
+class AsyncGeocoder:
+    """Geocodificador assíncrono com pool keep-alive, coalescência e limite de concorrência."""
+
+    def __init__(self, max_concurrency=GEOCODER_MAX_CONCURRENCY, timeout=GEOCODER_TIMEOUT, cache=geocache,
+                 negative_ttl=GEOCODER_NEGATIVE_TTL):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cache = cache
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._inflight = {}  # cep -> asyncio.Task (acessado só na thread do loop)
+        self._negative = {}  # cep -> instante (monotonic) em que o resultado negativo vence (idem)
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.negative_hits = 0
+
+    def _ensure_started(self):
+        # inicia o loop sob demanda e de novo após um fork (cada worker tem o seu)
+        if self._pid == os.getpid() and self._loop is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._client = httpx.AsyncClient(
+                    timeout=self.timeout,
+                    headers={'User-Agent': NOMINATIM_USER_AGENT},
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrency * 2,
+                        max_keepalive_connections=self.max_concurrency * 2,
+                    ),
+                )
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._inflight = {}
+                self._negative = {}
+                ready.set()
+                loop.run_forever()
+
+            thread = threading.Thread(target=run, name="async-geocoder", daemon=True)
+            thread.start()
+            ready.wait()
+            self._loop = loop
+            self._pid = os.getpid()
+
+    def submit(self, cep):
+        """
+        Agenda a geocodificação do CEP no loop de fundo.
+        Retorna um concurrent.futures.Future com (lat, lon) ou None.
+        """
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._lookup(cep), self._loop)
+
+    def is_pending(self, cep):
+        """True se já existe uma consulta externa em andamento para o CEP."""
+        return normalize_cep(cep) in self._inflight
+
+    def is_negative(self, cep):
+        """True se o CEP falhou há menos de negative_ttl segundos (submit responde None sem consulta externa)."""
+        expires = self._negative.get(normalize_cep(cep))
+        return expires is not None and expires > time.monotonic()
+
+    async def _lookup(self, cep):
+        cep_clean = normalize_cep(cep)
+        if not cep_clean:
+            return None
+        expires = self._negative.get(cep_clean)
+        if expires is not None:
+            if expires > time.monotonic():
+                self.negative_hits += 1
+                return None
+            del self._negative[cep_clean]
+        task = self._inflight.get(cep_clean)
+        if task is None:
+            task = asyncio.ensure_future(self._resolve_and_store(cep_clean))
+            self._inflight[cep_clean] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(cep_clean, None))
+        else:
+            self.coalesced += 1
+        # shield: se quem espera desistir, a consulta compartilhada continua para os demais
+        return await asyncio.shield(task)
+
+    async def _resolve_and_store(self, cep):
+        coords = await self.resolve(cep)
+        if not coords:
+            self._remember_negative(cep)
+        elif self.cache is not None:
+            # gravação na tabela é bloqueante: vai para o executor para não travar o loop
+            await asyncio.get_running_loop().run_in_executor(None, self.cache.put, cep, coords)
+        return coords
+
+    def _remember_negative(self, cep):
+        if self.negative_ttl <= 0:
+            return
+        now = time.monotonic()
+        if len(self._negative) >= GEOCODER_NEGATIVE_MAXSIZE:
+            self._negative = {k: v for k, v in self._negative.items() if v > now}
+            while len(self._negative) >= GEOCODER_NEGATIVE_MAXSIZE:
+                del self._negative[next(iter(self._negative))]  # o mais antigo
+        self._negative[cep] = now + self.negative_ttl
+
+    async def resolve(self, cep):
+        """ViaCEP -> Nominatim, respeitando o limite de concorrência. Retorna (lat, lon) ou None."""
+        async with self._semaphore:
+            self.upstream_calls += 1
+            try:
+                with track_outbound("viacep") as call:
+                    resp = await self._client.get(f"{VIACEP_URL}/{cep}/json/")
+                    call["status"] = resp.status_code
+                if resp.status_code != 200:
+                    logger.warning("ViaCEP retornou status %s", resp.status_code)
+                    return None
+                data = resp.json()
+                if data.get('erro'):
+                    logger.info("CEP não encontrado: %s", cep)
+                    return None
+                city = data.get('localidade', '')
+                if not city:
+                    logger.info("Cidade não fornecida")
+                    return None
+                addr = f"{city}, {data.get('uf', '')}, Brasil"
+                if data.get('logradouro'):
+                    addr = f"{data['logradouro']}, {addr}"
+
+                with track_outbound("nominatim") as call:
+                    resp = await self._client.get(NOMINATIM_URL, params={'q': addr, 'format': 'json', 'limit': 1})
+                    call["status"] = resp.status_code
+                if resp.status_code != 200:
+                    logger.warning("Nominatim retornou status %s", resp.status_code)
+                    return None
+                results = resp.json()
+                if not results:
+                    logger.info("Nominatim não encontrou coordenadas para: %s", addr)
+                    return None
+                return (float(results[0]['lat']), float(results[0]['lon']))
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                logger.warning("Erro ao geocodificar CEP %s: %s", cep, e)
+                return None
+
+    def stats(self):
+        return {
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "negative_hits": self.negative_hits,
+            "negative_cached": len(self._negative),
+            "inflight": len(self._inflight),
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+async_geocoder = AsyncGeocoder()
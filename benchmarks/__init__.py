@@ -0,0 +1,6 @@
+"""
+Benchmarks e testes de carga da loja.
+
+Cada script roda a partir da raiz do repositório, por exemplo:
+    python -m benchmarks.shipping_loadtest
+"""
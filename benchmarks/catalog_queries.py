@@ -0,0 +1,140 @@
+"""
+Benchmark da camada de carregamento do catálogo (queries, linhas e tempo por rota).
+
+Popula um SQLite temporário com N produtos × M imagens × K variações e mede, para
+cada rota de listagem, quantas queries foram emitidas, quantas linhas o driver
+devolveu e o tempo de parede (cache de páginas desligado). Também compara as linhas
+devolvidas pela estratégia antiga (joinedload nas duas coleções) com a atual.
+
+Uso:
+    python -m benchmarks.catalog_queries [--products 500 --images 5 --variants 6 --repeat 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+class QueryCounter:
+    """Conta queries (eventos do engine) e linhas buscadas (row_factory do sqlite3)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.queries = 0
+        self.rows = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "connect", self._on_connect)
+        engine.dispose()  # conexões novas passam pelo hook de connect
+
+    def _on_execute(self, *args):
+        self.queries += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        def count_row(cursor, row):
+            self.rows += 1
+            return row
+        dbapi_connection.row_factory = count_row
+
+    def reset(self):
+        self.queries = 0
+        self.rows = 0
+
+
+def measure(client, counter, path, repeat):
+    timings = []
+    queries = rows = 0
+    for _ in range(repeat):
+        counter.reset()
+        started = time.perf_counter()
+        resp = client.get(path)
+        timings.append(time.perf_counter() - started)
+        if resp.status_code != 200:
+            raise SystemExit(f"{path} retornou {resp.status_code}")
+        queries, rows = counter.queries, counter.rows
+    return {
+        "route": path,
+        "queries": queries,
+        "rows_fetched": rows,
+        "wall_ms_median": round(statistics.median(timings) * 1000, 2),
+        "wall_ms_min": round(min(timings) * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--classifications", type=int, default=10)
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--variants", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="bench-catalog-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ["PAGE_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("PICKUP_POINT_COORDS", "-4.8590,-43.3560")
+
+    import app as shop
+    shop.init_db()
+    shop.create_app()
+    from sqlalchemy import select
+    from sqlalchemy.orm import joinedload
+    from benchmarks.seed import seed_catalog
+
+    started = time.perf_counter()
+    product_ids = seed_catalog(
+        shop, products=args.products, classifications=args.classifications,
+        images=args.images, variants=args.variants,
+    )
+    seed_s = time.perf_counter() - started
+
+    counter = QueryCounter(shop.engine)
+    client = shop.app.test_client()
+    with client.session_transaction() as sess:
+        sess["admin_logged"] = True
+
+    results = [
+        measure(client, counter, path, args.repeat)
+        for path in ("/", "/?q=legging", f"/produto/{product_ids[len(product_ids) // 2]}", "/admin")
+    ]
+
+    # estratégia antiga: joinedload nas duas coleções (linhas = imagens × variações por produto)
+    legacy = select(shop.Product).options(
+        joinedload(shop.Product.images), joinedload(shop.Product.stock_variants), joinedload(shop.Product.classification)
+    )
+    comparison = {}
+    for label, stmt in (("joinedload", legacy), ("selectinload", shop.catalog_stmt())):
+        with shop.SessionLocal() as db:
+            counter.reset()
+            started = time.perf_counter()
+            db.scalars(stmt).unique().all()
+            comparison[label] = {
+                "queries": counter.queries,
+                "rows_fetched": counter.rows,
+                "wall_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+
+    report = {
+        "catalog": {
+            "products": args.products, "classifications": args.classifications,
+            "images_per_product": args.images, "variants_per_product": args.variants,
+            "seed_seconds": round(seed_s, 2),
+        },
+        "routes": results,
+        "listing_strategy": comparison,
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Benchmark do snapshot do catálogo em memória (catalog_snapshot.py).
+
+Popula um SQLite temporário e mede:
+  * reconstrução completa (tempo) e memória retida pelo snapshot (tracemalloc);
+  * atualização incremental depois de uma reserva (só os produtos com revisão nova);
+  * queries e tempo por rota de leitura, com o snapshot em dia e depois de uma
+    mudança de estoque (caches de página desligados: mede o caminho de renderização).
+
+Uso:
+    python -m benchmarks.catalog_snapshot [--products 2000 --images 3 --variants 6 --repeat 5]
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--classifications", type=int, default=10)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--variants", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="bench-snapshot-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ["PAGE_CACHE_DIR"] = os.path.join(tmp, "cache")
+    os.environ["PAGE_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("PICKUP_POINT_COORDS", "-4.8590,-43.3560")
+
+    import app as shop
+    import reservation_service
+    from catalog_snapshot import CatalogReplica
+    from cache_service import stock_version
+    from sqlalchemy import select
+    from benchmarks.catalog_queries import QueryCounter
+    from benchmarks.seed import seed_catalog
+
+    shop.init_db()
+    shop.create_app()
+    product_ids = seed_catalog(
+        shop, products=args.products, classifications=args.classifications,
+        images=args.images, variants=args.variants,
+    )
+
+    # reconstrução completa: réplica nova a cada rodada (sem snapshot anterior)
+    build_ms = timed(lambda: CatalogReplica(shop.engine, notify=False).get(), args.repeat)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    replica = CatalogReplica(shop.engine, notify=False)
+    snapshot = replica.get()
+    gc.collect()
+    retained = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+
+    # atualização incremental: uma reserva muda a revisão de um produto
+    with shop.SessionLocal() as db:
+        variant_ids = db.scalars(
+            select(shop.ProductStock.id).where(shop.ProductStock.quantity > 0).limit(args.repeat)
+        ).all()
+    refresh_timings = []
+    for variant_id in variant_ids:
+        reservation_service.reserve(shop.engine, [{"variant_id": variant_id, "quantity": 1}])
+        stock_version.bump()
+        started = time.perf_counter()
+        replica.get()
+        refresh_timings.append(time.perf_counter() - started)
+
+    counter = QueryCounter(shop.engine)
+    client = shop.app.test_client()
+    with client.session_transaction() as sess:
+        sess["admin_logged"] = True
+    some_variants = ",".join(str(v) for v in list(snapshot.variants)[:20])
+    routes = []
+    for path in ("/", "/?in_stock=1", f"/produto/{product_ids[len(product_ids) // 2]}",
+                 f"/api/check-stock?ids={some_variants}", "/admin"):
+        client.get(path)  # snapshot em dia antes da medição
+        timings = []
+        for _ in range(args.repeat):
+            counter.reset()
+            started = time.perf_counter()
+            resp = client.get(path)
+            timings.append(time.perf_counter() - started)
+            if resp.status_code != 200:
+                raise SystemExit(f"{path} retornou {resp.status_code}")
+        steady_queries = counter.queries
+        # primeira requisição depois de uma mudança de estoque (inclui a atualização incremental)
+        reservation_service.reserve(shop.engine, [{"variant_id": variant_ids[0], "quantity": 1}])
+        stock_version.bump()
+        counter.reset()
+        client.get(path)
+        routes.append({
+            "route": path,
+            "queries": steady_queries,
+            "queries_after_stock_change": counter.queries,
+            "wall_ms_median": round(statistics.median(timings) * 1000, 2),
+        })
+
+    report = {
+        "catalog": {
+            "products": args.products, "classifications": args.classifications,
+            "images_per_product": args.images, "variants_per_product": args.variants,
+        },
+        "snapshot": {
+            "full_build_ms": build_ms,
+            "incremental_refresh_ms": round(statistics.median(refresh_timings) * 1000, 2) if refresh_timings else None,
+            "retained_bytes": retained,
+            "bytes_per_product": round(retained / max(args.products, 1)),
+        },
+        "routes": routes,
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Compressão das respostas: bytes transferidos e custo de CPU por requisição.
+
+Popula um SQLite temporário e, para /, /produto/<id> e /admin (caches de página
+ligados, como em produção), mede por codificação (identity, gzip e br se instalado):
+bytes no corpo, tempo estimado de download num 3G (COMPRESSION_3G_KBPS) e a mediana de
+CPU do processo por requisição (time.process_time). Para cada rota, também mede só a
+compressão do corpo em vários níveis — a base para ajustar COMPRESSION_*_LEVELS.
+
+Uso:
+    python -m benchmarks.compression [--products 1000 --images 3 --variants 6 --repeat 7]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+
+THREE_G_KBPS = float(os.environ.get("COMPRESSION_3G_KBPS", "750"))
+
+
+def cpu_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        fn()
+        timings.append(time.process_time() - started)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--classifications", type=int, default=10)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--variants", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="bench-compression-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ["PAGE_CACHE_DIR"] = os.path.join(tmp, "cache")
+    os.environ.setdefault("PICKUP_POINT_COORDS", "-4.8590,-43.3560")
+
+    import app as shop
+    import compression_service
+    from benchmarks.seed import seed_catalog
+
+    shop.init_db()
+    shop.create_app()
+    product_ids = seed_catalog(
+        shop, products=args.products, classifications=args.classifications,
+        images=args.images, variants=args.variants,
+    )
+    client = shop.app.test_client()
+    with client.session_transaction() as sess:
+        sess["admin_logged"] = True
+
+    encodings = ["identity", "gzip"] + (["br"] if compression_service.brotli is not None else [])
+    routes = []
+    for path in ("/", f"/produto/{product_ids[len(product_ids) // 2]}", "/admin"):
+        body = client.get(path, headers={"Accept-Encoding": "identity"}).data  # aquece snapshot e caches
+        route = {"route": path, "class": compression_service.route_class(path, "text/html"), "encodings": {}}
+        for encoding in encodings:
+            headers = {"Accept-Encoding": encoding}
+            resp = client.get(path, headers=headers)
+            if resp.status_code != 200:
+                raise SystemExit(f"{path} retornou {resp.status_code}")
+            size = len(resp.data)
+            route["encodings"][encoding] = {
+                "content_encoding": resp.headers.get("Content-Encoding"),
+                "bytes": size,
+                "ratio": round(size / len(body), 3),
+                "transfer_ms_3g": round(size * 8 / THREE_G_KBPS, 1),
+                "cpu_ms_per_request": cpu_ms(lambda: client.get(path, headers=headers).data, args.repeat),
+            }
+        # só a compressão do corpo, por nível
+        levels = {}
+        for level in (1, 4, 6, 9):
+            levels[f"gzip-{level}"] = {
+                "bytes": len(zlib.compress(body, level)),
+                "cpu_ms": cpu_ms(lambda: zlib.compressobj(level, zlib.DEFLATED, 31).compress(body), args.repeat),
+            }
+        if compression_service.brotli is not None:
+            brotli = compression_service.brotli
+            for level in (1, 4, 5, 9):
+                levels[f"br-{level}"] = {
+                    "bytes": len(brotli.compress(body, quality=level)),
+                    "cpu_ms": cpu_ms(lambda: brotli.compress(body, quality=level), args.repeat),
+                }
+        route["compress_only"] = levels
+        routes.append(route)
+
+    report = {
+        "catalog": {
+            "products": args.products, "classifications": args.classifications,
+            "images_per_product": args.images, "variants_per_product": args.variants,
+        },
+        "levels": {"gzip": compression_service.GZIP_LEVELS, "br": compression_service.BR_LEVELS},
+        "brotli_available": compression_service.brotli is not None,
+        "routes": routes,
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
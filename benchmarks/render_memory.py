@@ -0,0 +1,97 @@
+"""
+Tempo de renderização e memória por requisição das páginas que listam o catálogo.
+
+Popula um SQLite temporário com um catálogo grande e, com os caches de página
+desligados, mede para cada rota a mediana do tempo de parede e o pico de memória
+alocada durante uma requisição (tracemalloc, em rodadas separadas das de tempo:
+o rastreamento deixa o Python mais lento). Cada rota é aquecida antes (snapshot
+do catálogo carregado, templates compilados).
+
+Uso:
+    python -m benchmarks.render_memory [--products 5000 --images 3 --variants 6 --repeat 5]
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def measure(client, path, repeat):
+    resp = client.get(path)
+    if resp.status_code != 200:
+        raise SystemExit(f"{path} retornou {resp.status_code}")
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        client.get(path)
+        timings.append(time.perf_counter() - started)
+    peaks = []
+    for _ in range(max(repeat // 2, 1)):
+        gc.collect()
+        tracemalloc.start()
+        client.get(path)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        "route": path,
+        "bytes": len(resp.data),
+        "wall_ms_median": round(statistics.median(timings) * 1000, 2),
+        "peak_kib_median": round(statistics.median(peaks) / 1024, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--classifications", type=int, default=10)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--variants", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="bench-render-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ["PAGE_CACHE_DIR"] = os.path.join(tmp, "cache")
+    os.environ["PAGE_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("PICKUP_POINT_COORDS", "-4.8590,-43.3560")
+
+    import app as shop
+    from benchmarks.seed import seed_catalog
+
+    shop.init_db()
+    shop.create_app()
+    product_ids = seed_catalog(
+        shop, products=args.products, classifications=args.classifications,
+        images=args.images, variants=args.variants,
+    )
+    client = shop.app.test_client()
+    with client.session_transaction() as sess:
+        sess["admin_logged"] = True
+
+    routes = [
+        measure(client, path, args.repeat)
+        for path in ("/", "/?q=legging", f"/produto/{product_ids[len(product_ids) // 2]}", "/admin")
+    ]
+    report = {
+        "catalog": {
+            "products": args.products, "classifications": args.classifications,
+            "images_per_product": args.images, "variants_per_product": args.variants,
+        },
+        "routes": routes,
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Catálogo sintético para benchmarks (produtos, imagens, variações e classificações).
+"""
+
+import random
+
+SIZES = ["PP", "P", "M", "G", "GG", "XG", "XXG", "EG"]
+
+
+def seed_catalog(shop, products=50, classifications=5, images=3, variants=4, seed=42):
+    """
+    Popula o banco configurado em `shop` (módulo app) com um catálogo sintético.
+    Retorna a lista de ids dos produtos criados.
+    """
+    rnd = random.Random(seed)
+    with shop.SessionLocal() as db:
+        classes = [
+            shop.Classification(name=f"Coleção {i:03d}", display_order=i)
+            for i in range(classifications)
+        ]
+        db.add_all(classes)
+        db.flush()
+        created = []
+        for i in range(products):
+            price = round(rnd.uniform(39.9, 199.9), 2)
+            p = shop.Product(
+                name=f"Legging Conforto {i:05d}" if i % 3 == 0 else f"Top Amor Próprio {i:05d}",
+                description="Tecido respirável, cintura alta e secagem rápida. " * 3,
+                price=price,
+                discount_price=round(price * 0.85, 2) if i % 4 == 0 else None,
+                category="Fitness",
+                classification_id=classes[i % classifications].id if classifications else None,
+            )
+            p.images = [
+                shop.ProductImage(image_url=f"https://cdn.example.com/products/p{i:05d}_{j:02d}.jpg")
+                for j in range(images)
+            ]
+            total = 0
+            for j in range(variants):
+                qty = rnd.randint(0, 12)
+                total += qty
+                p.stock_variants.append(shop.ProductStock(
+                    size=SIZES[j % len(SIZES)] + ("" if j < len(SIZES) else str(j)),
+                    color="Único", quantity=qty, is_available=qty > 0, price=price,
+                ))
+            p.total_stock = total
+            db.add(p)
+            created.append(p)
+        db.commit()
+        return [p.id for p in created]
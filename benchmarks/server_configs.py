@@ -0,0 +1,210 @@
+"""
+Teste de carga: vazão do app sob cada configuração do Gunicorn (gunicorn.conf.py).
+
+Para cada configuração sobe `gunicorn -c gunicorn.conf.py` com as variáveis de ambiente
+correspondentes, contra um SQLite com catálogo sintético e um stub de ViaCEP/Nominatim
+com `--stall` segundos de latência. `--clients` clientes simultâneos disparam, durante
+`--duration` segundos, uma mistura de rotas:
+
+  * catálogo — GET /, /api/products e /produto/<id> (banco + templates; cache de páginas desligado);
+  * frete    — POST /api/calculate-shipping para CEPs novos (`--shipping-ratio` das requisições),
+               no caminho bloqueante (SHIPPING_ASYNC=0): o worker espera o geocodificador.
+
+Reporta requisições/s e latências p50/p95 por grupo de rotas.
+
+Configurações (--configs, separadas por vírgula):
+    sync          WEB_CONCURRENCY workers sync (o start.sh antigo: 4 workers, sem preload)
+    sync-preload  idem, com preload
+    gthread       workers x GUNICORN_THREADS threads, com preload (padrão do gunicorn.conf.py)
+    gevent        só se o pacote gevent estiver instalado
+
+Uso:
+    python -m benchmarks.server_configs [--duration 10 --clients 16 --stall 0.2]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.shipping_loadtest import percentile
+from benchmarks.stubs import GeoStubServer
+
+CONFIGS = {
+    "sync": {"GUNICORN_WORKER_CLASS": "sync", "WEB_CONCURRENCY": "4", "GUNICORN_PRELOAD": "0"},
+    "sync-preload": {"GUNICORN_WORKER_CLASS": "sync", "WEB_CONCURRENCY": "4", "GUNICORN_PRELOAD": "1"},
+    "gthread": {"GUNICORN_WORKER_CLASS": "gthread", "GUNICORN_PRELOAD": "1"},
+    "gevent": {"GUNICORN_WORKER_CLASS": "gevent", "GUNICORN_PRELOAD": "1"},
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _request(url, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"} if data else {})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - started
+
+
+def _wait_ready(base_url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn terminou durante a inicialização")
+        try:
+            with urllib.request.urlopen(f"{base_url}/health", timeout=2):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn não respondeu a tempo")
+
+
+def run_load(base_url, product_ids, args):
+    stop = threading.Event()
+    results = {"catalog": [], "shipping": []}
+    errors = []
+    ceps = (f"{n:08d}" for n in itertools.count(10000000 + random.randrange(10 ** 6) * 10))
+    lock = threading.Lock()
+
+    def client(seed):
+        rnd = random.Random(seed)
+        while not stop.is_set():
+            if rnd.random() < args.shipping_ratio:
+                with lock:
+                    cep = next(ceps)
+                status, elapsed = _request(f"{base_url}/api/calculate-shipping", {"cep": cep, "method": "delivery"})
+                group = "shipping"
+            else:
+                path = rnd.choice(["/", "/api/products", f"/produto/{rnd.choice(product_ids)}"])
+                status, elapsed = _request(base_url + path)
+                group = "catalog"
+            if status >= 500 or status == 0:
+                errors.append(status)
+            else:
+                results[group].append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(args.clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=60)
+    return results, errors, time.perf_counter() - started
+
+
+def run_config(name, args, env, product_ids):
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    config_env = dict(env, **CONFIGS[name])
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}"],
+        env=config_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        boot = time.perf_counter()
+        _wait_ready(base_url, process)
+        boot_s = time.perf_counter() - boot
+        for path in ("/", "/api/products"):  # aquecimento
+            _request(base_url + path)
+        results, errors, elapsed = run_load(base_url, product_ids, args)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    total = sum(len(v) for v in results.values())
+    row = {"config": name, "boot_s": round(boot_s, 2), "requests_per_s": round(total / elapsed, 1), "errors": len(errors)}
+    for group, samples in results.items():
+        row[f"{group}_requests"] = len(samples)
+        row[f"{group}_p50_ms"] = round(percentile(samples, 50) * 1000, 1)
+        row[f"{group}_p95_ms"] = round(percentile(samples, 95) * 1000, 1)
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", default="sync,sync-preload,gthread,gevent")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--stall", type=float, default=0.2, help="latência do stub de geocodificação (s)")
+    parser.add_argument("--shipping-ratio", type=float, default=0.2)
+    parser.add_argument("--products", type=int, default=60)
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args(argv)
+
+    configs = [c for c in args.configs.split(",") if c]
+    if "gevent" in configs:
+        try:
+            import gevent  # noqa: F401
+        except ImportError:
+            print("[warn] gevent não instalado; configuração gevent ignorada", file=sys.stderr)
+            configs.remove("gevent")
+
+    stub = GeoStubServer(delay=args.stall).start()
+    tmp = tempfile.mkdtemp(prefix="bench-server-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        PAGE_CACHE_DIR=os.path.join(tmp, "cache"),
+        PAGE_CACHE_ENABLED="0",
+        SHIPPING_ASYNC="0",
+        SHIPPING_TABLE_PATH="",
+        PICKUP_POINT_COORDS="-4.8590,-43.3560",
+        VIACEP_URL=stub.viacep_url,
+        NOMINATIM_URL=stub.nominatim_url,
+        PYTHONPATH=os.getcwd() + os.pathsep + os.environ.get("PYTHONPATH", ""),
+    )
+    seed = subprocess.run(
+        [sys.executable, "-c", (
+            "import json, app as shop\n"
+            "from benchmarks.seed import seed_catalog\n"
+            f"shop.init_db(); print(json.dumps(seed_catalog(shop, products={args.products})))\n"
+        )],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    product_ids = json.loads(seed.stdout.strip().splitlines()[-1])
+
+    rows = [run_config(name, args, env, product_ids) for name in configs]
+    stub.stop()
+
+    report = {
+        "cpus": os.cpu_count(), "clients": args.clients, "duration_s": args.duration,
+        "stall_s": args.stall, "shipping_ratio": args.shipping_ratio, "results": rows,
+    }
+    print(json.dumps(report, indent=2))
+    print()
+    print(f"{'config':<13} {'req/s':>7} {'catálogo p50':>13} {'p95':>9} {'frete p50':>10} {'p95':>9} {'erros':>6}")
+    for r in rows:
+        print(f"{r['config']:<13} {r['requests_per_s']:>7.1f} {r['catalog_p50_ms']:>11.1f}ms {r['catalog_p95_ms']:>7.1f}ms "
+              f"{r['shipping_p50_ms']:>8.1f}ms {r['shipping_p95_ms']:>7.1f}ms {r['errors']:>6}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Teste de carga: latência da home enquanto consultas de frete ficam travadas.
+
+Sobe um stub local de ViaCEP/Nominatim que demora `--stall` segundos por resposta e
+serve o app em um único worker síncrono (como um worker `gunicorn --worker-class sync`).
+Enquanto `--shipping-clients` clientes calculam frete para CEPs novos (sem cache),
+mede a latência de GET /. Roda duas vezes, em subprocessos separados:
+
+  * sync  — caminho antigo (SHIPPING_ASYNC=0): o worker bloqueia durante a geocodificação;
+  * async — geocodificador assíncrono: o worker espera no máximo SHIPPING_WAIT_BUDGET.
+
+Uso:
+    python -m benchmarks.shipping_loadtest [--stall 3] [--duration 10] [--shipping-clients 4]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.stubs import GeoStubServer
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _get(url):
+    started = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=60) as resp:
+        resp.read()
+    return time.perf_counter() - started
+
+
+def _post_json(url, payload):
+    req = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            return resp.status, json.loads(resp.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def sample_index(base_url, stop, samples):
+    while not stop.is_set():
+        samples.append(_get(f"{base_url}/"))
+        time.sleep(0.05)
+
+
+def shipping_client(base_url, next_cep, stop, results):
+    """Simula window.fetchShippingQuote: tenta de novo enquanto a resposta for 202."""
+    while not stop.is_set():
+        cep = next_cep()
+        started = time.perf_counter()
+        while not stop.is_set():
+            status, data = _post_json(f"{base_url}/api/calculate-shipping", {"cep": cep, "method": "delivery"})
+            if status != 202:
+                results.append((status, time.perf_counter() - started))
+                break
+            time.sleep(data.get("retry_after_ms", 700) / 1000)
+
+
+def run_child(args):
+    from werkzeug.serving import make_server
+
+    stub = GeoStubServer(delay=0).start()
+    os.environ["VIACEP_URL"] = stub.viacep_url
+    os.environ["NOMINATIM_URL"] = stub.nominatim_url
+
+    import app as shop
+    shop.init_db()
+    shop.create_app()
+    from benchmarks.seed import seed_catalog
+
+    seed_catalog(shop, products=args.products)
+    server = make_server("127.0.0.1", 0, shop.app, threaded=False)  # 1 worker síncrono
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    _get(f"{base_url}/")  # aquecimento (templates, pool de conexões)
+    baseline = [_get(f"{base_url}/") for _ in range(args.baseline_requests)]
+
+    stub.set_delay(args.stall)
+    ceps = (f"{n:08d}" for n in itertools.count(10000000))
+    lock = threading.Lock()
+
+    def next_cep():
+        with lock:
+            return next(ceps)
+
+    stop = threading.Event()
+    index_samples, shipping_results = [], []
+    threads = [threading.Thread(target=sample_index, args=(base_url, stop, index_samples))]
+    threads += [
+        threading.Thread(target=shipping_client, args=(base_url, next_cep, stop, shipping_results))
+        for _ in range(args.shipping_clients)
+    ]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=args.stall * 3 + 5)
+    server.shutdown()
+
+    print(json.dumps({
+        "mode": args.mode,
+        "index_baseline_p50_ms": round(statistics.median(baseline) * 1000, 2),
+        "index_baseline_p99_ms": round(percentile(baseline, 99) * 1000, 2),
+        "index_under_load_requests": len(index_samples),
+        "index_under_load_p50_ms": round(percentile(index_samples, 50) * 1000, 2),
+        "index_under_load_p99_ms": round(percentile(index_samples, 99) * 1000, 2),
+        "shipping_quotes_completed": len(shipping_results),
+        "upstream_requests": stub.requests,
+    }))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stall", type=float, default=3.0, help="atraso do stub por resposta (s)")
+    parser.add_argument("--duration", type=float, default=10.0, help="duração da fase com carga (s)")
+    parser.add_argument("--shipping-clients", type=int, default=4)
+    parser.add_argument("--products", type=int, default=60)
+    parser.add_argument("--baseline-requests", type=int, default=30)
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="async", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args)
+        return 0
+
+    rows = []
+    for mode in args.modes.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                SHIPPING_ASYNC="1" if mode == "async" else "0",
+                PICKUP_POINT_COORDS="-4.8590,-43.3560",
+                SHIPPING_TABLE_PATH="",
+            )
+            cmd = [sys.executable, "-m", "benchmarks.shipping_loadtest", "--child", "--mode", mode]
+            cmd += [
+                "--stall", str(args.stall), "--duration", str(args.duration),
+                "--shipping-clients", str(args.shipping_clients), "--products", str(args.products),
+                "--baseline-requests", str(args.baseline_requests),
+            ]
+            out = subprocess.run(cmd, env=env, capture_output=True, text=True, check=True).stdout
+            rows.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(json.dumps(rows, indent=2))
+    print()
+    print(f"{'modo':<6} {'home p50 base':>14} {'home p50 carga':>15} {'home p99 carga':>15} {'fretes ok':>10}")
+    for r in rows:
+        print(f"{r['mode']:<6} {r['index_baseline_p50_ms']:>12.1f}ms {r['index_under_load_p50_ms']:>13.1f}ms "
+              f"{r['index_under_load_p99_ms']:>13.1f}ms {r['shipping_quotes_completed']:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Benchmark de partida a frio do app (cada amostra roda em um processo Python novo).
+
+Fases medidas:
+  * import      — `import app` (deve ser barato: não conecta ao banco nem cria esquema);
+  * create_app  — engine, cache de CEP, busca, tabela de fretes;
+  * 1º request  — GET `--path` logo após create_app (templates, conexão, consultas);
+  * 2º request  — o mesmo GET já aquecido, como referência.
+
+O esquema é criado uma única vez antes das medições (`init_db`, o que o comando
+`flask --app app init-db` faz), e o tempo dele também é reportado, para comparar com o
+custo que antes era pago em todo import. Também lista os módulos mais caros do import
+(python -X importtime).
+
+Uso:
+    python -m benchmarks.startup [--runs 5 --products 200 --path /]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def child(path):
+    started = time.perf_counter()
+    import app as shop
+    imported = time.perf_counter()
+    shop.create_app()
+    created = time.perf_counter()
+    client = shop.app.test_client()
+    status = client.get(path).status_code
+    first = time.perf_counter()
+    client.get(path)
+    second = time.perf_counter()
+    print(json.dumps({
+        "status": status,
+        "import_s": imported - started,
+        "create_app_s": created - imported,
+        "first_request_s": first - created,
+        "second_request_s": second - first,
+        "time_to_first_request_s": first - started,
+    }))
+
+
+def setup_database(env, products):
+    code = (
+        "import time, app as shop\n"
+        "from benchmarks.seed import seed_catalog\n"
+        "t = time.perf_counter(); shop.init_db(); elapsed = time.perf_counter() - t\n"
+        f"seed_catalog(shop, products={products})\n"
+        "print(elapsed)\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def heaviest_imports(env, top=8):
+    """Imports diretos de app.py com maior tempo cumulativo (ms)."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], env=env,
+                         capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        parts = line[len("import time:"):].split("|") if line.startswith("import time:") else []
+        # a coluna do nome é indentada pela profundidade: "  módulo" = importado pelo app
+        if len(parts) == 3 and parts[1].strip().isdigit() and parts[2].startswith("   ") \
+                and not parts[2].startswith("    "):
+            rows.append((int(parts[1]), parts[2].strip()))
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in sorted(rows, reverse=True)[:top]]
+
+
+def summarize(samples, key):
+    values = [s[key] * 1000 for s in samples]
+    return {"median_ms": round(statistics.median(values), 1), "min_ms": round(min(values), 1),
+            "max_ms": round(max(values), 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--database-url", help="padrão: SQLite temporário")
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.path)
+        return 0
+
+    tmp = tempfile.mkdtemp(prefix="bench-startup-")
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        "PAGE_CACHE_ENABLED": "0",
+        "PAGE_CACHE_DIR": os.path.join(tmp, "cache"),
+        "PYTHONPATH": os.getcwd() + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    env.setdefault("PICKUP_POINT_COORDS", "-4.8590,-43.3560")
+
+    init_db_s = setup_database(env, args.products)
+    samples = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child", "--path", args.path],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "runs": args.runs, "products": args.products, "path": args.path,
+        "status": samples[-1]["status"],
+        "init_db_ms (uma vez por deploy)": round(init_db_s * 1000, 1),
+        "import": summarize(samples, "import_s"),
+        "create_app": summarize(samples, "create_app_s"),
+        "first_request": summarize(samples, "first_request_s"),
+        "second_request": summarize(samples, "second_request_s"),
+        "time_to_first_request": summarize(samples, "time_to_first_request_s"),
+        "heaviest_imports": heaviest_imports(env),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
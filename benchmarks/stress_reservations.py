@@ -0,0 +1,184 @@
+"""
+Teste de estresse das reservas de estoque: centenas de checkouts concorrentes.
+
+Cria poucas variantes com pouco estoque (alta disputa) e dispara `--workers` threads,
+todas liberadas ao mesmo tempo por uma barreira. Cada thread reserva um carrinho
+aleatório; parte delas cancela a reserva, parte confirma e parte deixa vencer
+(TTL curto), enquanto um varredor roda em paralelo. Ao final verifica:
+
+  * nenhuma variante ficou com quantidade negativa (sem overselling);
+  * estoque inicial - estoque final == soma das reservas ativas/confirmadas, por variante;
+  * products.total_stock == soma das quantidades das variantes, por produto.
+
+Sai com código 1 se alguma verificação falhar.
+
+Uso:
+    python -m benchmarks.stress_reservations [--workers 300 --products 3 --variants 3 --stock 5]
+    python -m benchmarks.stress_reservations --database-url postgresql://...  (banco descartável!)
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=300)
+    parser.add_argument("--products", type=int, default=3)
+    parser.add_argument("--variants", type=int, default=3, help="variantes por produto")
+    parser.add_argument("--stock", type=int, default=5, help="quantidade inicial de cada variante")
+    parser.add_argument("--max-items", type=int, default=3, help="itens distintos por carrinho")
+    parser.add_argument("--release-ratio", type=float, default=0.2)
+    parser.add_argument("--expire-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--database-url", help="padrão: SQLite temporário")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        tmp = tempfile.mkdtemp(prefix="bench-reservations-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ.setdefault("PICKUP_POINT_COORDS", "-4.8590,-43.3560")
+
+    import app as shop
+    shop.init_db()
+    shop.create_app()
+    import reservation_service
+    from sqlalchemy import create_engine, select, func
+    from sqlalchemy.exc import OperationalError
+
+    # pool do tamanho da carga: a disputa é pelas linhas de estoque, não por conexões
+    engine = create_engine(
+        os.environ["DATABASE_URL"], pool_size=min(args.workers, 50), max_overflow=args.workers,
+        pool_timeout=120, connect_args={"timeout": 60} if shop.engine.dialect.name == "sqlite" else {},
+    )
+
+    with shop.SessionLocal() as db:
+        variant_ids = []
+        for i in range(args.products):
+            product = shop.Product(name=f"Produto disputado {i}", price=99.9, total_stock=0)
+            for j in range(args.variants):
+                product.stock_variants.append(shop.ProductStock(size=f"T{j}", quantity=args.stock, is_available=True))
+            product.total_stock = args.variants * args.stock
+            db.add(product)
+            db.flush()
+            variant_ids += [v.id for v in product.stock_variants]
+        db.commit()
+    initial = {variant_id: args.stock for variant_id in variant_ids}
+
+    rnd = random.Random(args.seed)
+    plans = []
+    for _ in range(args.workers):
+        chosen = rnd.sample(variant_ids, rnd.randint(1, min(args.max_items, len(variant_ids))))
+        roll = rnd.random()
+        action = "release" if roll < args.release_ratio else "expire" if roll < args.release_ratio + args.expire_ratio else "confirm"
+        plans.append(([{"variant_id": v, "quantity": rnd.randint(1, 2)} for v in chosen], action))
+
+    barrier = threading.Barrier(args.workers)
+    lock = threading.Lock()
+    outcome = {"reserved": 0, "insufficient": 0, "errors": 0, "released": 0, "confirmed": 0, "expired": 0}
+    latencies = []
+
+    def worker(items, action):
+        barrier.wait()
+        started = time.perf_counter()
+        try:
+            reservation = reservation_service.reserve(engine, items, ttl_seconds=0 if action == "expire" else 600)
+        except reservation_service.InsufficientStock:
+            with lock:
+                outcome["insufficient"] += 1
+            return
+        except OperationalError:
+            with lock:
+                outcome["errors"] += 1
+            return
+        with lock:
+            outcome["reserved"] += 1
+            latencies.append(time.perf_counter() - started)
+        if action == "release":
+            reservation_service.release(engine, reservation["token"])
+            key = "released"
+        elif action == "confirm":
+            reservation_service.confirm(engine, reservation["token"])
+            key = "confirmed"
+        else:
+            key = "expired"
+        with lock:
+            outcome[key] += 1
+
+    stop_sweeper = threading.Event()
+    swept = [0]
+
+    def sweeper():
+        while not stop_sweeper.is_set():
+            try:
+                swept[0] += reservation_service.sweep_expired(engine)
+            except OperationalError:
+                pass
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=worker, args=plan) for plan in plans]
+    sweeper_thread = threading.Thread(target=sweeper, daemon=True)
+    started = time.perf_counter()
+    sweeper_thread.start()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stop_sweeper.set()
+    sweeper_thread.join()
+    swept[0] += reservation_service.sweep_expired(engine)
+    elapsed = time.perf_counter() - started
+
+    # verificações
+    failures = []
+    with engine.connect() as conn:
+        final = dict(conn.execute(select(shop.ProductStock.id, shop.ProductStock.quantity)).all())
+        held = dict(conn.execute(
+            select(shop.StockReservation.variant_id, func.sum(shop.StockReservation.quantity))
+            .where(shop.StockReservation.status.in_(["active", "confirmed"]))
+            .group_by(shop.StockReservation.variant_id)
+        ).all())
+        totals = conn.execute(
+            select(shop.Product.id, shop.Product.total_stock, func.sum(shop.ProductStock.quantity))
+            .join(shop.ProductStock, shop.ProductStock.product_id == shop.Product.id)
+            .group_by(shop.Product.id, shop.Product.total_stock)
+        ).all()
+    for variant_id, quantity in initial.items():
+        if final[variant_id] < 0:
+            failures.append(f"variante {variant_id} negativa: {final[variant_id]}")
+        if quantity - final[variant_id] != held.get(variant_id, 0):
+            failures.append(
+                f"variante {variant_id}: baixa {quantity - final[variant_id]} != reservado {held.get(variant_id, 0)}"
+            )
+    for product_id, total_stock, summed in totals:
+        if total_stock != summed:
+            failures.append(f"produto {product_id}: total_stock {total_stock} != soma das variantes {summed}")
+
+    latencies.sort()
+    report = {
+        "dialect": engine.dialect.name,
+        "workers": args.workers,
+        "variants": len(variant_ids),
+        "initial_units": sum(initial.values()),
+        "units_held": sum(held.values()),
+        "outcome": outcome,
+        "swept_items": swept[0],
+        "elapsed_s": round(elapsed, 3),
+        "reserve_p50_ms": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        "reserve_max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+        "failures": failures,
+    }
+    print(json.dumps(report, indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
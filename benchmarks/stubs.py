@@ -0,0 +1,243 @@
+"""
+Servidores HTTP locais que substituem serviços externos durante benchmarks.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class _GeoStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.delay:
+            time.sleep(server.delay)
+        path = urlparse(self.path).path
+        if path.startswith("/ws/"):
+            # ViaCEP: /ws/<cep>/json/
+            body = {"cep": path.split("/")[2], "logradouro": "Rua Teste", "localidade": "Caxias", "uf": "MA"}
+        elif path.startswith("/search"):
+            # Nominatim
+            body = [{"lat": "-4.8590", "lon": "-43.3560"}]
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class GeoStubServer:
+    """
+    Stub de ViaCEP + Nominatim com atraso configurável (simula APIs lentas/travadas).
+
+    Use `viacep_url` e `nominatim_url` como VIACEP_URL / NOMINATIM_URL.
+    """
+
+    def __init__(self, delay=0.0, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), _GeoStubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.delay = delay
+        self.httpd.requests = 0
+        self.httpd.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def viacep_url(self):
+        return f"{self.base_url}/ws"
+
+    @property
+    def nominatim_url(self):
+        return f"{self.base_url}/search"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def set_delay(self, delay):
+        self.httpd.delay = delay
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _StorageStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            size = 0
+            while True:
+                length = int(self.rfile.readline().strip() or b"0", 16)
+                if length == 0:
+                    self.rfile.readline()
+                    return size
+                while length > 0:
+                    chunk = self.rfile.read(min(length, 64 * 1024))
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    length -= len(chunk)
+                self.rfile.readline()
+        remaining = int(self.headers.get("Content-Length") or 0)
+        size = 0
+        while remaining > 0:
+            # lê em blocos e descarta: o stub não deve pesar na memória medida do cliente
+            chunk = self.rfile.read(min(remaining, 64 * 1024))
+            if not chunk:
+                break
+            size += len(chunk)
+            remaining -= len(chunk)
+        return size
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_DELETE(self):
+        # remove em lote: DELETE /storage/v1/object/<bucket>  {"prefixes": [...]}
+        server = self.server
+        bucket = self.path[len("/storage/v1/object/"):].strip("/")
+        prefixes = self._read_json().get("prefixes", [])
+        with server.lock:
+            server.delete_calls += 1
+            if server.fail_deletes:
+                self._reply(500, {"error": "stub configurado para falhar"})
+                return
+            removed = [p for p in prefixes if server.objects.pop(f"{bucket}/{p}", None) is not None]
+        self._reply(200, [{"name": p} for p in removed])
+
+    def _list(self, bucket):
+        # listagem: POST /storage/v1/object/list/<bucket>  {"prefix", "limit", "offset"}
+        server = self.server
+        body = self._read_json()
+        folder = f"{bucket}/{body.get('prefix', '').strip('/')}/"
+        with server.lock:
+            names = sorted(key[len(folder):] for key in server.objects if key.startswith(folder))
+        offset, limit = int(body.get("offset", 0)), int(body.get("limit", 100))
+        self._reply(200, [
+            {"name": name, "id": name, "created_at": server.created_at, "updated_at": server.created_at}
+            for name in names[offset:offset + limit]
+        ])
+
+    def do_POST(self):
+        server = self.server
+        prefix = "/storage/v1/object/"
+        if self.path.startswith(prefix + "list/"):
+            self._list(self.path[len(prefix + "list/"):].strip("/"))
+            return
+        if not self.path.startswith(prefix) or self.path.startswith(prefix + "public/"):
+            self.send_error(404)
+            return
+        with server.lock:
+            server.requests += 1
+            server.inflight += 1
+            server.peak_inflight = max(server.peak_inflight, server.inflight)
+        try:
+            size = self._read_body()
+            if server.delay:
+                time.sleep(server.delay)
+            key = self.path[len(prefix):]
+            with server.lock:
+                if key in server.objects and self.headers.get("x-upsert") != "true":
+                    self._reply(400, {"statusCode": "409", "error": "Duplicate", "message": "The resource already exists"})
+                    return
+                server.objects[key] = size
+            self._reply(200, {"Key": key})
+        finally:
+            with server.lock:
+                server.inflight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class StorageStubServer:
+    """
+    Stub da API de upload do Supabase Storage (POST /storage/v1/object/<bucket>/<path>).
+
+    Use `base_url` como SUPABASE_URL. Guarda o tamanho de cada objeto recebido e o
+    pico de uploads simultâneos (`peak_inflight`). Também atende a remoção em lote
+    (DELETE, contada em `delete_calls`; `fail_deletes` simula falhas) e a listagem.
+    """
+
+    def __init__(self, delay=0.0, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), _StorageStubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.delay = delay
+        self.httpd.requests = 0
+        self.httpd.inflight = 0
+        self.httpd.peak_inflight = 0
+        self.httpd.objects = {}
+        self.httpd.delete_calls = 0
+        self.httpd.fail_deletes = False
+        self.httpd.created_at = "2000-01-01T00:00:00+00:00"
+        self.httpd.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def objects(self):
+        return self.httpd.objects
+
+    @property
+    def peak_inflight(self):
+        return self.httpd.peak_inflight
+
+    @property
+    def delete_calls(self):
+        return self.httpd.delete_calls
+
+    def set_fail_deletes(self, fail):
+        self.httpd.fail_deletes = fail
+
+    def reset(self):
+        with self.httpd.lock:
+            self.httpd.objects.clear()
+            self.httpd.requests = 0
+            self.httpd.delete_calls = 0
+            self.httpd.peak_inflight = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,335 @@
+"""
+Suíte de benchmarks das rotas quentes da loja, do admin e da API (linha de base para
+comparar qualquer mudança de desempenho).
+
+Prepara um banco (SQLite temporário, ou `--database-url` para PostgreSQL) com um catálogo
+sintético de `--products` produtos, `--classifications` classificações, `--images` imagens e
+`--variants` variações por produto; sobe stubs locais de ViaCEP/Nominatim e do Supabase
+Storage; serve o app com `gunicorn -c gunicorn.conf.py` (a configuração de produção) e, para
+cada cenário, mantém `--clients` clientes simultâneos durante `--duration` segundos:
+
+    home       GET  /
+    search     GET  /?q=<termo>
+    product    GET  /produto/<id>
+    stock      GET  /api/check-stock?ids=<5 ids>
+    shipping   POST /api/calculate-shipping (CEPs de um conjunto de `--cep-pool`)
+    admin      GET  /admin (sessão de admin logada)
+
+Mede vazão (req/s), latências p50/p90/p99 e erros por cenário e grava tudo em JSON
+(`--json`, padrão benchmarks/results/suite-<data>.json) com o commit e a configuração da
+execução. `--compare base.json` imprime a diferença para uma execução anterior.
+
+Um banco PostgreSQL já populado é reaproveitado (não semeia de novo se houver produtos),
+para que execuções sucessivas meçam o mesmo catálogo.
+
+Uso:
+    python -m benchmarks.suite [--products 5000 --duration 10 --clients 8]
+    python -m benchmarks.suite --scenarios home,product --compare benchmarks/results/base.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+
+from benchmarks.server_configs import _free_port, _wait_ready
+from benchmarks.shipping_loadtest import percentile
+from benchmarks.stubs import GeoStubServer, StorageStubServer
+
+SCENARIOS = ("home", "search", "product", "stock", "shipping", "admin")
+SEARCH_TERMS = ("legging", "top", "conforto", "amor próprio", "cintura alta", "coleção 003", "inexistente")
+ADMIN_USER = "bench-admin"
+ADMIN_PASSWORD = "bench-password"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def _request(url, payload=None, headers=None, form=None):
+    headers = dict(headers or {})
+    data = None
+    if payload is not None:
+        data = json.dumps(payload).encode()
+        headers["Content-Type"] = "application/json"
+    elif form is not None:
+        data = urllib.parse.urlencode(form).encode()
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    req = urllib.request.Request(url, data=data, headers=headers)
+    started = time.perf_counter()
+    try:
+        with _opener.open(req, timeout=60) as resp:
+            resp.read()
+            status, response_headers = resp.status, resp.headers
+    except urllib.error.HTTPError as e:
+        e.read()
+        status, response_headers = e.code, e.headers
+    except OSError:
+        status, response_headers = 0, {}
+    return status, time.perf_counter() - started, response_headers
+
+
+def admin_cookie(base_url):
+    """Faz login e devolve o cabeçalho Cookie da sessão de admin."""
+    status, _, headers = _request(f"{base_url}/login", form={"username": ADMIN_USER, "password": ADMIN_PASSWORD})
+    cookie = headers.get("Set-Cookie") if status in (302, 303) else None
+    if not cookie:
+        raise RuntimeError(f"login de admin falhou (status {status})")
+    return cookie.split(";", 1)[0]
+
+
+def scenario_requests(name, base_url, product_ids, rnd, args, cookie):
+    """Devolve uma função que faz um request do cenário e retorna (status, segundos)."""
+    if name == "home":
+        return lambda: _request(f"{base_url}/")[:2]
+    if name == "search":
+        return lambda: _request(f"{base_url}/?q={urllib.parse.quote(rnd.choice(SEARCH_TERMS))}")[:2]
+    if name == "product":
+        return lambda: _request(f"{base_url}/produto/{rnd.choice(product_ids)}")[:2]
+    if name == "stock":
+        return lambda: _request(
+            f"{base_url}/api/check-stock?ids={','.join(str(i) for i in rnd.sample(product_ids, min(5, len(product_ids))))}"
+        )[:2]
+    if name == "shipping":
+        return lambda: _request(
+            f"{base_url}/api/calculate-shipping",
+            payload={"cep": f"{64000000 + rnd.randrange(args.cep_pool) * 17:08d}", "method": "delivery"},
+        )[:2]
+    if name == "admin":
+        return lambda: _request(f"{base_url}/admin", headers={"Cookie": cookie})[:2]
+    raise ValueError(name)
+
+
+def run_scenario(name, base_url, product_ids, args, cookie):
+    samples, statuses = [], Counter()
+    lock = threading.Lock()
+    measuring = threading.Event()
+    stop = threading.Event()
+
+    def client(seed):
+        rnd = random.Random(seed)
+        call = scenario_requests(name, base_url, product_ids, rnd, args, cookie)
+        local, local_statuses = [], Counter()
+        while not stop.is_set():
+            status, elapsed = call()
+            if not measuring.is_set():  # aquecimento: todos os workers/threads, descartado
+                continue
+            local_statuses[status] += 1
+            if 200 <= status < 400:
+                local.append(elapsed)
+        with lock:
+            samples.extend(local)
+            statuses.update(local_statuses)
+
+    threads = [threading.Thread(target=client, args=(args.seed + i,), daemon=True) for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    time.sleep(args.warmup)
+    measuring.set()
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=60)
+    elapsed = time.perf_counter() - started
+
+    total = sum(statuses.values())
+    return {
+        "scenario": name,
+        "requests": total,
+        "errors": total - len(samples),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 2) if samples else None,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p90_ms": round(percentile(samples, 90) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2) if samples else None,
+    }
+
+
+def prepare_database(env, args):
+    """Cria o esquema e semeia o catálogo (se vazio); devolve (ids dos produtos, segundos de seed)."""
+    code = (
+        "import json, time, app as shop\n"
+        "from sqlalchemy import select\n"
+        "from benchmarks.seed import seed_catalog\n"
+        "shop.init_db()\n"
+        "with shop.SessionLocal() as db:\n"
+        "    ids = list(db.scalars(select(shop.Product.id).order_by(shop.Product.id)))\n"
+        "t = time.perf_counter()\n"
+        "if not ids:\n"
+        f"    ids = seed_catalog(shop, products={args.products}, classifications={args.classifications},\n"
+        f"                       images={args.images}, variants={args.variants}, seed={args.seed})\n"
+        "print(json.dumps({'ids': ids, 'seed_s': time.perf_counter() - t}))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(f"falha ao preparar o banco:\n{out.stderr[-2000:]}")
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    return result["ids"], result["seed_s"]
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(rows):
+    print(f"{'cenário':<10} {'req/s':>8} {'p50':>9} {'p90':>9} {'p99':>9} {'erros':>6}")
+    for r in rows:
+        print(f"{r['scenario']:<10} {r['throughput_rps']:>8.1f} {r['p50_ms']:>7.1f}ms {r['p90_ms']:>7.1f}ms "
+              f"{r['p99_ms']:>7.1f}ms {r['errors']:>6}")
+
+
+def print_comparison(report, base):
+    """Diferença percentual de vazão e latência em relação a uma execução anterior."""
+    previous = {r["scenario"]: r for r in base.get("results", [])}
+
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "—"
+
+    print(f"\ncomparado com {base.get('git_revision')} ({base.get('started_at')}):")
+    print(f"{'cenário':<10} {'req/s':>16} {'p50':>18} {'p99':>18}")
+    for r in report["results"]:
+        old = previous.get(r["scenario"])
+        if old is None:
+            continue
+        print(f"{r['scenario']:<10} {old['throughput_rps']:>7.1f} {delta(r['throughput_rps'], old['throughput_rps']):>8} "
+              f"{old['p50_ms']:>8.1f}ms {delta(r['p50_ms'], old['p50_ms']):>7} "
+              f"{old['p99_ms']:>8.1f}ms {delta(r['p99_ms'], old['p99_ms']):>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--classifications", type=int, default=20)
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--variants", type=int, default=6)
+    parser.add_argument("--database-url", help="padrão: SQLite temporário")
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos por cenário")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--warmup", type=float, default=2.0, help="segundos de aquecimento por cenário (descartados)")
+    parser.add_argument("--cep-pool", type=int, default=500, help="nº de CEPs distintos no cenário shipping")
+    parser.add_argument("--stall", type=float, default=0.05, help="latência dos stubs externos (s)")
+    parser.add_argument("--page-cache", choices=("on", "off"), default="on")
+    parser.add_argument("--worker-class", default=None, help="GUNICORN_WORKER_CLASS (padrão do gunicorn.conf.py)")
+    parser.add_argument("--workers", type=int, default=None, help="WEB_CONCURRENCY")
+    parser.add_argument("--threads", type=int, default=None, help="GUNICORN_THREADS")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="arquivo de saída (padrão benchmarks/results/suite-<data>.json)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"cenários desconhecidos: {', '.join(sorted(unknown))}")
+
+    geo = GeoStubServer(delay=args.stall).start()
+    storage = StorageStubServer(delay=args.stall).start()
+    tmp = tempfile.mkdtemp(prefix="bench-suite-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        PAGE_CACHE_DIR=os.path.join(tmp, "cache"),
+        PAGE_CACHE_ENABLED="1" if args.page_cache == "on" else "0",
+        SHIPPING_TABLE_PATH="",
+        PICKUP_POINT_COORDS="-4.8590,-43.3560",
+        VIACEP_URL=geo.viacep_url,
+        NOMINATIM_URL=geo.nominatim_url,
+        SUPABASE_URL=storage.base_url,
+        SUPABASE_SERVICE_KEY="bench-key",
+        ADMIN_USER=ADMIN_USER,
+        ADMIN_PASSWORD=ADMIN_PASSWORD,
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=os.getcwd() + os.pathsep + os.environ.get("PYTHONPATH", ""),
+    )
+    for key, value in (("GUNICORN_WORKER_CLASS", args.worker_class), ("WEB_CONCURRENCY", args.workers),
+                       ("GUNICORN_THREADS", args.threads)):
+        if value is not None:
+            env[key] = str(value)
+
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    product_ids, seed_s = prepare_database(env, args)
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server_log = open(os.path.join(tmp, "gunicorn.log"), "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}"],
+        env=env, stdout=server_log, stderr=subprocess.STDOUT,
+    )
+    try:
+        _wait_ready(base_url, process, timeout=60)
+        cookie = admin_cookie(base_url) if "admin" in scenarios else None
+        rows = []
+        for name in scenarios:
+            rows.append(run_scenario(name, base_url, product_ids, args, cookie))
+            print(f"[bench] {name}: {rows[-1]['throughput_rps']} req/s", file=sys.stderr)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        server_log.close()
+        geo.stop()
+        storage.stop()
+
+    report = {
+        "suite": "benchmarks.suite",
+        "started_at": started_at,
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "database": "postgresql" if (args.database_url or "").startswith("postgres") else "sqlite",
+        "catalog": {
+            "products": len(product_ids), "classifications": args.classifications,
+            "images_per_product": args.images, "variants_per_product": args.variants,
+            "seed_s": round(seed_s, 1),
+        },
+        "config": {
+            "clients": args.clients, "duration_s": args.duration, "warmup_s": args.warmup,
+            "cep_pool": args.cep_pool, "stall_s": args.stall, "page_cache": args.page_cache,
+            "worker_class": env.get("GUNICORN_WORKER_CLASS", "gthread"),
+            "workers": env.get("WEB_CONCURRENCY"), "threads": env.get("GUNICORN_THREADS"),
+            "seed": args.seed,
+        },
+        "results": rows,
+        "server_log": server_log.name,
+    }
+
+    output = args.json or os.path.join(RESULTS_DIR, f"suite-{started_at.replace(':', '')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print_table(rows)
+    print(f"\nresultado gravado em {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
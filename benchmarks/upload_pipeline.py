@@ -0,0 +1,107 @@
+"""
+Benchmark do upload de imagens do admin contra um Storage local (stub).
+
+Sobe um stub da API de upload do Supabase com `--delay` segundos de latência por
+requisição e envia `--files` imagens sintéticas de `--size-kb` KB de três formas:
+
+  * legacy     — upload_file_to_supabase arquivo a arquivo (lê o arquivo inteiro);
+  * pipeline-1 — upload_files_to_supabase com 1 worker (streaming, sequencial);
+  * pipeline-N — upload_files_to_supabase com `--workers` envios simultâneos.
+
+Reporta tempo de parede, pico de uploads simultâneos no servidor e pico de memória
+alocada pelo Python durante o envio (tracemalloc; os arquivos já existem antes da medição).
+
+Uso:
+    python -m benchmarks.upload_pipeline [--files 8 --size-kb 1500 --delay 0.2 --workers 4]
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from benchmarks.stubs import StorageStubServer
+
+
+def make_files(count, size_kb):
+    from werkzeug.datastructures import FileStorage
+
+    payload = os.urandom(size_kb * 1024)
+    return [
+        FileStorage(stream=io.BytesIO(payload), filename=f"foto_{i:02d}.jpg", content_type="image/jpeg")
+        for i in range(count)
+    ]
+
+
+def run(label, stub, upload, files):
+    stub.reset()
+    tracemalloc.start()
+    started = time.perf_counter()
+    ok = upload(files)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": label,
+        "uploaded": ok,
+        "stored": len(stub.objects),
+        "wall_s": round(elapsed, 3),
+        "peak_concurrent_uploads": stub.peak_inflight,
+        "peak_python_alloc_kb": round(peak / 1024),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--size-kb", type=int, default=1500)
+    parser.add_argument("--delay", type=float, default=0.2, help="latência do stub por upload (s)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args(argv)
+
+    stub = StorageStubServer(delay=args.delay).start()
+    os.environ["SUPABASE_URL"] = stub.base_url
+    os.environ["SUPABASE_SERVICE_KEY"] = "bench-key"
+
+    import supabase_service
+
+    rows = []
+
+    def legacy(files):
+        return sum(
+            1 for i, f in enumerate(files)
+            if supabase_service.upload_file_to_supabase(f, custom_filename=f"legacy_{i:02d}.jpg")
+        )
+
+    def pipeline(workers):
+        def upload(files):
+            uploads = [(f, f"products/pipeline_{workers}_{i:02d}.jpg") for i, f in enumerate(files)]
+            results = supabase_service.upload_files_to_supabase(uploads, max_workers=workers)
+            return sum(1 for r in results if r.ok)
+        return upload
+
+    # aquecimento: cria o cliente HTTP compartilhado (contexto TLS) fora da medição
+    supabase_service.upload_files_to_supabase([(f, "products/warmup.jpg") for f in make_files(1, 1)])
+    for label, upload in (
+        ("legacy", legacy), ("pipeline-1", pipeline(1)), (f"pipeline-{args.workers}", pipeline(args.workers))
+    ):
+        rows.append(run(label, stub, upload, make_files(args.files, args.size_kb)))
+    stub.stop()
+
+    report = {
+        "files": args.files, "size_kb": args.size_kb, "delay_s": args.delay, "workers": args.workers,
+        "results": rows,
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+Cache de páginas renderizadas compartilhado entre os workers do gunicorn.
+
+Tudo fica em disco local (por padrão no diretório temporário do sistema), então os
+4 workers enxergam o mesmo cache sem Redis e sem tocar no banco:
+
+  * VersionCounter — contador de versão (ex.: "geração do catálogo") em um arquivo.
+    As rotas admin que alteram o catálogo incrementam o contador.
+  * PageCache — HTML renderizado, guardado por geração. Quando a geração muda,
+    as entradas antigas simplesmente deixam de ser lidas e são apagadas depois.
+    As páginas da home mostram estoque (filtro "em estoque", tamanhos disponíveis), então
+    a geração delas é o par (geração do catálogo, versão do estoque).
+  * ProductPageCache — HTML da página de cada produto, guardado pela revisão do produto
+    (products.revision): alterar um produto invalida só a página dele.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get("PAGE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "am_conceitofitness-cache")
+PAGE_CACHE_ENABLED = os.environ.get("PAGE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PAGE_CACHE_MAX_ENTRIES = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", "500"))
+
+
+def _atomic_write(path, data):
+    """Grava em arquivo temporário e troca com os.replace (leitores nunca veem escrita parcial)."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class VersionCounter:
+    """Contador inteiro persistido em arquivo, compartilhado entre processos."""
+
+    def __init__(self, path):
+        self.path = path
+        self._cached = (None, 0)  # (stat key, valor) — evita reler o arquivo se não mudou
+
+    def get(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if self._cached[0] == key:
+            return self._cached[1]
+        try:
+            with open(self.path, "rb") as f:
+                value = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+        self._cached = (key, value)
+        return value
+
+    def bump(self):
+        """Incrementa o contador (com lock entre processos) e retorna o novo valor."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                value = self.get() + 1
+                _atomic_write(self.path, str(value).encode())
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return value
+
+
+class CompositeVersion:
+    """Versão formada por vários VersionCounter; get() devolve a tupla dos valores."""
+
+    def __init__(self, *counters):
+        self.counters = counters
+
+    def get(self):
+        return tuple(counter.get() for counter in self.counters)
+
+
+def _generation_name(generation):
+    if isinstance(generation, tuple):
+        return ".".join(str(part) for part in generation)
+    return str(generation)
+
+
+def _parse_generation(name):
+    """Nome do diretório -> tupla de inteiros (None se não for de uma geração)."""
+    parts = name.split(".")
+    if not all(part.isdigit() for part in parts):
+        return None
+    return tuple(int(part) for part in parts)
+
+
+class PageCache:
+    """Páginas renderizadas em disco, versionadas por um VersionCounter."""
+
+    def __init__(self, directory, version, max_entries=PAGE_CACHE_MAX_ENTRIES, enabled=PAGE_CACHE_ENABLED):
+        self.directory = directory
+        self.version = version
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._written = {}  # geração -> nº de entradas gravadas por este worker
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, generation, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, _generation_name(generation), digest)
+
+    def get(self, key, generation=None):
+        """Retorna o corpo (bytes) guardado para a chave na geração atual, ou None."""
+        if not self.enabled:
+            return None
+        if generation is None:
+            generation = self.version.get()
+        try:
+            with open(self._path(generation, key), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return body
+
+    def set(self, key, body, generation=None):
+        """
+        Guarda o corpo para a chave. Passe a `generation` lida ANTES de consultar o banco:
+        se o catálogo mudar durante a renderização, a página fica na geração antiga
+        (que já não é lida) em vez de contaminar a nova.
+        """
+        if not self.enabled:
+            return
+        if generation is None:
+            generation = self.version.get()
+        with self._lock:
+            count = self._written.get(generation, 0)
+            if count >= self.max_entries:
+                return
+            self._written = {generation: count + 1}
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        try:
+            _atomic_write(self._path(generation, key), body)
+        except OSError as e:
+            logger.warning("Falha ao gravar cache de página: %s", e)
+
+    def prune(self, keep_generation):
+        """Apaga diretórios de gerações anteriores a `keep_generation` (tuplas: ordem lexicográfica)."""
+        keep = keep_generation if isinstance(keep_generation, tuple) else (keep_generation,)
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            generation = _parse_generation(name)
+            if generation is not None and generation < keep:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "generation": self.version.get(),
+                "enabled": self.enabled,
+            }
+
+
+class ProductPageCache:
+    """Página de produto renderizada, por (produto, versão): <dir>/<id>/<versão>."""
+
+    def __init__(self, directory, enabled=PAGE_CACHE_ENABLED):
+        self.directory = directory
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, product_id, version):
+        return os.path.join(self.directory, str(int(product_id)), version)
+
+    def get(self, product_id, version):
+        if not self.enabled:
+            return None
+        try:
+            with open(self._path(product_id, version), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return body
+
+    def set(self, product_id, version, body):
+        """Guarda a página da versão e apaga as versões anteriores do mesmo produto."""
+        if not self.enabled:
+            return
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        path = self._path(product_id, version)
+        try:
+            _atomic_write(path, body)
+        except OSError as e:
+            logger.warning("Falha ao gravar cache da página do produto %s: %s", product_id, e)
+            return
+        directory = os.path.dirname(path)
+        for name in os.listdir(directory):
+            if name != version and not name.startswith(".tmp-"):
+                try:
+                    os.unlink(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def discard(self, product_id):
+        """Remove todas as versões do produto (produto apagado)."""
+        shutil.rmtree(os.path.join(self.directory, str(int(product_id))), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "enabled": self.enabled,
+            }
+
+
+catalog_generation = VersionCounter(os.path.join(CACHE_DIR, "catalog.generation"))
+# versão do estoque (ETags do /api/check-stock); muda em toda alteração de quantidade
+stock_version = VersionCounter(os.path.join(CACHE_DIR, "stock.version"))
+page_cache = PageCache(os.path.join(CACHE_DIR, "pages"), CompositeVersion(catalog_generation, stock_version))
+product_page_cache = ProductPageCache(os.path.join(CACHE_DIR, "products"))
+
+
+def bump_catalog_generation():
+    """Invalida todas as páginas do catálogo (chamar após cada alteração feita pelo admin)."""
+    generation = catalog_generation.bump()
+    page_cache.prune(page_cache.version.get())
+    return generation
+
+
+def bump_stock_version():
+    """Invalida as páginas que mostram estoque (chamar após cada alteração de quantidade)."""
+    version = stock_version.bump()
+    page_cache.prune(page_cache.version.get())
+    return version
@@ -0,0 +1,358 @@
+"""
+Réplica do catálogo em memória, somente leitura, compartilhada pelas rotas de leitura.
+
+Cada worker mantém um Snapshot imutável com produtos, imagens, variações e classificações
+(modelos de leitura de read_models.py, dicts por id e os grupos da home já montados na
+ordem de display_order). Em regime, a home, a página de produto, o /api/check-stock e o painel
+admin não fazem I/O de banco: só conferem se a versão mudou.
+
+Versões:
+  * catálogo — catalog_generation (rotas admin) → reconstrução completa;
+  * estoque  — stock_version (reservas, varredor) → atualização incremental: relê só
+    products.revision e recarrega os produtos cuja revisão mudou.
+
+Os contadores acima são arquivos no CACHE_DIR (stat a cada request; vale para um host).
+No PostgreSQL, gatilhos de statement publicam `NOTIFY catalog_changes` em qualquer escrita
+nas tabelas do catálogo (inclusive de scripts ou de outros hosts), e uma thread por worker
+escuta o canal (CATALOG_SNAPSHOT_NOTIFY=0 desliga) — os eventos entram na versão junto
+com os contadores. No SQLite, só os contadores.
+
+Medição de tempo de reconstrução e memória: python -m benchmarks.catalog_snapshot
+"""
+
+import logging
+import os
+import select as select_module
+import threading
+import time
+
+from sqlalchemy import table, column, select, Boolean, DateTime
+
+from cache_service import catalog_generation, stock_version
+from read_models import ClassificationRecord, ImageRecord, VariantRecord, ProductRecord, Group
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SNAPSHOT_NOTIFY = os.environ.get("CATALOG_SNAPSHOT_NOTIFY", "true").lower() in ("1", "true", "yes")
+NOTIFY_CHANNEL = "catalog_changes"
+LISTEN_POLL_SECONDS = 30
+LISTEN_RETRY_SECONDS = 5
+# ids por cláusula IN na atualização incremental
+REFRESH_CHUNK = 500
+
+# tabelas em Core "leve": o módulo não depende dos modelos ORM do app
+products = table(
+    "products",
+    column("id"), column("name"), column("description"), column("price"), column("discount_price"),
+    column("category"), column("total_stock"), column("classification_id"), column("revision"), column("updated_at", DateTime),
+)
+product_images = table("product_images", column("id"), column("product_id"), column("image_url"), column("srcset"))
+product_stock = table(
+    "product_stock",
+    column("id"), column("product_id"), column("size"), column("color"),
+    column("quantity"), column("price"), column("is_available", Boolean),
+)
+classifications = table("classifications", column("id"), column("name"), column("display_order"))
+
+
+class Snapshot:
+    """Catálogo imutável de uma versão (catálogo, estoque). Nunca é alterado depois de criado."""
+
+    __slots__ = (
+        "catalog_version", "stock_version", "products", "variants", "product_list",
+        "classifications", "groups", "groups_in_stock", "built_at",
+    )
+
+    def __init__(self, catalog_version, stock_version, products_by_id, classification_list):
+        self.catalog_version = catalog_version
+        self.stock_version = stock_version
+        self.products = products_by_id  # id -> ProductRecord, em ordem de id
+        self.product_list = tuple(products_by_id.values())
+        self.variants = {v.id: v for p in self.product_list for v in p.stock_variants}
+        self.classifications = classification_list
+        self.groups = _group(self.product_list, classification_list)
+        self.groups_in_stock = _group([p for p in self.product_list if p.in_stock], classification_list)
+        self.built_at = time.time()
+
+    @property
+    def stock_tag(self):
+        """Identifica a versão do estoque (ETag e campo `version` do /api/check-stock)."""
+        counter, events = self.stock_version
+        return counter if not events else f"{counter}.{events}"
+
+    def stock_map(self, variant_ids):
+        """Quantidade por variante; ausentes = 0."""
+        variants = self.variants
+        return {vid: (variants[vid].quantity if vid in variants else 0) for vid in variant_ids}
+
+    def stats(self):
+        return {
+            "products": len(self.products),
+            "variants": len(self.variants),
+            "images": sum(len(p.images) for p in self.product_list),
+            "classifications": len(self.classifications),
+            "catalog_version": list(self.catalog_version),
+            "stock_version": list(self.stock_version),
+            "age_s": round(time.time() - self.built_at, 1),
+        }
+
+
+def _group(product_list, classification_list):
+    """Produtos por classificação na ordem de display_order; sem classificação vão para "Outros"."""
+    by_classification = {}
+    for p in product_list:
+        by_classification.setdefault(p.classification_id, []).append(p)
+    groups = [
+        Group(c.id, c.name, tuple(by_classification[c.id]))
+        for c in classification_list if c.id in by_classification
+    ]
+    known = {c.id for c in classification_list}
+    orphans = [p for cid, items in by_classification.items() if cid is None or cid not in known for p in items]
+    if orphans:
+        groups.append(Group(None, "Outros", tuple(sorted(orphans, key=lambda p: p.id))))
+    return tuple(groups)
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), REFRESH_CHUNK):
+        yield ids[start:start + REFRESH_CHUNK]
+
+
+def _load_products(conn, classification_by_id, product_ids=None):
+    """ProductRecord por id (todos, ou só `product_ids`), com imagens e variações."""
+    product_rows, image_rows, variant_rows = [], [], []
+    for chunk in (_chunks(product_ids) if product_ids is not None else [None]):
+        p_stmt = select(products).order_by(products.c.id)
+        i_stmt = select(product_images).order_by(product_images.c.product_id, product_images.c.id)
+        v_stmt = select(product_stock).order_by(product_stock.c.product_id, product_stock.c.id)
+        if chunk is not None:
+            p_stmt = p_stmt.where(products.c.id.in_(chunk))
+            i_stmt = i_stmt.where(product_images.c.product_id.in_(chunk))
+            v_stmt = v_stmt.where(product_stock.c.product_id.in_(chunk))
+        product_rows.extend(conn.execute(p_stmt))
+        image_rows.extend(conn.execute(i_stmt))
+        variant_rows.extend(conn.execute(v_stmt))
+
+    images, variants = {}, {}
+    for r in image_rows:
+        images.setdefault(r.product_id, []).append(ImageRecord.from_row(r))
+    for r in variant_rows:
+        variants.setdefault(r.product_id, []).append(VariantRecord.from_row(r))
+    return {
+        r.id: ProductRecord.from_row(
+            r, classification_by_id.get(r.classification_id),
+            tuple(images.get(r.id, ())), tuple(variants.get(r.id, ())),
+        )
+        for r in product_rows
+    }
+
+
+class PgCatalogListener:
+    """
+    LISTEN no canal do catálogo, numa conexão dedicada (fora do pool), em uma thread
+    daemon por worker. Cada NOTIFY incrementa o contador de eventos "catalog" ou "stock".
+    """
+
+    def __init__(self, engine, channel=NOTIFY_CHANNEL):
+        self.engine = engine
+        self.channel = channel
+        self.catalog_events = 0
+        self.stock_events = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        # (re)inicia após fork: threads não sobrevivem ao fork do gunicorn
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="catalog-listener", daemon=True).start()
+
+    def _on_event(self, payload):
+        if payload == "stock":
+            self.stock_events += 1
+        else:
+            self.catalog_events += 1
+
+    def _connect(self):
+        cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+        conn = self.engine.dialect.connect(*cargs, **cparams)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel}")
+        return conn
+
+    def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                # eventos perdidos enquanto desconectado: força uma reconstrução
+                self._on_event("catalog")
+                while True:
+                    if select_module.select([conn], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._on_event(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning("Escuta de alterações do catálogo interrompida: %s", e)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(LISTEN_RETRY_SECONDS)
+
+
+class CatalogReplica:
+    """Mantém o Snapshot do worker em dia com as versões do catálogo e do estoque."""
+
+    def __init__(self, engine, notify=CATALOG_SNAPSHOT_NOTIFY):
+        self.engine = engine
+        self.listener = PgCatalogListener(engine) if notify and engine.dialect.name == "postgresql" else None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.refreshes = 0
+        self.last_build_ms = None
+        self.last_refresh_ms = None
+
+    def _versions(self):
+        catalog_events = stock_events = 0
+        if self.listener is not None:
+            self.listener.ensure_started()
+            catalog_events, stock_events = self.listener.catalog_events, self.listener.stock_events
+        return (catalog_generation.get(), catalog_events), (stock_version.get(), stock_events)
+
+    def get(self, fresh=False):
+        """
+        Snapshot atual. Se outra thread já estiver atualizando, devolve o anterior sem esperar
+        (fresh=True espera — para o admin ver a própria alteração logo após o redirect).
+        """
+        catalog_v, stock_v = self._versions()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.catalog_version == catalog_v and snapshot.stock_version == stock_v:
+            return snapshot
+        if not self._lock.acquire(blocking=snapshot is None or fresh):
+            return snapshot
+        try:
+            # versões lidas ANTES de consultar o banco: uma escrita concorrente gera nova atualização
+            catalog_v, stock_v = self._versions()
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.catalog_version != catalog_v:
+                snapshot = self._build(catalog_v, stock_v)
+            elif snapshot.stock_version != stock_v:
+                snapshot = self._refresh_stock(snapshot, stock_v)
+            self._snapshot = snapshot
+            return snapshot
+        finally:
+            self._lock.release()
+
+    def _build(self, catalog_v, stock_v):
+        started = time.perf_counter()
+        with self.engine.connect() as conn:
+            classification_list = tuple(
+                ClassificationRecord.from_row(r)
+                for r in conn.execute(
+                    select(classifications).order_by(classifications.c.display_order, classifications.c.name)
+                )
+            )
+            by_id = _load_products(conn, {c.id: c for c in classification_list})
+        snapshot = Snapshot(catalog_v, stock_v, by_id, classification_list)
+        self.builds += 1
+        self.last_build_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.debug("Snapshot do catálogo reconstruído em %.1f ms (%d produtos)", self.last_build_ms, len(by_id))
+        return snapshot
+
+    def _refresh_stock(self, snapshot, stock_v):
+        """Recarrega só os produtos cuja revisão mudou (baixas/devoluções de estoque)."""
+        started = time.perf_counter()
+        with self.engine.connect() as conn:
+            revisions = dict(conn.execute(select(products.c.id, products.c.revision)).all())
+            if revisions.keys() != snapshot.products.keys():
+                # produto criado/apagado fora das rotas admin: reconstrução completa
+                return self._build(snapshot.catalog_version, stock_v)
+            changed = [pid for pid, rev in revisions.items() if snapshot.products[pid].revision != rev]
+            reloaded = _load_products(conn, {c.id: c for c in snapshot.classifications}, changed) if changed else {}
+        by_id = {pid: reloaded.get(pid, record) for pid, record in snapshot.products.items()}
+        refreshed = Snapshot(snapshot.catalog_version, stock_v, by_id, snapshot.classifications)
+        self.refreshes += 1
+        self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 2)
+        return refreshed
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "builds": self.builds,
+            "refreshes": self.refreshes,
+            "last_build_ms": self.last_build_ms,
+            "last_refresh_ms": self.last_refresh_ms,
+            "listening": self.listener is not None,
+            "snapshot": snapshot.stats() if snapshot is not None else None,
+        }
+
+
+# gatilhos de statement: uma notificação por comando (e o PostgreSQL junta as iguais na
+# mesma transação). Alterações de quantidade/revisão são "stock" (atualização incremental);
+# o resto é "catalog" (reconstrução).
+_PG_SETUP = [
+    """
+    CREATE OR REPLACE FUNCTION catalog_notify() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+      PERFORM pg_notify('catalog_changes', TG_ARGV[0]);
+      RETURN NULL;
+    END $$
+    """,
+    "DROP TRIGGER IF EXISTS catalog_notify_products ON products",
+    """
+    CREATE TRIGGER catalog_notify_products
+    AFTER INSERT OR DELETE OR UPDATE OF name, description, price, discount_price, category, classification_id
+    ON products FOR EACH STATEMENT EXECUTE FUNCTION catalog_notify('catalog')
+    """,
+    "DROP TRIGGER IF EXISTS catalog_notify_products_revision ON products",
+    """
+    CREATE TRIGGER catalog_notify_products_revision
+    AFTER UPDATE OF revision, total_stock ON products FOR EACH STATEMENT EXECUTE FUNCTION catalog_notify('stock')
+    """,
+    "DROP TRIGGER IF EXISTS catalog_notify_product_stock ON product_stock",
+    """
+    CREATE TRIGGER catalog_notify_product_stock
+    AFTER INSERT OR DELETE ON product_stock FOR EACH STATEMENT EXECUTE FUNCTION catalog_notify('catalog')
+    """,
+    "DROP TRIGGER IF EXISTS catalog_notify_product_stock_update ON product_stock",
+    """
+    CREATE TRIGGER catalog_notify_product_stock_update
+    AFTER UPDATE ON product_stock FOR EACH STATEMENT EXECUTE FUNCTION catalog_notify('stock')
+    """,
+    "DROP TRIGGER IF EXISTS catalog_notify_product_images ON product_images",
+    """
+    CREATE TRIGGER catalog_notify_product_images
+    AFTER INSERT OR UPDATE OR DELETE ON product_images FOR EACH STATEMENT EXECUTE FUNCTION catalog_notify('catalog')
+    """,
+    "DROP TRIGGER IF EXISTS catalog_notify_classifications ON classifications",
+    """
+    CREATE TRIGGER catalog_notify_classifications
+    AFTER INSERT OR UPDATE OR DELETE ON classifications FOR EACH STATEMENT EXECUTE FUNCTION catalog_notify('catalog')
+    """,
+]
+
+
+def setup_snapshot_schema(engine):
+    """Cria os gatilhos de NOTIFY no PostgreSQL (comando init-db). Retorna False se indisponível."""
+    if engine.dialect.name != "postgresql":
+        return False
+    try:
+        with engine.begin() as conn:
+            for statement in _PG_SETUP:
+                conn.exec_driver_sql(statement)
+        return True
+    except Exception as e:
+        logger.warning("Gatilhos de NOTIFY do catálogo indisponíveis (%s); só contadores locais", e)
+        return False
@@ -0,0 +1,195 @@
+"""
+Compressão das respostas dinâmicas (HTML, JSON, texto) conforme o Accept-Encoding.
+
+Negocia brotli (se o módulo estiver instalado) ou gzip e comprime:
+  * respostas comuns de uma vez (Content-Length passa a ser o tamanho comprimido);
+  * respostas em stream (geradores, Server-Sent Events) pedaço a pedaço, sem juntar o
+    corpo em memória; no text/event-stream cada evento é enviado na hora (sync flush).
+
+Ficam de fora: send_file (arquivos de /static e /media — os assets de build já têm .br/.gz),
+respostas que já têm Content-Encoding, tipos já comprimidos (imagens, zip...), corpos
+menores que COMPRESSION_MIN_BYTES, Cache-Control: no-transform, HEAD, 204/206/304.
+
+O nível depende da classe da rota (COMPRESSION_GZIP_LEVELS / COMPRESSION_BR_LEVELS,
+"classe=nível,..."; nível 0 = não comprime essa classe):
+
+  * page   — páginas da loja (home, produto): as que mais pesam para o cliente no 3G;
+  * admin  — /admin/*: páginas muito grandes, nível menor para não pesar na CPU;
+  * api    — JSON/texto (/api/*, /metrics);
+  * stream — text/event-stream (envios pequenos e frequentes).
+
+Respostas comprimidas recebem ETag fraco (W/"..."), como o gzip do nginx: a mesma versão
+tem bytes diferentes por codificação. If-None-Match continua valendo (comparação fraca).
+
+Medição de bytes e CPU: python -m benchmarks.compression
+"""
+
+import logging
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+DEFAULT_GZIP_LEVELS = {"page": 6, "admin": 4, "api": 6, "stream": 1}
+DEFAULT_BR_LEVELS = {"page": 5, "admin": 4, "api": 5, "stream": 1}
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/javascript", "application/xml",
+    "application/rss+xml", "application/atom+xml", "image/svg+xml",
+)
+STREAM_TYPES = ("text/event-stream",)
+
+
+def _parse_levels(value, defaults, maximum):
+    """"page=6,admin=4" sobre os padrões; entradas inválidas são ignoradas (com aviso)."""
+    levels = dict(defaults)
+    for item in (value or "").split(","):
+        name, _, level = item.strip().partition("=")
+        if not name:
+            continue
+        try:
+            level = int(level)
+        except ValueError:
+            level = -1
+        if name not in levels or not 0 <= level <= maximum:
+            logger.warning("Nível de compressão inválido ignorado: %r", item)
+            continue
+        levels[name] = level
+    return levels
+
+
+GZIP_LEVELS = _parse_levels(os.environ.get("COMPRESSION_GZIP_LEVELS"), DEFAULT_GZIP_LEVELS, 9)
+BR_LEVELS = _parse_levels(os.environ.get("COMPRESSION_BR_LEVELS"), DEFAULT_BR_LEVELS, 11)
+
+
+class _GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: cabeçalho gzip
+
+    def compress(self, data):
+        return self._z.compress(data)
+
+    def flush(self):
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._z.flush()
+
+
+class _BrotliEncoder:
+    name = "br"
+
+    def __init__(self, level):
+        self._b = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._b.process(data)
+
+    def flush(self):
+        return self._b.flush()
+
+    def finish(self):
+        return self._b.finish()
+
+
+def _encoders():
+    """(encoder, níveis por classe) disponíveis, na ordem de preferência."""
+    encoders = []
+    if brotli is not None:
+        encoders.append((_BrotliEncoder, BR_LEVELS))
+    encoders.append((_GzipEncoder, GZIP_LEVELS))
+    return encoders
+
+
+def route_class(path, mimetype):
+    if mimetype in STREAM_TYPES:
+        return "stream"
+    if path == "/admin" or path.startswith("/admin/"):
+        return "admin"
+    if path.startswith("/api/") or not mimetype.startswith("text/html"):
+        return "api"
+    return "page"
+
+
+def compressible(response):
+    """A resposta pode ser comprimida (independente do cliente)?"""
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or "Content-Encoding" in response.headers:
+        return False
+    if response.cache_control.no_transform:
+        return False
+    mimetype = response.mimetype or ""
+    if not mimetype.startswith(COMPRESSIBLE_TYPES):
+        return False
+    if not response.is_streamed:
+        length = response.calculate_content_length()
+        if length is not None and length < COMPRESSION_MIN_BYTES:
+            return False
+    return True
+
+
+def _compress_stream(original, chunks, encoder, flush_each):
+    try:
+        for chunk in chunks:
+            data = encoder.compress(chunk)
+            if flush_each:
+                data += encoder.flush()
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        # o Response fecha este gerador; repassa ao iterável original (stream_with_context etc.)
+        close = getattr(original, "close", None)
+        if close is not None:
+            close()
+
+
+def compress_response(response, accept_encodings, path):
+    """Comprime `response` no lugar (se couber) e devolve a codificação usada ou None."""
+    if not compressible(response):
+        return None
+    # a resposta varia com o Accept-Encoding mesmo quando este cliente leva sem compressão
+    response.vary.add("Accept-Encoding")
+    klass = route_class(path, response.mimetype)
+    available = {cls.name: (cls, levels[klass]) for cls, levels in _encoders() if levels[klass] > 0}
+    chosen = accept_encodings.best_match(list(available)) if available else None
+    if chosen is None:
+        return None
+    cls, level = available[chosen]
+    encoder = cls(level)
+
+    if response.is_streamed:
+        original = response.response
+        response.response = _compress_stream(original, response.iter_encoded(), encoder, klass == "stream")
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(encoder.compress(response.get_data()) + encoder.finish())
+    response.headers["Content-Encoding"] = chosen
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return chosen
+
+
+def init_app(app):
+    """Registra a compressão das respostas (after_request) no app Flask."""
+    from flask import request
+
+    if not COMPRESSION_ENABLED:
+        return
+
+    @app.after_request
+    def _compress(response):
+        if request.method != "HEAD":
+            compress_response(response, request.accept_encodings, request.path)
+        return response
@@ -0,0 +1,277 @@
+"""
+Remoção de objetos do Storage em segundo plano, via outbox no banco.
+
+As rotas admin não chamam mais o Storage durante a requisição. Na MESMA transação
+que apaga as linhas de product_images, gravam as URLs a remover em
+`storage_deletions`; depois do commit, acordam o DeletionQueue deste worker, que:
+
+  * reivindica um lote de pendências (UPDATE condicional com um token, seguro entre workers);
+  * agrupa por backend e remove cada grupo com UMA chamada (remove([...]) no Supabase);
+  * apaga as linhas concluídas; falhas ficam na tabela com backoff e são tentadas de novo.
+
+Se o processo morrer no meio, nada se perde: a pendência continua na tabela.
+
+O varredor de órfãos compara o conteúdo do bucket com product_images (image_url e
+srcset) e enfileira as sobras. Objetos mais novos que STORAGE_ORPHAN_GRACE_SECONDS são
+ignorados (upload feito antes do commit da linha correspondente).
+
+Uso manual:
+    python deletion_service.py drain
+    python deletion_service.py sweep-orphans [--dry-run]
+"""
+
+import argparse
+import fcntl
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, table, column, select, update, insert, delete, or_
+
+from cache_service import CACHE_DIR
+from logging_config import configure_logging
+from image_service import parse_srcset
+from storage_service import backend_for_url, storage
+
+logger = logging.getLogger(__name__)
+
+STORAGE_DELETE_BATCH = 100
+STORAGE_DELETE_MAX_ATTEMPTS = 8
+STORAGE_DELETE_LEASE_SECONDS = 300
+STORAGE_DRAIN_SECONDS = int(os.environ.get("STORAGE_DRAIN_SECONDS", "60"))
+STORAGE_ORPHAN_SWEEP_SECONDS = int(os.environ.get("STORAGE_ORPHAN_SWEEP_SECONDS", str(6 * 3600)))
+STORAGE_ORPHAN_GRACE_SECONDS = int(os.environ.get("STORAGE_ORPHAN_GRACE_SECONDS", "3600"))
+
+# tabelas em Core "leve": o serviço não depende dos modelos ORM do app
+product_images = table("product_images", column("id"), column("image_url"), column("srcset"))
+storage_deletions = table(
+    "storage_deletions",
+    column("id"), column("url"), column("attempts"), column("last_error"),
+    column("claim"), column("next_attempt_at"), column("created_at"),
+)
+
+
+def enqueue(conn, urls):
+    """Grava as URLs na outbox (na transação de `conn`), ignorando as já pendentes."""
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return 0
+    pending = set(conn.execute(select(storage_deletions.c.url).where(storage_deletions.c.url.in_(urls))).scalars())
+    now = datetime.utcnow()
+    rows = [
+        {"url": url, "attempts": 0, "next_attempt_at": now, "created_at": now}
+        for url in urls if url not in pending
+    ]
+    if rows:
+        conn.execute(insert(storage_deletions), rows)
+    return len(rows)
+
+
+def unreferenced_urls(conn, image_ids, urls):
+    """Das `urls`, as que nenhuma imagem fora de `image_ids` usa (como original ou derivado)."""
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return []
+    # uma consulta para o lote inteiro; o LIKE no srcset só pré-filtra (autoescape: "_" e "%"
+    # dos nomes de arquivo são literais), a comparação exata é feita com o srcset já separado
+    query = select(product_images.c.image_url, product_images.c.srcset).where(
+        or_(product_images.c.image_url.in_(urls), *(product_images.c.srcset.contains(u, autoescape=True) for u in urls))
+    )
+    if image_ids:
+        query = query.where(product_images.c.id.not_in(list(image_ids)))
+    referenced = set()
+    for image_url, srcset in conn.execute(query):
+        referenced.add(image_url)
+        referenced.update(url for _, url in parse_srcset(srcset))
+    return [url for url in urls if url not in referenced]
+
+
+def _claim(engine, limit):
+    """Reivindica até `limit` pendências vencidas; retorna [(id, url, attempts)]."""
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        due = (
+            select(storage_deletions.c.id)
+            .where(storage_deletions.c.next_attempt_at <= now)
+            .order_by(storage_deletions.c.id)
+            .limit(limit)
+        )
+        ids = list(conn.execute(due).scalars())
+        if not ids:
+            return []
+        # só leva quem ainda está vencido (outro worker pode ter reivindicado no meio tempo)
+        conn.execute(
+            update(storage_deletions)
+            .where(storage_deletions.c.id.in_(ids), storage_deletions.c.next_attempt_at <= now)
+            .values(claim=token, next_attempt_at=now + timedelta(seconds=STORAGE_DELETE_LEASE_SECONDS))
+        )
+        return conn.execute(
+            select(storage_deletions.c.id, storage_deletions.c.url, storage_deletions.c.attempts)
+            .where(storage_deletions.c.claim == token)
+        ).all()
+
+
+def drain(engine, batch_size=STORAGE_DELETE_BATCH):
+    """Processa a outbox até esvaziar as pendências vencidas. Retorna (removidas, falhas)."""
+    removed = failed = 0
+    while True:
+        rows = _claim(engine, batch_size)
+        if not rows:
+            return removed, failed
+        # a URL pode ter voltado a ser usada (mesmo conteúdo reenviado no armazenamento local)
+        with engine.connect() as conn:
+            free = set(unreferenced_urls(conn, [], [row.url for row in rows]))
+        groups = {}
+        for row in rows:
+            if row.url in free:
+                groups.setdefault(backend_for_url(row.url), []).append(row)
+        reused = [row.id for row in rows if row.url not in free]
+        if reused:
+            with engine.begin() as conn:
+                conn.execute(delete(storage_deletions).where(storage_deletions.c.id.in_(reused)))
+        for backend, group in groups.items():
+            ids = [row.id for row in group]
+            try:
+                if backend is not None:  # URL de nenhum backend conhecido: só descarta
+                    backend.delete_many([row.url for row in group])
+            except Exception as e:
+                failed += len(group)
+                logger.warning("Falha ao remover %d objeto(s) do Storage: %s", len(group), e)
+                with engine.begin() as conn:
+                    for row in group:
+                        attempts = (row.attempts or 0) + 1
+                        if attempts >= STORAGE_DELETE_MAX_ATTEMPTS:
+                            logger.error("Desistindo de remover %s após %d tentativas", row.url, attempts)
+                        # backoff exponencial: 1, 2, 4, ... minutos (máx. ~4h)
+                        delay = 60 * 2 ** min(attempts - 1, 8)
+                        conn.execute(
+                            update(storage_deletions).where(storage_deletions.c.id == row.id).values(
+                                attempts=attempts, last_error=str(e)[:500], claim=None,
+                                next_attempt_at=datetime.utcnow() + timedelta(
+                                    seconds=delay if attempts < STORAGE_DELETE_MAX_ATTEMPTS else 365 * 24 * 3600
+                                ),
+                            )
+                        )
+                continue
+            with engine.begin() as conn:
+                conn.execute(delete(storage_deletions).where(storage_deletions.c.id.in_(ids)))
+            removed += len(group)
+
+
+def find_orphans(engine, backend=None, grace_seconds=STORAGE_ORPHAN_GRACE_SECONDS):
+    """URLs de objetos do bucket que nenhuma product_image referencia (nem estão na outbox)."""
+    backend = backend or storage
+    with engine.connect() as conn:
+        referenced = set()
+        for image_url, srcset in conn.execute(select(product_images.c.image_url, product_images.c.srcset)):
+            referenced.add(backend.key_for_url(image_url))
+            referenced.update(backend.key_for_url(url) for _, url in parse_srcset(srcset))
+        referenced.update(backend.key_for_url(url) for url in conn.execute(select(storage_deletions.c.url)).scalars())
+    cutoff = time.time() - grace_seconds
+    return [
+        backend.url_for_key(key)
+        for key, mtime in backend.list_objects()
+        if key not in referenced and mtime and mtime < cutoff
+    ]
+
+
+def sweep_orphans(engine, backend=None, dry_run=False):
+    """Enfileira (e remove em lote) os órfãos do bucket. Retorna a lista de URLs órfãs."""
+    orphans = find_orphans(engine, backend)
+    if orphans and not dry_run:
+        with engine.begin() as conn:
+            enqueue(conn, orphans)
+        drain(engine)
+    return orphans
+
+
+class DeletionQueue:
+    """Thread daemon (uma por worker) que drena a outbox e, periodicamente, varre órfãos."""
+
+    def __init__(self, engine, interval=STORAGE_DRAIN_SECONDS, orphan_interval=STORAGE_ORPHAN_SWEEP_SECONDS):
+        self.engine = engine
+        self.interval = interval
+        self.orphan_interval = orphan_interval
+        self._wake = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+        self._last_orphan_sweep = time.monotonic()
+
+    def ensure_started(self):
+        # (re)inicia após fork: threads não sobrevivem ao fork do gunicorn
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="storage-deletions", daemon=True).start()
+
+    def kick(self):
+        """Chamar depois do commit que enfileirou remoções."""
+        self.ensure_started()
+        self._wake.set()
+
+    def _sweep_orphans_once(self):
+        # um único worker varre por vez (lock de arquivo entre processos)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(os.path.join(CACHE_DIR, "orphan-sweep.lock"), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            try:
+                orphans = sweep_orphans(self.engine)
+                if orphans:
+                    logger.info("%d objeto(s) órfão(s) removido(s) do Storage", len(orphans))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                drain(self.engine)
+                if self.orphan_interval and time.monotonic() - self._last_orphan_sweep >= self.orphan_interval:
+                    self._last_orphan_sweep = time.monotonic()
+                    self._sweep_orphans_once()
+            except Exception as e:
+                logger.warning("Falha ao processar remoções do Storage: %s", e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remoções pendentes e órfãos do Storage")
+    parser.add_argument("command", choices=["drain", "sweep-orphans"])
+    parser.add_argument("--dry-run", action="store_true", help="só lista os órfãos")
+    parser.add_argument("--database-url", default=None, help="padrão: DATABASE_URL do ambiente/.env")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    load_dotenv()
+    database_url = args.database_url or os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("[error] Configure DATABASE_URL no .env")
+        return 2
+    engine = create_engine(database_url, future=True)
+
+    if args.command == "drain":
+        removed, failed = drain(engine)
+        print(f"[info] {removed} objeto(s) removido(s), {failed} falha(s)")
+        return 1 if failed else 0
+
+    orphans = sweep_orphans(engine, dry_run=args.dry_run)
+    for url in orphans:
+        print(url)
+    print(f"[info] {len(orphans)} objeto(s) órfão(s){' (dry-run, nada removido)' if args.dry_run else ' removido(s)'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Configuração de produção do Gunicorn (lida automaticamente por `gunicorn` na raiz do projeto).
+
+    gunicorn "app:create_app()"        # ou só `gunicorn`, que usa wsgi_app abaixo
+
+  * preload: o master importa e inicializa o app uma vez; os workers herdam o código por
+    copy-on-write (boot mais rápido, menos memória). As conexões abertas no master são
+    fechadas antes do fork (when_ready) e o pool herdado é descartado em cada worker (post_fork).
+  * gthread: as rotas passam boa parte do tempo esperando I/O (banco, ViaCEP/Nominatim,
+    Storage), então cada worker atende GUNICORN_THREADS requisições ao mesmo tempo.
+  * workers/threads derivados das CPUs disponíveis para o processo (afinidade e limite de
+    CPU do container/cgroup, não as CPUs do host) e limitados pelo orçamento de conexões do
+    banco: workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW + 1 do LISTEN do catálogo) <= DB_MAX_CONNECTIONS.
+    Tudo ajustável por variáveis de ambiente:
+
+    WEB_CONCURRENCY         nº de workers (explícito: ignora os limites abaixo)
+    GUNICORN_MAX_WORKERS    teto do nº de workers calculado (padrão 8)
+    DB_MAX_CONNECTIONS      conexões ao banco que o app pode usar, somando todos os workers
+                            (padrão 30: o Postgres do Supabase aceita poucas dezenas)
+    GUNICORN_WORKER_CLASS   gthread (padrão), sync ou gevent (requer o pacote gevent)
+    GUNICORN_THREADS        threads por worker no gthread (padrão 4)
+    GUNICORN_PRELOAD        1/0 (padrão 1)
+    GUNICORN_TIMEOUT, GUNICORN_MAX_REQUESTS, PORT / FLASK_PORT, GUNICORN_BIND
+
+O pool do SQLAlchemy (DB_POOL_SIZE) acompanha as threads de cada worker e o overflow
+(DB_MAX_OVERFLOW) cobre as threads de fundo (varredor de reservas, outbox do Storage), se não
+forem definidos.
+"""
+
+import math
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def available_cpus():
+    """CPUs que este processo pode usar: afinidade e cota de CPU do cgroup (docker --cpus)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS
+        cpus = os.cpu_count() or 1
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:  # cgroup v2: "<quota> <período>" ou "max <período>"
+            value, period = f.read().split()
+            if value != "max":
+                quota = int(value) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f, open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as g:
+                value, period = int(f.read()), int(g.read())
+                if value > 0:
+                    quota = value / period
+        except (OSError, ValueError):
+            pass
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+cpus = available_cpus()
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+if worker_class == "gthread":
+    threads = _env_int("GUNICORN_THREADS", 4)
+    cpu_workers = cpus + 1
+elif worker_class == "gevent":
+    worker_connections = _env_int("GUNICORN_WORKER_CONNECTIONS", 200)
+    cpu_workers = cpus + 1
+else:
+    threads = 1
+    cpu_workers = 2 * cpus + 1
+
+# uma conexão por thread; o overflow cobre as threads de fundo. Com gevent, o pool limita o banco
+os.environ.setdefault("DB_POOL_SIZE", str(5 if worker_class == "gevent" else threads))
+os.environ.setdefault("DB_MAX_OVERFLOW", "2")
+connections_per_worker = int(os.environ["DB_POOL_SIZE"]) + int(os.environ["DB_MAX_OVERFLOW"]) + 1
+db_workers = max(1, _env_int("DB_MAX_CONNECTIONS", 30) // connections_per_worker)
+workers = _env_int("WEB_CONCURRENCY", min(cpu_workers, db_workers, _env_int("GUNICORN_MAX_WORKERS", 8)))
+
+wsgi_app = "app:create_app()"
+bind = os.environ.get("GUNICORN_BIND") or f"0.0.0.0:{os.environ.get('PORT') or os.environ.get('FLASK_PORT', '5000')}"
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1").lower() in ("1", "true", "yes")
+timeout = _env_int("GUNICORN_TIMEOUT", 30)
+graceful_timeout = 20
+keepalive = 5
+# recicla workers periodicamente (vazamentos de memória), com jitter para não reiniciarem juntos
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 2000)
+max_requests_jitter = max_requests // 10
+
+
+def post_fork(server, worker):
+    # conexões abertas no master (create_app durante o preload) não podem ser compartilhadas
+    import app
+
+    app.dispose_engine_after_fork()
+
+
+def when_ready(server):
+    # roda no master antes de criar os workers: fecha as conexões abertas pelo preload,
+    # que o master não usa mais (cada worker abre as suas sob demanda)
+    if preload_app:
+        import app
+
+        if app.engine is not None:
+            app.engine.dispose()
@@ -0,0 +1,221 @@
+"""
+Derivados das imagens de produto, gerados no upload.
+
+O admin envia fotos de celular/prints de 1–1,5 MB e a vitrine mostrava o original em
+todo card. Para cada imagem enviada, este módulo gera versões menores:
+
+  * larguras IMAGE_DERIVATIVE_WIDTHS (nunca maiores que o original);
+  * reencodadas em WebP;
+  * sem metadados (EXIF/GPS, ICC, XMP) — a rotação do EXIF é aplicada antes.
+
+Os derivados vão para o Storage ao lado do original e ficam registrados em
+ProductImage.srcset ("url 320w, url 640w, ..."), pronto para `<img srcset sizes>`.
+
+O original também é público (página do produto, fallback sem srcset), então é
+reencodado no próprio formato, com a rotação aplicada e sem metadados. Perfis de cor
+são convertidos para sRGB antes de descartados. Um arquivo que o Pillow não consegue
+abrir não é publicado. Sem Pillow instalado, só o original é enviado, como veio (srcset vazio).
+"""
+
+import io
+import logging
+import os
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from werkzeug.datastructures import FileStorage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow é opcional
+    Image = None
+try:
+    from PIL import ImageCms
+except ImportError:  # Pillow sem littlecms: perfis de cor apenas descartados
+    ImageCms = None
+
+IMAGE_DERIVATIVE_WIDTHS = tuple(
+    int(w) for w in os.environ.get("IMAGE_DERIVATIVE_WIDTHS", "320,640,960,1280").split(",") if w.strip()
+)
+IMAGE_WEBP_QUALITY = int(os.environ.get("IMAGE_WEBP_QUALITY", "80"))
+IMAGE_ORIGINAL_QUALITY = int(os.environ.get("IMAGE_ORIGINAL_QUALITY", "90"))
+IMAGE_PROCESS_WORKERS = int(os.environ.get("IMAGE_PROCESS_WORKERS", "4"))
+# atributo `sizes` dos cards da vitrine (grade de 1 a 4 colunas)
+CARD_IMAGE_SIZES = "(min-width: 1024px) 25vw, (min-width: 640px) 50vw, 100vw"
+DETAIL_IMAGE_SIZES = "(min-width: 1024px) 50vw, 100vw"
+
+logger = logging.getLogger(__name__)
+
+if Image is not None:
+    # proteção contra "decompression bombs" (ex.: PNG minúsculo que descomprime para GBs)
+    Image.MAX_IMAGE_PIXELS = 50_000_000
+
+
+# formatos em que o original é regravado como veio; os demais (GIF, BMP, TIFF...) viram PNG
+ORIGINAL_FORMATS = {
+    "JPEG": ("image/jpeg", (".jpg", ".jpeg")),
+    "PNG": ("image/png", (".png",)),
+    "WEBP": ("image/webp", (".webp",)),
+}
+
+
+class InvalidImage(Exception):
+    """O arquivo enviado não é uma imagem que o Pillow consiga abrir."""
+
+
+class Derivative(NamedTuple):
+    width: int
+    path: str
+    file: FileStorage
+
+
+def derivative_path(path_on_storage, width):
+    """'products/legging_01.jpg' -> 'products/legging_01_w640.webp'"""
+    root, _ = posixpath.splitext(path_on_storage)
+    return f"{root}_w{width}.webp"
+
+
+def _target_widths(original_width, widths):
+    targets = {w for w in widths if w < original_width}
+    # o maior derivado nunca passa do original nem da maior largura configurada
+    targets.add(min(original_width, max(widths)))
+    return sorted(targets)
+
+
+def _to_srgb(img):
+    """Converte para sRGB se a imagem trouxer outro perfil de cor (o perfil não é gravado)."""
+    icc = img.info.get("icc_profile")
+    if not icc or ImageCms is None or img.mode not in ("RGB", "RGBA"):
+        return img
+    try:
+        source = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+        return ImageCms.profileToProfile(img, source, ImageCms.createProfile("sRGB"), outputMode=img.mode)
+    except (ImageCms.PyCMSError, OSError, ValueError) as e:
+        logger.debug("Perfil de cor ignorado: %s", e)
+        return img
+
+
+def strip_original(file_object, path_on_storage):
+    """
+    Reencoda a imagem enviada sem metadados (EXIF/GPS, XMP, ICC), já rotacionada.
+    Retorna (FileStorage, path): o path muda de extensão se o formato virar PNG.
+    Sem Pillow, devolve o arquivo como veio. Levanta InvalidImage se não for uma imagem.
+    """
+    if Image is None:
+        return file_object, path_on_storage
+    file_object.seek(0)
+    try:
+        with Image.open(file_object) as source:
+            fmt = source.format
+            img = ImageOps.exif_transpose(source)
+            img.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e)) from e
+    file_object.seek(0)
+
+    root, ext = posixpath.splitext(path_on_storage)
+    if fmt not in ORIGINAL_FORMATS:
+        fmt = "PNG"
+    content_type, extensions = ORIGINAL_FORMATS[fmt]
+    if ext.lower() not in extensions:
+        path_on_storage = root + extensions[0]
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    elif fmt == "WEBP" and img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    img = _to_srgb(img)
+
+    buffer = io.BytesIO()
+    # sem exif/icc_profile/xmp no save: nenhum metadado é gravado
+    if fmt == "JPEG":
+        img.save(buffer, "JPEG", quality=IMAGE_ORIGINAL_QUALITY, optimize=True, progressive=True)
+    elif fmt == "WEBP":
+        img.save(buffer, "WEBP", quality=IMAGE_ORIGINAL_QUALITY, method=4)
+    else:
+        save_args = {"transparency": img.info["transparency"]} if "transparency" in img.info else {}
+        img.save(buffer, "PNG", optimize=True, **save_args)
+    buffer.seek(0)
+    filename = getattr(file_object, "filename", None) or posixpath.basename(path_on_storage)
+    return FileStorage(stream=buffer, filename=filename, content_type=content_type), path_on_storage
+
+
+def build_derivatives(file_object, path_on_storage, widths=IMAGE_DERIVATIVE_WIDTHS):
+    """Gera os derivados WebP de uma imagem enviada. Retorna lista de Derivative (vazia sem Pillow)."""
+    if Image is None or not widths:
+        return []
+    file_object.seek(0)
+    derivatives = []
+    with Image.open(file_object) as source:
+        # JPEG: decodifica já reduzido (DCT scaling) quando o original é muito maior que o necessário
+        source.draft("RGB", (max(widths), max(widths)))
+        img = ImageOps.exif_transpose(source)
+        if img.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in img.getbands() or "transparency" in img.info
+            img = img.convert("RGBA" if has_alpha else "RGB")
+        img = _to_srgb(img)
+        for width in _target_widths(img.width, widths):
+            height = max(1, round(img.height * width / img.width))
+            resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            # sem exif/icc_profile no save: nenhum metadado é gravado
+            resized.save(buffer, "WEBP", quality=IMAGE_WEBP_QUALITY, method=4)
+            buffer.seek(0)
+            path = derivative_path(path_on_storage, width)
+            derivatives.append(Derivative(width, path, FileStorage(
+                stream=buffer, filename=posixpath.basename(path), content_type="image/webp"
+            )))
+    file_object.seek(0)
+    return derivatives
+
+
+def process_uploads_batch(uploads, max_workers=IMAGE_PROCESS_WORKERS):
+    """
+    Prepara vários arquivos enviados em paralelo (o Pillow libera o GIL ao decodificar e
+    redimensionar). `uploads` = [(file_object, path_on_storage), ...]; retorna, na mesma
+    ordem, (original sem metadados, path, derivados) — ou (None, path, []) para arquivos
+    que não são imagens válidas (não publicados).
+    """
+    def process(item):
+        file_object, path = item
+        name = getattr(file_object, 'filename', path)
+        try:
+            original, original_path = strip_original(file_object, path)
+        except InvalidImage as e:
+            logger.warning("Arquivo %s recusado: não é uma imagem válida (%s)", name, e)
+            return None, path, []
+        try:
+            derivatives = build_derivatives(file_object, original_path)
+        except Exception as e:
+            logger.warning("Não foi possível gerar derivados de %s: %s", name, e)
+            derivatives = []
+        return original, original_path, derivatives
+
+    if not uploads:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(uploads)))) as pool:
+        return list(pool.map(process, uploads))
+
+
+def format_srcset(entries):
+    """[(largura, url), ...] -> 'url 320w, url 640w' (ordenado por largura)."""
+    return ", ".join(f"{url} {width}w" for width, url in sorted(entries))
+
+
+def parse_srcset(srcset):
+    """'url 320w, url 640w' -> [(320, url), (640, url)]"""
+    entries = []
+    for candidate in (srcset or "").split(","):
+        parts = candidate.strip().rsplit(" ", 1)
+        if len(parts) == 2 and parts[1].endswith("w") and parts[1][:-1].isdigit():
+            entries.append((int(parts[1][:-1]), parts[0]))
+    return sorted(entries)
+
+
+def pick_derivative(srcset, min_width):
+    """URL do menor derivado com largura >= min_width (ou o maior disponível); None sem derivados."""
+    entries = parse_srcset(srcset)
+    for width, url in entries:
+        if width >= min_width:
+            return url
+    return entries[-1][1] if entries else None
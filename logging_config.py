@@ -0,0 +1,72 @@
+"""
+Logging estruturado, filtrado por nível (substitui os print("[info] ...") espalhados).
+
+    LOG_LEVEL=DEBUG|INFO|WARNING|ERROR   (padrão INFO)
+    LOG_FORMAT=text|json                 (padrão text)
+
+Os módulos usam `logger = logging.getLogger(__name__)` e formatação preguiçosa
+(`logger.debug("CEP %s", cep)`): abaixo do nível configurado a mensagem nem é montada.
+Campos passados em `extra={...}` saem como chave=valor (text) ou como chaves do JSON.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+
+# atributos padrão do LogRecord; o resto veio de `extra` e vira campo estruturado
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED and not key.startswith("_")}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created))
+        line = f"{stamp} [{record.levelname.lower()}] {record.name}: {record.getMessage()}"
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+_configured = False
+
+
+def configure_logging(level=None, fmt=None):
+    """Instala o handler em stderr no logger raiz (idempotente)."""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == "json" else TextFormatter())
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level or LOG_LEVEL)
+    # bibliotecas muito verbosas em DEBUG
+    for name in ("httpx", "httpcore", "urllib3"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    _configured = True
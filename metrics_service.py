@@ -0,0 +1,342 @@
+"""
+Métricas de desempenho no formato de texto do Prometheus (rota /metrics do app).
+
+Coletado em cada worker:
+
+  * http_request_duration_seconds{method,route,status} — histograma por rota (regra do Flask);
+  * db_queries_total / db_query_seconds_total{route}   — via eventos do engine do SQLAlchemy;
+  * http_client_request_duration_seconds{service,status} — chamadas a ViaCEP, Nominatim e
+    Supabase (track_outbound nos clientes HTTP);
+  * cache_requests_total{cache,result}                  — acertos/erros dos caches (coletores).
+
+Como o gunicorn tem vários workers, cada um grava um retrato das suas métricas em
+METRICS_DIR/<pid>.json (a cada METRICS_FLUSH_SECONDS, no máximo) e a rota /metrics soma
+os retratos de todos — qualquer worker que atender o scrape responde o total.
+
+Com SLOW_REQUEST_MS > 0, requisições mais lentas que o limite são registradas em log
+(WARNING) com o SQL executado e o tempo em chamadas externas.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from cache_service import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_DIR = os.environ.get("METRICS_DIR") or os.path.join(CACHE_DIR, "metrics")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "1"))
+# retratos de workers que não gravam há mais que isso são descartados (workers reciclados)
+METRICS_RETENTION_SECONDS = int(os.environ.get("METRICS_RETENTION_SECONDS", str(24 * 3600)))
+# /metrics só responde ao admin logado ou a quem enviar "Authorization: Bearer <METRICS_TOKEN>"
+# (o scraper do Prometheus); METRICS_PUBLIC=1 libera para qualquer um (opção explícita do operador)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN") or None
+METRICS_PUBLIC = os.environ.get("METRICS_PUBLIC", "false").lower() in ("1", "true", "yes")
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))
+SLOW_REQUEST_MAX_STATEMENTS = 50
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_HELP = {
+    "http_request_duration_seconds": ("histogram", "Tempo de resposta por rota"),
+    "db_queries_total": ("counter", "Consultas SQL executadas, por rota"),
+    "db_query_seconds_total": ("counter", "Tempo gasto em SQL, por rota"),
+    "http_client_request_duration_seconds": ("histogram", "Chamadas HTTP a serviços externos"),
+    "cache_requests_total": ("counter", "Consultas aos caches, por resultado"),
+}
+
+# rota de requests sem regra (404) e de trabalho fora de requests (threads em segundo plano)
+UNMATCHED_ROUTE = "<unmatched>"
+BACKGROUND_ROUTE = "<background>"
+
+
+class Registry:
+    """Contadores e histogramas deste worker (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (nome, labels) -> valor
+        self._histograms = {}  # (nome, labels) -> [contagens por bucket..., soma, contagem]
+        self._collectors = []
+
+    def inc(self, name, labels, value=1.0):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect_left(LATENCY_BUCKETS, value)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            if index < len(LATENCY_BUCKETS):
+                hist[index] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def register_collector(self, collector):
+        """`collector()` -> [(nome, labels, valor)], lido a cada retrato (ex.: stats de caches)."""
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(hist)] for (name, labels), hist in self._histograms.items()]
+        for collector in self._collectors:
+            try:
+                counters += [[name, sorted(labels.items()), value] for name, labels, value in collector()]
+            except Exception:
+                logger.exception("Falha em coletor de métricas")
+        return {"counters": counters, "histograms": histograms}
+
+
+registry = Registry()
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+_flusher_pid = None
+
+
+def _flusher():
+    # grava o que ficou pendente quando o worker para de receber requests
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        flush()
+
+
+def _ensure_flusher():
+    global _flusher_pid
+    # (re)inicia após fork: threads não sobrevivem ao fork do gunicorn
+    if _flusher_pid != os.getpid():
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flusher, name="metrics-flush", daemon=True).start()
+
+
+def flush(force=False):
+    """Grava o retrato deste worker em METRICS_DIR (no máximo a cada METRICS_FLUSH_SECONDS)."""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < METRICS_FLUSH_SECONDS:
+        return
+    if not _flush_lock.acquire(blocking=False):
+        return  # outra thread já está gravando
+    try:
+        _last_flush = now
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(tmp_path, os.path.join(METRICS_DIR, f"{os.getpid()}.json"))
+    except OSError as e:
+        logger.warning("Falha ao gravar métricas: %s", e)
+    finally:
+        _flush_lock.release()
+
+
+def _merged_snapshots():
+    counters, histograms = {}, {}
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        names = []
+    cutoff = time.time() - METRICS_RETENTION_SECONDS
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                continue
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric, labels, value in data["counters"]:
+            key = (metric, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0.0) + value
+        for metric, labels, hist in data["histograms"]:
+            key = (metric, tuple(tuple(pair) for pair in labels))
+            merged = histograms.setdefault(key, [0] * len(hist))
+            for i, value in enumerate(hist):
+                merged[i] += value
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render():
+    """Texto de exposição do Prometheus com as métricas somadas de todos os workers."""
+    flush(force=True)
+    counters, histograms = _merged_snapshots()
+    lines = []
+    by_name = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append(("counter", labels, value))
+    for (name, labels), hist in histograms.items():
+        by_name.setdefault(name, []).append(("histogram", labels, hist))
+    for name in sorted(by_name):
+        kind, help_text = METRICS_HELP.get(name, (by_name[name][0][0], name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for _, labels, value in sorted(by_name[name], key=lambda item: item[1]):
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {int(value[-1])}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {int(value[-1])}")
+    return "\n".join(lines) + "\n"
+
+
+# =========================================================================
+# REQUESTS, BANCO E CHAMADAS EXTERNAS
+# =========================================================================
+
+class RequestStats:
+    __slots__ = ("route", "started", "db_queries", "db_seconds", "outbound_seconds", "statements", "status")
+
+    def __init__(self, route, capture_sql):
+        self.route = route
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.outbound_seconds = 0.0
+        self.statements = [] if capture_sql else None
+        self.status = None
+
+
+_current = ContextVar("request_metrics", default=None)
+
+
+def current_request_stats():
+    """RequestStats do request em andamento nesta thread (None fora de requests)."""
+    return _current.get()
+
+
+def _on_before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _on_after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats = _current.get()
+    if stats is None:
+        registry.inc("db_queries_total", {"route": BACKGROUND_ROUTE})
+        registry.inc("db_query_seconds_total", {"route": BACKGROUND_ROUTE}, elapsed)
+        return
+    stats.db_queries += 1
+    stats.db_seconds += elapsed
+    if stats.statements is not None and len(stats.statements) < SLOW_REQUEST_MAX_STATEMENTS:
+        stats.statements.append((round(elapsed * 1000, 2), " ".join(statement.split())[:500]))
+
+
+def instrument_engine(engine):
+    """Conta consultas e tempo de SQL do engine (por rota, ou <background> fora de requests)."""
+    from sqlalchemy import event
+
+    if not METRICS_ENABLED or event.contains(engine, "before_cursor_execute", _on_before_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _on_before_execute)
+    event.listen(engine, "after_cursor_execute", _on_after_execute)
+
+
+def observe_outbound(service, seconds, status):
+    registry.observe("http_client_request_duration_seconds", {"service": service, "status": str(status)}, seconds)
+    stats = _current.get()
+    if stats is not None:
+        stats.outbound_seconds += seconds
+
+
+@contextmanager
+def track_outbound(service):
+    """
+    Mede uma chamada HTTP externa:
+        with track_outbound("viacep") as call:
+            resp = requests.get(...)
+            call["status"] = resp.status_code
+    Sem status atribuído (exceção/timeout), conta como "error".
+    """
+    call = {"status": "error"}
+    started = time.perf_counter()
+    try:
+        yield call
+    finally:
+        if METRICS_ENABLED:
+            observe_outbound(service, time.perf_counter() - started, call["status"])
+
+
+def init_app(app):
+    """Registra os hooks de request no app Flask."""
+    from flask import request
+
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _metrics_start():
+        rule = request.url_rule
+        _current.set(RequestStats(rule.rule if rule is not None else UNMATCHED_ROUTE, SLOW_REQUEST_MS > 0))
+
+    @app.after_request
+    def _metrics_status(response):
+        stats = _current.get()
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _metrics_finish(exc):
+        stats = _current.get()
+        if stats is None:
+            return
+        _current.set(None)
+        elapsed = time.perf_counter() - stats.started
+        status = stats.status or 500
+        registry.observe(
+            "http_request_duration_seconds", {"method": request.method, "route": stats.route, "status": str(status)},
+            elapsed,
+        )
+        if stats.db_queries:
+            registry.inc("db_queries_total", {"route": stats.route}, stats.db_queries)
+            registry.inc("db_query_seconds_total", {"route": stats.route}, stats.db_seconds)
+        if SLOW_REQUEST_MS > 0 and elapsed * 1000 >= SLOW_REQUEST_MS:
+            logger.warning(
+                "Request lento: %s %s", request.method, request.full_path.rstrip("?"),
+                extra={
+                    "route": stats.route, "status": status, "duration_ms": round(elapsed * 1000, 1),
+                    "db_queries": stats.db_queries, "db_ms": round(stats.db_seconds * 1000, 1),
+                    "outbound_ms": round(stats.outbound_seconds * 1000, 1), "sql": stats.statements,
+                },
+            )
+        _ensure_flusher()
+        flush()
@@ -1,117 +1,274 @@
 """
-Script de Migração de Imagens Locais para Supabase Storage
+Script de Migração de Imagens Locais para o Storage (Supabase ou local)
 
-Este script migra todas as imagens existentes em /static/images/ para o Supabase Storage
-e atualiza as URLs no banco de dados PostgreSQL.
+Migra as imagens de product_images que ainda apontam para arquivos em /static/images/
+para o backend de armazenamento configurado (STORAGE_BACKEND) e atualiza as URLs no banco.
 
-ATENÇÃO: Execute este script APENAS UMA VEZ após configurar o Supabase.
+Pode ser executado quantas vezes for preciso (não pergunta nada e retoma de onde parou):
+
+  * o caminho no Storage é o SHA-256 do conteúdo ("products/<sha256>.jpg"): arquivos
+    repetidos sobem uma vez só e reenviar o mesmo conteúdo é idempotente (upsert);
+  * os envios de cada lote são feitos em paralelo (--workers);
+  * as URLs são gravadas no banco a cada lote (--batch-size), com UPDATE condicional
+    (não sobrescreve uma imagem alterada pelo admin no meio tempo);
+  * o checkpoint (--checkpoint) guarda os hashes já calculados e os conteúdos já enviados,
+    então uma queda entre o upload e o commit não repete o envio;
+  * imagens que já apontam para o Storage são ignoradas;
+  * cada produto alterado ganha uma nova revisão (products.revision) e, ao final, a geração
+    do catálogo é incrementada: os caches de página do app deixam de servir as URLs antigas.
+
+Não importa o app (não conecta ao banco nem roda create_all ao importar).
+
+Uso:
+    python migrate_images_to_supabase.py [--dry-run] [--workers 8] [--batch-size 50]
+    python migrate_images_to_supabase.py --backend local   # grava em MEDIA_ROOT (testes)
 """
 
+import argparse
+import hashlib
+import json
+import mimetypes
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, select
-from sqlalchemy.orm import sessionmaker
-from app import Base, Product, ProductImage
-from supabase_service import upload_file_to_supabase
+from sqlalchemy import create_engine, table, column, select, update
 from werkzeug.datastructures import FileStorage
-import io
 
-# Carrega variáveis de ambiente
-load_dotenv()
-DATABASE_URL = os.environ.get("DATABASE_URL")
+STATIC_IMAGES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "images")
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "migrate_images.checkpoint.json")
+STORAGE_FOLDER = "products"
+HASH_CHUNK_SIZE = 256 * 1024
+
+# tabela em Core "leve": o script não depende dos modelos ORM do app
+product_images = table("product_images", column("id"), column("product_id"), column("image_url"))
+products = table("products", column("id"), column("revision"), column("updated_at"))
+
+
+class Checkpoint:
+    """Estado persistido entre execuções: hashes dos arquivos locais e conteúdos já enviados."""
+
+    def __init__(self, path):
+        self.path = path
+        self.hashes = {}    # caminho relativo -> [tamanho, mtime_ns, sha256]
+        self.uploaded = {}  # sha256 -> URL no Storage
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.hashes = data.get("hashes", {})
+            self.uploaded = data.get("uploaded", {})
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"hashes": self.hashes, "uploaded": self.uploaded}, f)
+        os.replace(tmp_path, self.path)  # troca atômica: nunca fica um checkpoint pela metade
+
+
+def is_migrated(url):
+    """Imagens com URL absoluta ou já servidas por /media não são arquivos de static/images."""
+    from storage_service import backend_for_url
+
+    return url.startswith(("http://", "https://")) or backend_for_url(url) is not None
+
+
+def local_path_for(images_dir, image_url):
+    """Caminho do arquivo em `images_dir`; None se a URL tentar sair da pasta."""
+    root = os.path.abspath(images_dir)
+    path = os.path.abspath(os.path.join(root, image_url.lstrip("/")))
+    return path if path.startswith(root + os.sep) else None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_cached(checkpoint, images_dir, path):
+    """SHA-256 do arquivo, reaproveitando o checkpoint se tamanho e mtime não mudaram."""
+    stat = os.stat(path)
+    rel = os.path.relpath(path, images_dir)
+    cached = checkpoint.hashes.get(rel)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2], stat.st_size
+    sha = file_sha256(path)
+    checkpoint.hashes[rel] = [stat.st_size, stat.st_mtime_ns, sha]
+    return sha, stat.st_size
+
 
-if not DATABASE_URL:
-    raise SystemExit("Configure DATABASE_URL no .env")
+def pending_images(engine):
+    """[(id, image_url)] das imagens que ainda apontam para arquivos locais."""
+    with engine.connect() as conn:
+        rows = conn.execute(select(product_images.c.id, product_images.c.image_url).order_by(product_images.c.id))
+        return [(row.id, row.image_url) for row in rows if row.image_url and not is_migrated(row.image_url)]
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
 
-STATIC_IMAGES_PATH = os.path.join(os.path.dirname(__file__), "static", "images")
+def _upload_batch(backend, files, workers):
+    """Envia {sha: caminho_local}; retorna ({sha: url}, nº de falhas)."""
+    uploads, handles = [], []
+    try:
+        for sha, path in files.items():
+            handle = open(path, "rb")
+            handles.append(handle)
+            ext = os.path.splitext(path)[1].lower()
+            uploads.append((
+                FileStorage(stream=handle, filename=os.path.basename(path),
+                            content_type=mimetypes.guess_type(path)[0] or "image/jpeg"),
+                f"{STORAGE_FOLDER}/{sha}{ext}",
+            ))
+        results = backend.upload_many(uploads, max_workers=workers, upsert=True)
+    finally:
+        for handle in handles:
+            handle.close()
+    urls, failed = {}, 0
+    for sha, result in zip(files, results):
+        if result.ok:
+            urls[sha] = result.url
+        else:
+            failed += 1
+            print(f"[error] Falha no upload de {files[sha]}: {result.error}")
+    return urls, failed
 
-def migrate_images():
+
+def migrate(engine, backend, images_dir=STATIC_IMAGES_PATH, checkpoint_path=DEFAULT_CHECKPOINT,
+            batch_size=50, workers=4, dry_run=False):
     """
-    Migra todas as imagens locais para o Supabase e atualiza as URLs no banco.
+    Migra as imagens locais para `backend` (qualquer objeto com upload_many, ex.: LocalStorage).
+    Retorna um dicionário com as contagens da execução.
     """
-    print("[info] Iniciando migração de imagens para Supabase...")
-    
-    if not os.path.exists(STATIC_IMAGES_PATH):
-        print(f"[error] Pasta não encontrada: {STATIC_IMAGES_PATH}")
-        return
-    
-    with SessionLocal() as db:
-        # Busca todas as imagens do banco
-        images = db.scalars(select(ProductImage)).all()
-        
-        migrated_count = 0
-        failed_count = 0
-        
-        for img in images:
-            # Verifica se a URL já é do Supabase
-            if img.image_url.startswith("http"):
-                print(f"[skip] Imagem já migrada: {img.image_url}")
-                continue
-            
-            # Caminho local da imagem
-            local_path = os.path.join(STATIC_IMAGES_PATH, img.image_url)
-            
-            if not os.path.exists(local_path):
-                print(f"[warn] Arquivo não encontrado: {local_path}")
-                failed_count += 1
-                continue
-            
-            try:
-                # Lê o arquivo local
-                with open(local_path, 'rb') as f:
-                    file_data = f.read()
-                
-                # Determina o content_type
-                ext = os.path.splitext(img.image_url)[1].lower()
-                content_type_map = {
-                    '.jpg': 'image/jpeg',
-                    '.jpeg': 'image/jpeg',
-                    '.png': 'image/png',
-                    '.webp': 'image/webp',
-                    '.gif': 'image/gif'
-                }
-                content_type = content_type_map.get(ext, 'image/jpeg')
-                
-                # Cria um objeto FileStorage simulado
-                file_storage = FileStorage(
-                    stream=io.BytesIO(file_data),
-                    filename=img.image_url,
-                    content_type=content_type
-                )
-                
-                # Faz upload para o Supabase
-                print(f"[info] Fazendo upload: {img.image_url}...")
-                public_url = upload_file_to_supabase(file_storage, folder_path="products")
-                
-                if public_url:
-                    # Atualiza a URL no banco
-                    img.image_url = public_url
-                    print(f"[success] Migrado: {img.image_url} -> {public_url}")
-                    migrated_count += 1
+    checkpoint = Checkpoint(checkpoint_path)
+    pending = pending_images(engine)
+    stats = {
+        "images": len(pending), "migrated": 0, "missing": 0, "failed": 0, "conflicts": 0,
+        "uploaded": 0, "reused": 0, "bytes": 0, "seconds": 0.0,
+    }
+    started = time.perf_counter()
+    print(f"[info] {len(pending)} imagem(ns) a migrar{' (dry-run)' if dry_run else ''}")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="hash") as hash_pool:
+        for start in range(0, len(pending), batch_size):
+            batch = []
+            for image_id, image_url in pending[start:start + batch_size]:
+                path = local_path_for(images_dir, image_url)
+                if path is None or not os.path.isfile(path):
+                    print(f"[warn] Arquivo não encontrado: {image_url}")
+                    stats["missing"] += 1
+                    continue
+                batch.append((image_id, image_url, path))
+
+            hashed = list(hash_pool.map(lambda item: _hash_cached(checkpoint, images_dir, item[2]), batch))
+            to_upload = {}
+            for (_, _, path), (sha, size) in zip(batch, hashed):
+                if sha in checkpoint.uploaded or sha in to_upload:
+                    stats["reused"] += 1
                 else:
-                    print(f"[error] Falha no upload: {img.image_url}")
-                    failed_count += 1
-                    
-            except Exception as e:
-                print(f"[error] Erro ao migrar {img.image_url}: {e}")
-                failed_count += 1
-        
-        # Salva todas as alterações
-        db.commit()
-        
-        print("\n" + "="*60)
-        print(f"[info] Migração concluída!")
-        print(f"[info] Imagens migradas com sucesso: {migrated_count}")
-        print(f"[info] Falhas: {failed_count}")
-        print("="*60)
+                    to_upload[sha] = path
+                    stats["bytes"] += size
+
+            if dry_run:
+                stats["uploaded"] += len(to_upload)
+                continue
+
+            urls, failed = _upload_batch(backend, to_upload, workers) if to_upload else ({}, 0)
+            stats["uploaded"] += len(urls)
+            stats["failed"] += failed
+            checkpoint.uploaded.update(urls)
+            # checkpoint antes do commit: se cair agora, a próxima execução não reenvia
+            checkpoint.save()
+
+            with engine.begin() as conn:
+                for (image_id, image_url, _), (sha, _) in zip(batch, hashed):
+                    url = checkpoint.uploaded.get(sha)
+                    if url is None:
+                        continue
+                    result = conn.execute(
+                        update(product_images)
+                        .where(product_images.c.id == image_id, product_images.c.image_url == image_url)
+                        .values(image_url=url)
+                    )
+                    if result.rowcount == 1:
+                        stats["migrated"] += 1
+                        product_id = select(product_images.c.product_id).where(product_images.c.id == image_id)
+                        conn.execute(
+                            update(products).where(products.c.id == product_id.scalar_subquery())
+                            .values(revision=products.c.revision + 1, updated_at=datetime.utcnow())
+                        )
+                    else:
+                        stats["conflicts"] += 1  # alterada/removida durante a migração
+
+            elapsed = time.perf_counter() - started
+            done = min(start + batch_size, len(pending))
+            print(
+                f"[info] {done}/{len(pending)} imagens | {done / elapsed:.1f} img/s | "
+                f"{stats['bytes'] / elapsed / 1024 / 1024:.2f} MB/s enviados"
+            )
+
+    if dry_run:
+        checkpoint.path = None  # dry-run não grava nada
+    checkpoint.save()
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migra imagens de static/images para o Storage")
+    parser.add_argument("--database-url", default=None, help="padrão: DATABASE_URL do ambiente/.env")
+    parser.add_argument("--backend", choices=["supabase", "local"], default=None,
+                        help="padrão: STORAGE_BACKEND do ambiente")
+    parser.add_argument("--images-dir", default=STATIC_IMAGES_PATH)
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--batch-size", type=int, default=50, help="imagens por commit")
+    parser.add_argument("--workers", type=int, default=4, help="uploads simultâneos")
+    parser.add_argument("--dry-run", action="store_true", help="só calcula o que seria enviado")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    database_url = args.database_url or os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("[error] Configure DATABASE_URL no .env")
+        return 2
+    if not os.path.isdir(args.images_dir):
+        print(f"[error] Pasta não encontrada: {args.images_dir}")
+        return 2
+
+    import storage_service
+
+    backend = {
+        "supabase": storage_service.supabase_storage, "local": storage_service.local_storage,
+    }.get(args.backend, storage_service.storage)
+    engine = create_engine(database_url, future=True)
+
+    stats = migrate(
+        engine, backend, images_dir=args.images_dir, checkpoint_path=args.checkpoint,
+        batch_size=max(1, args.batch_size), workers=max(1, args.workers), dry_run=args.dry_run,
+    )
+    if stats["migrated"]:
+        from cache_service import bump_catalog_generation
+
+        bump_catalog_generation()
+    print("\n" + "=" * 60)
+    print(f"[info] Migração {'simulada' if args.dry_run else 'concluída'} em {stats['seconds']:.1f}s ({backend.name})")
+    print(f"[info] Imagens pendentes: {stats['images']}")
+    print(f"[info] {'Seriam enviados' if args.dry_run else 'Enviados'}: {stats['uploaded']} arquivo(s), "
+          f"{stats['bytes'] / 1024 / 1024:.1f} MB ({stats['reused']} reaproveitado(s) por conteúdo repetido)")
+    if not args.dry_run:
+        print(f"[info] URLs atualizadas: {stats['migrated']} (conflitos: {stats['conflicts']})")
+    print(f"[info] Arquivos não encontrados: {stats['missing']} | Falhas de upload: {stats['failed']}")
+    print("=" * 60)
+    return 1 if stats["failed"] or stats["missing"] else 0
+
 
 if __name__ == "__main__":
-    confirm = input("⚠️  Este script irá migrar TODAS as imagens para o Supabase. Continuar? (s/n): ")
-    
-    if confirm.lower() == 's':
-        migrate_images()
-    else:
-        print("[info] Migração cancelada.")
+    sys.exit(main())
@@ -0,0 +1,382 @@
+"""
+Perfilamento sob demanda de requisições (desligado por padrão: PROFILING_ENABLED=1 liga).
+
+Com o recurso desligado, init_app não registra hook nenhum — custo zero por request.
+Ligado, um request é perfilado quando:
+
+  * a sessão admin ativou o perfilamento em /admin/profiles (vale para os próximos
+    requests daquele navegador);
+  * vem com o cabeçalho `X-Profile: cprofile|sample[; rate=0.1]` de um admin logado ou com
+    `X-Profile-Token: <PROFILING_TOKEN>` — `rate` perfila só essa fração dos requests
+    marcados (útil durante um teste de carga);
+  * PROFILE_SAMPLE_RATE > 0 sorteia o request (modo PROFILE_SAMPLE_MODE, padrão sample).
+
+Modos:
+    cprofile  cProfile determinístico (todas as chamadas; mais preciso, mais lento)
+    sample    thread que lê a pilha do request a cada PROFILE_SAMPLE_INTERVAL_MS
+
+Só um request é perfilado por vez em cada worker (os demais seguem sem perfil). O resultado
+vai para PROFILE_DIR (compartilhado entre os workers): um resumo JSON com as funções mais
+caras e a divisão do tempo em render de templates / banco / rede externa / resto, mais o
+arquivo bruto (.prof para pstats/snakeviz, .folded para flamegraph). Ficam os PROFILE_KEEP
+mais recentes.
+
+O tempo de banco e de rede vem do RequestStats do metrics_service (METRICS_ENABLED); o de
+render é medido pelos sinais de template do Flask, descontado o SQL/rede feito durante o
+render (relacionamentos carregados sob demanda pelo template contam como banco).
+"""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import metrics_service
+from cache_service import CACHE_DIR, _atomic_write
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(CACHE_DIR, "profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_MODE = os.environ.get("PROFILE_SAMPLE_MODE", "sample")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+# se definido, o cabeçalho X-Profile também é aceito de clientes não logados com este token
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN") or None
+PROFILE_TOP_FUNCTIONS = 25
+
+MODES = ("cprofile", "sample")
+SESSION_KEY = "profile_requests"
+# rotas que nunca são perfiladas (a própria tela de perfis, métricas, arquivos estáticos)
+SKIP_PREFIXES = ("/admin/profiles", "/metrics", "/static/")
+
+_ID_RE = re.compile(r"^[0-9]{8}T[0-9]{9}-[0-9a-f]{8}$")
+_busy = threading.Lock()
+
+
+class _Sampler:
+    """Amostrador de pilha: outra thread lê o frame atual da thread do request em intervalos."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+
+class _Session:
+    """Estado de um request perfilado (guardado em flask.g)."""
+
+    def __init__(self, mode, trigger):
+        self.mode = mode
+        self.trigger = trigger
+        self.started = time.perf_counter()
+        self.render_seconds = 0.0
+        self.status = None
+        self._render_mark = None
+        self.profiler = None
+        self.sampler = None
+        if mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.sampler = _Sampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL_MS / 1000)
+            self.sampler.start()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        else:
+            self.sampler.stop()
+        return time.perf_counter() - self.started
+
+    def render_started(self):
+        stats = metrics_service.current_request_stats()
+        io = (stats.db_seconds + stats.outbound_seconds) if stats is not None else 0.0
+        self._render_mark = (time.perf_counter(), io)
+
+    def render_finished(self):
+        if self._render_mark is None:
+            return
+        started, io_before = self._render_mark
+        self._render_mark = None
+        stats = metrics_service.current_request_stats()
+        io = (stats.db_seconds + stats.outbound_seconds) if stats is not None else 0.0
+        self.render_seconds += max(0.0, time.perf_counter() - started - (io - io_before))
+
+
+def _short_path(filename):
+    for marker in ("site-packages" + os.sep, "lib" + os.sep + "python"):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    cwd = os.getcwd() + os.sep
+    return filename[len(cwd):] if filename.startswith(cwd) else filename
+
+
+def _label(filename, lineno, name):
+    if filename == "~":  # builtins no cProfile
+        return name
+    return f"{_short_path(filename)}:{lineno}({name})"
+
+
+def _cprofile_top(profiler):
+    raw = pstats.Stats(profiler).stats
+    rows = [
+        {"function": _label(*func), "calls": nc, "self_ms": round(tt * 1000, 2), "cumulative_ms": round(ct * 1000, 2)}
+        for func, (cc, nc, tt, ct, callers) in raw.items()
+    ]
+    return _top(rows)
+
+
+def _sample_top(stacks, interval):
+    self_counts, cumulative = Counter(), Counter()
+    for stack, count in stacks.items():
+        self_counts[stack[-1]] += count
+        for func in set(stack):
+            cumulative[func] += count
+    total = sum(stacks.values()) or 1
+    rows = [
+        {
+            "function": _label(*func), "samples": n, "percent": round(100 * n / total, 1),
+            "self_ms": round(self_counts[func] * interval * 1000, 2), "cumulative_ms": round(n * interval * 1000, 2),
+        }
+        for func, n in cumulative.items()
+    ]
+    return _top(rows)
+
+
+def _top(rows):
+    """(funções mais caras por tempo acumulado, função com mais tempo próprio)."""
+    hottest = max(rows, key=lambda r: r["self_ms"])["function"] if rows else None
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:PROFILE_TOP_FUNCTIONS], hottest
+
+
+def _folded(stacks):
+    lines = (";".join(_label(*f) for f in stack) + f" {count}" for stack, count in stacks.most_common())
+    return "\n".join(lines) + "\n"
+
+
+def _new_id():
+    # ordem lexicográfica = ordem cronológica (ms), sufixo aleatório contra colisão entre workers
+    now = time.time()
+    return time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}-" + uuid.uuid4().hex[:8]
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def _breakdown(total, render, stats):
+    """Divisão do tempo do request; banco/rede ficam None sem o metrics_service."""
+    db = stats.db_seconds if stats is not None else None
+    network = stats.outbound_seconds if stats is not None else None
+    other = max(0.0, total - render - (db or 0.0) - (network or 0.0))
+    return {
+        "total_ms": _ms(total), "render_ms": _ms(render), "db_ms": _ms(db),
+        "network_ms": _ms(network), "other_ms": _ms(other),
+    }
+
+
+def _save(summary, raw_suffix, write_raw):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, summary["id"])
+    write_raw(base + raw_suffix)
+    _atomic_write(base + ".json", json.dumps(summary, ensure_ascii=False).encode())
+    _prune()
+
+
+def _prune():
+    try:
+        names = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(".json"))
+    except FileNotFoundError:
+        return
+    for name in names[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else names:
+        stem = name[:-len(".json")]
+        for suffix in (".json", ".prof", ".folded"):
+            try:
+                os.unlink(os.path.join(PROFILE_DIR, stem + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit=None):
+    """Resumos gravados, do mais recente para o mais antigo."""
+    try:
+        names = sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith(".json")), reverse=True)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names[:limit]:
+        profile = load_profile(name[:-len(".json")])
+        if profile is not None:
+            profiles.append(profile)
+    return profiles
+
+
+def load_profile(profile_id):
+    if not _ID_RE.match(profile_id or ""):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, profile_id + ".json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def raw_profile_path(profile_id):
+    """Caminho do arquivo bruto (.prof ou .folded) de um perfil, ou None."""
+    profile = load_profile(profile_id)
+    if profile is None:
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id + profile["raw_suffix"])
+    return path if os.path.exists(path) else None
+
+
+def _parse_header(value):
+    """'cprofile; rate=0.1' -> ("cprofile", 0.1); modo desconhecido -> (None, 0)."""
+    parts = [p.strip() for p in value.split(";")]
+    mode = parts[0].lower()
+    if mode not in MODES:
+        return None, 0.0
+    rate = 1.0
+    for part in parts[1:]:
+        key, _, val = part.partition("=")
+        if key.strip() == "rate":
+            try:
+                rate = float(val)
+            except ValueError:
+                pass
+    return mode, rate
+
+
+def init_app(app):
+    """Registra os hooks de perfilamento (nenhum, se PROFILING_ENABLED estiver desligado)."""
+    if not PROFILING_ENABLED:
+        return
+
+    from flask import before_render_template, g, request, session, template_rendered
+
+    cookie_name = app.config["SESSION_COOKIE_NAME"]
+
+    def _admin():
+        # só abre a sessão se o cookie existir (não marca a resposta com Vary: Cookie à toa)
+        return cookie_name in request.cookies and bool(session.get("admin_logged"))
+
+    def _select():
+        header = request.headers.get("X-Profile")
+        if header:
+            mode, rate = _parse_header(header)
+            authorized = (PROFILING_TOKEN and request.headers.get("X-Profile-Token") == PROFILING_TOKEN) or _admin()
+            if mode and authorized and random.random() < rate:
+                return mode, "header"
+        if cookie_name in request.cookies and session.get(SESSION_KEY) in MODES and _admin():
+            return session[SESSION_KEY], "admin"
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return PROFILE_SAMPLE_MODE, "sample-rate"
+        return None
+
+    @app.before_request
+    def _profile_start():
+        if request.path.startswith(SKIP_PREFIXES):
+            return
+        selected = _select()
+        if selected is None or not _busy.acquire(blocking=False):
+            return
+        try:
+            g._profile = _Session(*selected)
+        except BaseException:
+            _busy.release()
+            raise
+
+    @app.after_request
+    def _profile_status(response):
+        profile = g.get("_profile")
+        if profile is not None:
+            profile.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _profile_finish(exc):
+        profile = g.pop("_profile", None)
+        if profile is None:
+            return
+        try:
+            total = profile.stop()
+            stats = metrics_service.current_request_stats()
+            rule = request.url_rule
+            summary = {
+                "id": _new_id(),
+                "ts": time.time(),
+                "when": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "pid": os.getpid(),
+                "method": request.method,
+                "path": request.full_path.rstrip("?"),
+                "route": rule.rule if rule is not None else None,
+                "status": profile.status or 500,
+                "mode": profile.mode,
+                "trigger": profile.trigger,
+                "db_queries": stats.db_queries if stats is not None else None,
+                "breakdown": _breakdown(total, profile.render_seconds, stats),
+            }
+            if profile.mode == "cprofile":
+                top, hottest = _cprofile_top(profile.profiler)
+                summary.update(raw_suffix=".prof", top=top, hottest=hottest)
+                _save(summary, ".prof", profile.profiler.dump_stats)
+            else:
+                stacks = profile.sampler.stacks
+                top, hottest = _sample_top(stacks, profile.sampler.interval)
+                summary.update(raw_suffix=".folded", samples=sum(stacks.values()),
+                               interval_ms=PROFILE_SAMPLE_INTERVAL_MS, top=top, hottest=hottest)
+
+                def write_folded(path):
+                    _atomic_write(path, _folded(stacks).encode())
+
+                _save(summary, ".folded", write_folded)
+            logger.info("Perfil %s gravado: %s %s (%.1f ms, %s)", summary["id"], summary["method"], summary["path"],
+                        total * 1000, profile.mode)
+        except Exception:
+            logger.exception("Falha ao gravar o perfil do request")
+        finally:
+            _busy.release()
+
+    def _on_render_start(sender, template, context, **extra):
+        profile = g.get("_profile")
+        if profile is not None:
+            profile.render_started()
+
+    def _on_render_done(sender, template, context, **extra):
+        profile = g.get("_profile")
+        if profile is not None:
+            profile.render_finished()
+
+    before_render_template.connect(_on_render_start, app, weak=False)
+    template_rendered.connect(_on_render_done, app, weak=False)
@@ -0,0 +1,116 @@
+"""
+Modelos de leitura do catálogo: dataclasses com __slots__, congeladas, montadas direto
+das linhas do Core (sem entidades ORM, sem lazy load, sem identity map).
+
+É isso que os templates recebem. Campos derivados (preço efetivo, desconto, primeira
+imagem, tamanhos com estoque) são calculados uma vez, na montagem do snapshot
+(catalog_snapshot.py), e não a cada renderização.
+"""
+
+from dataclasses import dataclass
+
+from image_service import pick_derivative
+
+# imagem padrão (static/images) dos produtos sem foto
+PLACEHOLDER_IMAGE_NAME = "placeholder.jpg"
+
+
+@dataclass(frozen=True, slots=True)
+class ClassificationRecord:
+    id: int
+    name: str
+    display_order: int
+
+    @classmethod
+    def from_row(cls, r):
+        return cls(r.id, r.name, r.display_order)
+
+
+@dataclass(frozen=True, slots=True)
+class ImageRecord:
+    id: int
+    product_id: int
+    image_url: str
+    srcset: str
+    # URL pronta para o <img> (Storage, /media, http); None = arquivo em static/images
+    src: str
+
+    @classmethod
+    def from_row(cls, r):
+        return cls(r.id, r.product_id, r.image_url, r.srcset, _src(r.image_url))
+
+    def derivative_url(self, min_width):
+        """Menor derivado com largura >= min_width; sem derivados, a URL original."""
+        return pick_derivative(self.srcset, min_width) or self.image_url
+
+
+def _src(image_url):
+    # nomes antigos ("foto.jpg") ficam em static/images; o template resolve com url_for
+    return image_url if image_url.startswith(("http://", "https://", "/")) else None
+
+
+PLACEHOLDER_IMAGE = ImageRecord(None, None, PLACEHOLDER_IMAGE_NAME, None, None)
+
+
+@dataclass(frozen=True, slots=True)
+class VariantRecord:
+    id: int
+    product_id: int
+    size: str
+    color: str
+    quantity: int
+    price: float
+    is_available: bool
+
+    @classmethod
+    def from_row(cls, r):
+        return cls(r.id, r.product_id, r.size, r.color, int(r.quantity or 0), r.price, bool(r.is_available))
+
+
+@dataclass(frozen=True, slots=True)
+class ProductRecord:
+    id: int
+    name: str
+    description: str
+    price: float
+    discount_price: float
+    category: str
+    total_stock: int
+    classification_id: int
+    revision: int
+    updated_at: object
+    classification: ClassificationRecord
+    images: tuple
+    stock_variants: tuple
+    # derivados
+    effective_price: float  # preço cobrado: promocional, se houver
+    has_discount: bool  # promocional menor que o preço normal (exibe "de/por")
+    discount_percent: float
+    first_image: ImageRecord  # PLACEHOLDER_IMAGE sem fotos
+    card_images: tuple  # fotos do card da home (o placeholder, sem fotos)
+    in_stock: bool
+    in_stock_sizes: tuple  # tamanhos com alguma quantidade, ordenados
+
+    @classmethod
+    def from_row(cls, r, classification, images, variants):
+        price, discount_price = r.price, r.discount_price
+        has_discount = bool(discount_price and price and discount_price < price)
+        return cls(
+            r.id, r.name, r.description, price, discount_price, r.category, r.total_stock,
+            r.classification_id, r.revision, r.updated_at, classification, images, variants,
+            discount_price if discount_price is not None else price,
+            has_discount,
+            (price - discount_price) / price * 100 if has_discount else 0.0,
+            images[0] if images else PLACEHOLDER_IMAGE,
+            images or (PLACEHOLDER_IMAGE,),
+            (r.total_stock or 0) > 0,
+            tuple(sorted({v.size for v in variants if v.quantity > 0})),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Group:
+    """Seção da home: produtos de uma classificação (id None = "Outros" ou resultados da busca)."""
+    id: int
+    name: str
+    products: tuple
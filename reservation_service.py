@@ -0,0 +1,289 @@
+"""
+Reservas de estoque concorrência-segura.
+
+A baixa de estoque (stock_service.adjust_quantity) é um UPDATE condicional
+    UPDATE product_stock SET quantity = quantity - :n WHERE id = :id AND quantity >= :n
+e só conta como reservada se o banco afetou exatamente uma linha. Dois clientes
+disputando a última unidade nunca recebem sucesso os dois: o segundo UPDATE não
+encontra mais `quantity >= n` e a transação inteira é desfeita.
+
+Cada reserva tem validade (TTL). Reservas ativas vencidas são devolvidas ao estoque
+por um varredor em segundo plano; a devolução "reivindica" a reserva com outro
+UPDATE condicional (status active -> released), então vários workers podem varrer
+ao mesmo tempo sem devolver a mesma reserva duas vezes.
+
+A reserva é criada pelo checkout (público) e só vira definitiva pelo admin, ao marcar o
+pedido do WhatsApp como pago (confirm_by_code) — mesmo depois do TTL: se o estoque já tinha
+voltado, ele é baixado de novo (ou o admin é avisado de que não há mais quantidade). Para que o endpoint público não zere o
+estoque em laço, cada reserva tem limite de variantes e de unidades, e cada cliente (IP)
+pode criar no máximo RESERVATION_RATE_LIMIT reservas por RESERVATION_RATE_WINDOW_SECONDS —
+contadas no banco, valendo para todos os workers.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, table, column, select, update, insert, func, distinct
+from sqlalchemy.exc import OperationalError
+
+from stock_service import adjust_quantity
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL_SECONDS = int(os.environ.get("RESERVATION_TTL_SECONDS", "900"))
+RESERVATION_SWEEP_SECONDS = int(os.environ.get("RESERVATION_SWEEP_SECONDS", "30"))
+RESERVATION_MAX_ITEMS = 50
+RESERVATION_MAX_QUANTITY = int(os.environ.get("RESERVATION_MAX_QUANTITY", "50"))  # por variante
+RESERVATION_MAX_UNITS = int(os.environ.get("RESERVATION_MAX_UNITS", "200"))  # por reserva
+RESERVATION_RATE_LIMIT = int(os.environ.get("RESERVATION_RATE_LIMIT", "5"))
+RESERVATION_RATE_WINDOW_SECONDS = int(os.environ.get("RESERVATION_RATE_WINDOW_SECONDS", "600"))
+# código exibido ao cliente e enviado no pedido do WhatsApp: início do token
+RESERVATION_CODE_LENGTH = 8
+RESERVATION_RETRIES = 3
+
+# tabela em Core "leve": o serviço não depende dos modelos ORM do app
+stock_reservations = table(
+    "stock_reservations",
+    column("id"), column("token"), column("variant_id"), column("quantity"),
+    column("status"), column("client"), column("created_at", DateTime), column("expires_at", DateTime),
+)
+
+ACTIVE, CONFIRMED, RELEASED = "active", "confirmed", "released"
+
+
+class ReservationError(Exception):
+    """Pedido de reserva inválido."""
+
+
+class InsufficientStock(ReservationError):
+    """Não há estoque suficiente para uma das variantes (nada foi reservado)."""
+
+    def __init__(self, variant_id, requested):
+        super().__init__(f"Estoque insuficiente para a variante {variant_id}")
+        self.variant_id = variant_id
+        self.requested = requested
+
+
+class RateLimited(ReservationError):
+    """O cliente já criou reservas demais na janela atual."""
+
+    def __init__(self, retry_after):
+        super().__init__("Muitas reservas em pouco tempo; tente novamente mais tarde")
+        self.retry_after = retry_after
+
+
+def _merge_items(items):
+    """[{variant_id, quantity}, ...] -> [(variant_id, quantity)] somados e ordenados por id."""
+    merged = {}
+    for item in items or []:
+        try:
+            variant_id = int(item["variant_id"])
+            quantity = int(item.get("quantity", item.get("qty", 1)))
+        except (KeyError, TypeError, ValueError):
+            raise ReservationError("Item de reserva inválido")
+        if quantity <= 0:
+            raise ReservationError("Quantidade deve ser positiva")
+        merged[variant_id] = merged.get(variant_id, 0) + quantity
+    if not merged:
+        raise ReservationError("Nenhum item para reservar")
+    if len(merged) > RESERVATION_MAX_ITEMS:
+        raise ReservationError(f"Máximo de {RESERVATION_MAX_ITEMS} variantes por reserva")
+    if max(merged.values()) > RESERVATION_MAX_QUANTITY:
+        raise ReservationError(f"Máximo de {RESERVATION_MAX_QUANTITY} unidades por variante")
+    if sum(merged.values()) > RESERVATION_MAX_UNITS:
+        raise ReservationError(f"Máximo de {RESERVATION_MAX_UNITS} unidades por reserva")
+    # ordem fixa de travamento entre transações concorrentes (evita deadlock no PostgreSQL)
+    return sorted(merged.items())
+
+
+def _check_rate(conn, client, now):
+    """Levanta RateLimited se `client` já criou RESERVATION_RATE_LIMIT reservas na janela."""
+    window_start = now - timedelta(seconds=RESERVATION_RATE_WINDOW_SECONDS)
+    recent = conn.execute(
+        select(func.count(distinct(stock_reservations.c.token)), func.min(stock_reservations.c.created_at))
+        .where(stock_reservations.c.client == client, stock_reservations.c.created_at > window_start)
+    ).one()
+    if recent[0] >= RESERVATION_RATE_LIMIT:
+        oldest = recent[1]
+        retry_after = RESERVATION_RATE_WINDOW_SECONDS
+        if isinstance(oldest, datetime):
+            retry_after = max(int((oldest - window_start).total_seconds()) + 1, 1)
+        raise RateLimited(retry_after)
+
+
+def reserve(engine, items, client=None, ttl_seconds=RESERVATION_TTL_SECONDS):
+    """
+    Reserva (baixa) todas as variantes pedidas numa única transação: ou tudo, ou nada.
+    `client` (IP) ativa o limite de reservas por janela; None = sem limite (uso interno).
+    Retorna dict {token, expires_at, items}. Levanta InsufficientStock/RateLimited/ReservationError.
+    """
+    merged = _merge_items(items)
+    for attempt in range(RESERVATION_RETRIES):
+        token = str(uuid.uuid4())
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        try:
+            with engine.begin() as conn:
+                if client is not None:
+                    _check_rate(conn, client, now)
+                for variant_id, quantity in merged:
+                    if not adjust_quantity(conn, variant_id, -quantity):
+                        raise InsufficientStock(variant_id, quantity)  # rollback de tudo
+                conn.execute(insert(stock_reservations), [
+                    {"token": token, "variant_id": variant_id, "quantity": quantity,
+                     "status": ACTIVE, "client": client, "created_at": now, "expires_at": expires_at}
+                    for variant_id, quantity in merged
+                ])
+            return {
+                "token": token,
+                "expires_at": expires_at,
+                "items": [{"variant_id": v, "quantity": q} for v, q in merged],
+            }
+        except OperationalError:
+            # SQLite: "database is locked" sob contenção — tenta de novo
+            if attempt == RESERVATION_RETRIES - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+
+def _release_rows(conn, rows):
+    """Devolve ao estoque as linhas de reserva que este chamador conseguir reivindicar."""
+    released = 0
+    for row in rows:
+        claim = conn.execute(
+            update(stock_reservations)
+            .where(stock_reservations.c.id == row.id, stock_reservations.c.status == ACTIVE)
+            .values(status=RELEASED)
+        )
+        if claim.rowcount == 1:
+            adjust_quantity(conn, row.variant_id, row.quantity)
+            released += 1
+    return released
+
+
+def release(engine, token):
+    """Cancela uma reserva ativa e devolve o estoque. Retorna o nº de itens devolvidos."""
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(stock_reservations.c.id, stock_reservations.c.variant_id, stock_reservations.c.quantity)
+            .where(stock_reservations.c.token == token, stock_reservations.c.status == ACTIVE)
+        ).all()
+        return _release_rows(conn, rows)
+
+
+def confirm(engine, token):
+    """
+    Confirma uma reserva ativa e ainda válida (a baixa de estoque torna-se definitiva).
+    Retorna o nº de itens confirmados (0 = reserva inexistente, vencida ou já finalizada).
+    """
+    with engine.begin() as conn:
+        result = conn.execute(
+            update(stock_reservations)
+            .where(
+                stock_reservations.c.token == token,
+                stock_reservations.c.status == ACTIVE,
+                stock_reservations.c.expires_at > datetime.utcnow(),
+            )
+            .values(status=CONFIRMED)
+        )
+        return result.rowcount
+
+
+def confirm_by_code(engine, code):
+    """
+    Confirma pelo código do pedido (início do token, como enviado no WhatsApp) — passo do
+    admin ao receber o pagamento. O pagamento pode chegar depois do TTL: uma reserva vencida
+    ou já devolvida ao estoque volta a baixar o estoque (UPDATE condicional, tudo ou nada;
+    InsufficientStock se alguma variante já não tem a quantidade).
+    Retorna o nº de itens confirmados; 0 se o código não identifica exatamente uma reserva
+    ativa ou devolvida.
+    """
+    code = (code or "").strip().lower()
+    if len(code) < RESERVATION_CODE_LENGTH:
+        return 0
+    with engine.begin() as conn:
+        tokens = conn.execute(
+            select(stock_reservations.c.token).distinct()
+            .where(
+                stock_reservations.c.token.startswith(code, autoescape=True),
+                stock_reservations.c.status.in_((ACTIVE, RELEASED)),
+            )
+            .limit(2)
+        ).scalars().all()
+        if len(tokens) != 1:
+            return 0
+        rows = conn.execute(
+            select(stock_reservations.c.id, stock_reservations.c.variant_id, stock_reservations.c.quantity)
+            .where(stock_reservations.c.token == tokens[0], stock_reservations.c.status.in_((ACTIVE, RELEASED)))
+            .order_by(stock_reservations.c.variant_id)
+        ).all()
+        confirmed = 0
+        for row in rows:
+            # ativa (mesmo vencida): o estoque ainda está baixado, só muda o status
+            claim = conn.execute(
+                update(stock_reservations)
+                .where(stock_reservations.c.id == row.id, stock_reservations.c.status == ACTIVE)
+                .values(status=CONFIRMED)
+            )
+            if claim.rowcount == 0:
+                # devolvida (pelo varredor ou cancelada): baixa de novo, se ainda houver estoque
+                claim = conn.execute(
+                    update(stock_reservations)
+                    .where(stock_reservations.c.id == row.id, stock_reservations.c.status == RELEASED)
+                    .values(status=CONFIRMED)
+                )
+                if claim.rowcount == 1 and not adjust_quantity(conn, row.variant_id, -row.quantity):
+                    raise InsufficientStock(row.variant_id, row.quantity)  # rollback de tudo
+            confirmed += claim.rowcount
+        return confirmed
+
+
+def sweep_expired(engine, now=None, batch_size=500):
+    """Devolve ao estoque as reservas ativas vencidas. Retorna o nº de itens devolvidos."""
+    now = now or datetime.utcnow()
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(stock_reservations.c.id, stock_reservations.c.variant_id, stock_reservations.c.quantity)
+            .where(stock_reservations.c.status == ACTIVE, stock_reservations.c.expires_at <= now)
+            .order_by(stock_reservations.c.variant_id)
+            .limit(batch_size)
+        ).all()
+        return _release_rows(conn, rows)
+
+
+class ReservationSweeper:
+    """Thread daemon (uma por worker) que libera reservas vencidas periodicamente."""
+
+    def __init__(self, engine, interval=RESERVATION_SWEEP_SECONDS, on_release=None):
+        self.engine = engine
+        self.interval = interval
+        self.on_release = on_release
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        # (re)inicia após fork: threads não sobrevivem ao fork do gunicorn
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="reservation-sweeper", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                released = sweep_expired(self.engine)
+            except Exception as e:
+                logger.warning("Falha ao liberar reservas vencidas: %s", e)
+                continue
+            if released:
+                logger.info("%d item(ns) de reservas vencidas devolvido(s) ao estoque", released)
+                if self.on_release:
+                    self.on_release()
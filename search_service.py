@@ -0,0 +1,323 @@
+"""
+Busca de produtos (parâmetro `q` da home e do painel admin).
+
+Substitui o `Product.name.ilike('%q%')`, que não usa índice e ignora descrição e
+classificação, por dois backends com a mesma interface:
+
+  * PostgresSearch — tsvector (dicionário 'portuguese') mantido por trigger, índice GIN
+    e pg_trgm sobre o nome para tolerar erros de digitação; tudo sem acentos (unaccent).
+  * InMemorySearch — índice invertido no processo, para SQLite/desenvolvimento,
+    atualizado produto a produto quando o admin edita o catálogo.
+
+Os dois ignoram acentos e caixa ("proprio" encontra "Próprio"), casam prefixos
+("legg" encontra "Legging"), devolvem resultados ordenados por relevância e paginam.
+"""
+
+import bisect
+import logging
+import re
+import threading
+import unicodedata
+from typing import NamedTuple
+
+from sqlalchemy import inspect, text
+
+from cache_service import catalog_generation
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PAGE_SIZE = 48
+
+# pesos por campo: nome > classificação/categoria > descrição
+FIELD_WEIGHTS = {"name": 3.0, "classification": 2.0, "category": 2.0, "description": 1.0}
+PREFIX_FACTOR = 0.5
+
+STOPWORDS = frozenset(
+    "a as o os e de da das do dos em na nas no nos um uma para por com sem que ao aos".split()
+)
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class SearchResults(NamedTuple):
+    ids: list
+    total: int
+    page: int
+    per_page: int
+
+    @property
+    def pages(self):
+        return max(1, -(-self.total // self.per_page))
+
+
+def normalize_text(value):
+    """Minúsculas e sem acentos: 'Camiseta Amor Próprio' -> 'camiseta amor proprio'."""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(value):
+    """Tokens normalizados, sem stopwords e com plural simples removido ('leggings' -> 'legging')."""
+    tokens = []
+    for token in _TOKEN_RE.findall(normalize_text(value)):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _clamp_page(page, per_page):
+    try:
+        page = max(1, int(page))
+    except (TypeError, ValueError):
+        page = 1
+    return page, max(1, int(per_page))
+
+
+# =========================================================================
+# BACKEND EM MEMÓRIA (SQLite / desenvolvimento)
+# =========================================================================
+
+_DOCUMENTS_SQL = text("""
+    SELECT p.id, p.name, p.description, p.category, c.name AS classification
+    FROM products p LEFT JOIN classifications c ON c.id = p.classification_id
+""")
+
+
+class InMemorySearch:
+    """Índice invertido termo -> {product_id: peso}, com busca por prefixo via bisect."""
+
+    name = "memory"
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self._lock = threading.RLock()
+        self._postings = {}   # termo -> {product_id: peso}
+        self._doc_terms = {}  # product_id -> termos indexados (para remoção)
+        self._terms = []      # termos ordenados (busca por prefixo)
+        self._terms_dirty = False
+        self.generation = None  # geração do catálogo refletida no índice
+
+    def setup(self):
+        pass
+
+    def _index_document(self, row):
+        weights = {}
+        for field in FIELD_WEIGHTS:
+            for token in tokenize(getattr(row, field)):
+                weights[token] = weights.get(token, 0.0) + FIELD_WEIGHTS[field]
+        for token, weight in weights.items():
+            self._postings.setdefault(token, {})[row.id] = weight
+        self._doc_terms[row.id] = set(weights)
+        self._terms_dirty = True
+
+    def _remove_document(self, product_id):
+        for token in self._doc_terms.pop(product_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+        self._terms_dirty = True
+
+    def rebuild(self):
+        """Reconstrói o índice inteiro a partir do banco."""
+        generation = catalog_generation.get()
+        with self.session_factory() as db:
+            rows = db.execute(_DOCUMENTS_SQL).all()
+        with self._lock:
+            self._postings, self._doc_terms = {}, {}
+            for row in rows:
+                self._index_document(row)
+            self._terms = sorted(self._postings)
+            self._terms_dirty = False
+            self.generation = generation
+
+    def reindex_product(self, db, product_id):
+        """Atualiza (ou remove) um único produto no índice — chamado pelas rotas admin."""
+        row = db.execute(
+            text(_DOCUMENTS_SQL.text + " WHERE p.id = :pid"), {"pid": product_id}
+        ).first()
+        with self._lock:
+            self._remove_document(product_id)
+            if row is not None:
+                self._index_document(row)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._remove_document(product_id)
+
+    def on_catalog_change(self, generation):
+        """Após um bump da geração: se só este worker alterou o catálogo, o índice segue válido."""
+        with self._lock:
+            if self.generation is not None and self.generation == generation - 1:
+                self.generation = generation
+
+    def _ensure_fresh(self):
+        # outro worker alterou o catálogo: este reconstrói o índice (barato em dev/SQLite)
+        if self.generation != catalog_generation.get():
+            self.rebuild()
+
+    def _matches(self, token):
+        """Produtos que casam com o token: termo exato (peso cheio) ou prefixo (peso reduzido)."""
+        scores = dict(self._postings.get(token, {}))
+        if len(token) >= 2:
+            start = bisect.bisect_left(self._terms, token)
+            for term in self._terms[start:]:
+                if not term.startswith(token):
+                    break
+                if term == token:
+                    continue
+                for product_id, weight in self._postings[term].items():
+                    scores[product_id] = max(scores.get(product_id, 0.0), weight * PREFIX_FACTOR)
+        return scores
+
+    def search(self, db, q, page=1, per_page=SEARCH_PAGE_SIZE):
+        page, per_page = _clamp_page(page, per_page)
+        tokens = tokenize(q)
+        if not tokens:
+            return SearchResults([], 0, page, per_page)
+        self._ensure_fresh()
+        with self._lock:
+            if self._terms_dirty:
+                self._terms = sorted(self._postings)
+                self._terms_dirty = False
+            scores = None
+            for token in tokens:
+                matches = self._matches(token)
+                if scores is None:
+                    scores = matches
+                else:  # todos os termos precisam casar (AND)
+                    scores = {pid: s + matches[pid] for pid, s in scores.items() if pid in matches}
+                if not scores:
+                    break
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0])) if scores else []
+        start = (page - 1) * per_page
+        return SearchResults([pid for pid, _ in ranked[start:start + per_page]], len(ranked), page, per_page)
+
+
+# =========================================================================
+# BACKEND POSTGRESQL (tsvector + pg_trgm)
+# =========================================================================
+
+_PG_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # unaccent() não é IMMUTABLE; o wrapper permite usá-lo em índices de expressão
+    """
+    CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent', $1) $$
+    """,
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    """
+    CREATE OR REPLACE FUNCTION products_search_vector_update() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+      NEW.search_vector :=
+        setweight(to_tsvector('portuguese', f_unaccent(coalesce(NEW.name, ''))), 'A') ||
+        setweight(to_tsvector('portuguese', f_unaccent(
+          coalesce((SELECT name FROM classifications WHERE id = NEW.classification_id), '') || ' ' ||
+          coalesce(NEW.category, ''))), 'B') ||
+        setweight(to_tsvector('portuguese', f_unaccent(coalesce(NEW.description, ''))), 'C');
+      RETURN NEW;
+    END $$
+    """,
+    "DROP TRIGGER IF EXISTS products_search_vector_trg ON products",
+    """
+    CREATE TRIGGER products_search_vector_trg
+    BEFORE INSERT OR UPDATE OF name, description, category, classification_id ON products
+    FOR EACH ROW EXECUTE FUNCTION products_search_vector_update()
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (f_unaccent(lower(name)) gin_trgm_ops)",
+    # backfill das linhas antigas (o trigger recalcula)
+    "UPDATE products SET name = name WHERE search_vector IS NULL",
+]
+
+_PG_SEARCH_SQL = text("""
+    SELECT p.id, count(*) OVER () AS total
+    FROM products p
+    WHERE p.search_vector @@ to_tsquery('portuguese', :tsquery)
+       OR f_unaccent(lower(p.name)) % :plain
+    ORDER BY ts_rank(p.search_vector, to_tsquery('portuguese', :tsquery)) * 2
+             + similarity(f_unaccent(lower(p.name)), :plain) DESC,
+             p.id
+    LIMIT :limit OFFSET :offset
+""")
+
+
+class PostgresSearch:
+    """Busca full-text + trigramas no PostgreSQL; o índice é mantido pelo próprio banco."""
+
+    name = "postgresql"
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def setup(self):
+        """Cria extensões, coluna, trigger e índices (idempotente)."""
+        with self.engine.begin() as conn:
+            for statement in _PG_SETUP:
+                conn.exec_driver_sql(statement)
+
+    def rebuild(self):
+        pass
+
+    def reindex_product(self, db, product_id):
+        pass  # trigger BEFORE INSERT/UPDATE mantém search_vector
+
+    def remove_product(self, product_id):
+        pass
+
+    def on_catalog_change(self, generation):
+        pass
+
+    def search(self, db, q, page=1, per_page=SEARCH_PAGE_SIZE):
+        page, per_page = _clamp_page(page, per_page)
+        tokens = tokenize(q)
+        if not tokens:
+            return SearchResults([], 0, page, per_page)
+        # tokens já normalizados (só \w): seguros para compor o tsquery com prefixo
+        tsquery = " & ".join(f"{token}:*" for token in tokens)
+        rows = db.execute(_PG_SEARCH_SQL, {
+            "tsquery": tsquery,
+            "plain": " ".join(tokens),
+            "limit": per_page,
+            "offset": (page - 1) * per_page,
+        }).all()
+        total = rows[0].total if rows else 0
+        return SearchResults([row.id for row in rows], total, page, per_page)
+
+
+def setup_search_schema(engine):
+    """Prepara a busca full-text no PostgreSQL (comando init-db). Retorna False se indisponível."""
+    if engine.dialect.name != "postgresql":
+        return False
+    try:
+        PostgresSearch(engine).setup()
+        return True
+    except Exception as e:
+        logger.warning("Busca full-text indisponível no PostgreSQL (%s); usando índice em memória", e)
+        return False
+
+
+def create_search_backend(engine, session_factory, setup=True):
+    """
+    PostgresSearch no PostgreSQL (se as extensões puderem ser criadas); InMemorySearch nos demais.
+    Com setup=False não roda DDL: usa o PostgreSQL só se init-db já criou a coluna search_vector.
+    """
+    if engine.dialect.name == "postgresql":
+        backend = PostgresSearch(engine)
+        try:
+            if setup:
+                backend.setup()
+                return backend
+            if "search_vector" in {c["name"] for c in inspect(engine).get_columns("products")}:
+                return backend
+            logger.warning("Busca full-text não configurada (rode `flask --app app init-db`); usando índice em memória")
+        except Exception as e:
+            logger.warning("Busca full-text indisponível no PostgreSQL (%s); usando índice em memória", e)
+    return InMemorySearch(session_factory)
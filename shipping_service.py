@@ -0,0 +1,350 @@
+import logging
+import os
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import requests
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from metrics_service import track_outbound
+
+logger = logging.getLogger(__name__)
+
+# CONSTANTES DE FRETE
+PICKUP_POINT_CEP = "65606-530"  # Caxias
+COST_PER_KM = 0.1724  # R$ por km
+BASE_SHIPPING_FEE = 2  # R$ fixos por entrega
+
+# APIs externas (substituíveis por stubs locais em testes de carga)
+VIACEP_URL = os.environ.get("VIACEP_URL", "https://viacep.com.br/ws").rstrip("/")
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+NOMINATIM_USER_AGENT = 'AM-Conceito-Fitness-Shop'
+
+# Cache de geocodificação (configurável via .env)
+GEOCACHE_MAXSIZE = int(os.environ.get("GEOCACHE_MAXSIZE", "2048"))
+GEOCACHE_MEMORY_TTL = int(os.environ.get("GEOCACHE_MEMORY_TTL", str(6 * 3600)))  # segundos
+GEOCACHE_DB_TTL_DAYS = int(os.environ.get("GEOCACHE_DB_TTL_DAYS", "180"))
+
+
+def normalize_cep(cep):
+    """Remove máscara do CEP. Retorna os 8 dígitos ou None se inválido."""
+    cep_clean = (cep or "").replace('-', '').replace(' ', '').strip()
+    if len(cep_clean) != 8 or not cep_clean.isdigit():
+        return None
+    return cep_clean
+
+
+def get_cep_coordinates(cep):
+    """
+    Obtém latitude/longitude de um CEP usando a API ViaCEP + Nominatim.
+    Retorna tuple (lat, lon) ou None se não encontrar.
+    """
+    try:
+        cep_clean = normalize_cep(cep)
+        if not cep_clean:
+            logger.warning("CEP inválido: %s", cep)
+            return None
+
+        # Busca dados do CEP na ViaCEP
+        url = f"{VIACEP_URL}/{cep_clean}/json/"
+        with track_outbound("viacep") as call:
+            resp = requests.get(url, timeout=5)
+            call["status"] = resp.status_code
+
+        if resp.status_code == 200:
+            data = resp.json()
+            if not data.get('erro'):
+                # ViaCEP retorna logradouro, localidade, uf
+                logradouro = data.get('logradouro', '')
+                localidade = data.get('localidade', '')
+                uf = data.get('uf', '')
+
+                # Usa Nominatim para converter endereço em coordenadas
+                return get_coordinates_nominatim(logradouro, localidade, uf)
+            else:
+                logger.info("CEP não encontrado: %s", cep_clean)
+                return None
+        else:
+            logger.warning("ViaCEP retornou status %s", resp.status_code)
+            return None
+    except Exception as e:
+        logger.warning("Erro ao buscar CEP %s: %s", cep, e)
+        return None
+
+
+def get_coordinates_nominatim(street, city, state):
+    """
+    Usa Nominatim (OpenStreetMap) para obter coordenadas a partir do endereço.
+    Retorna tuple (lat, lon) ou None se não encontrar.
+    """
+    try:
+        if not city:
+            logger.info("Cidade não fornecida")
+            return None
+
+        # Monta query para nominatim
+        addr = f"{city}, {state}, Brasil"
+        if street:
+            addr = f"{street}, {addr}"
+
+        url = NOMINATIM_URL
+        params = {
+            'q': addr,
+            'format': 'json',
+            'limit': 1
+        }
+        headers = {'User-Agent': NOMINATIM_USER_AGENT}
+
+        with track_outbound("nominatim") as call:
+            resp = requests.get(url, params=params, headers=headers, timeout=5)
+            call["status"] = resp.status_code
+
+        if resp.status_code == 200:
+            data = resp.json()
+            if data and len(data) > 0:
+                lat = float(data[0]['lat'])
+                lon = float(data[0]['lon'])
+                logger.debug("Coordenadas encontradas: (%s, %s) para %s", lat, lon, addr)
+                return (lat, lon)
+            else:
+                logger.info("Nominatim não encontrou coordenadas para: %s", addr)
+                return None
+        else:
+            logger.warning("Nominatim retornou status %s", resp.status_code)
+            return None
+    except Exception as e:
+        logger.warning("Erro ao buscar coordenadas nominatim: %s", e)
+        return None
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calcula distância em km entre dois pontos (lat/lon) usando fórmula de Haversine.
+    """
+    R = 6371  # Raio da Terra em km
+
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_lat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2
+    c = 2 * math.asin(math.sqrt(a))
+
+    return R * c
+
+
+def shipping_cost_for_distance(distance_km):
+    """Custo do frete (R$) para uma distância em km a partir do ponto de retirada."""
+    return (distance_km * COST_PER_KM) + BASE_SHIPPING_FEE
+
+
+# =========================================================================
+# CACHE DE GEOCODIFICAÇÃO (CEP -> COORDENADAS)
+# =========================================================================
+
+class CepGeoCache:
+    """
+    Cache em camadas CEP -> (lat, lon).
+
+    1ª camada: LRU em memória com TTL (por processo/worker).
+    2ª camada: tabela persistente (cep_geocache) compartilhada por todos os workers.
+    Só em caso de falha nas duas camadas o resolver (ViaCEP + Nominatim) é chamado.
+    """
+
+    def __init__(self, maxsize=GEOCACHE_MAXSIZE, ttl=GEOCACHE_MEMORY_TTL, db_ttl_days=GEOCACHE_DB_TTL_DAYS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.db_ttl = timedelta(days=db_ttl_days)
+        self.session_factory = None
+        self.model = None
+        self._entries = OrderedDict()  # cep -> (expires_at, (lat, lon))
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def bind(self, session_factory, model):
+        """Liga a camada persistente (sessionmaker + modelo da tabela cep_geocache)."""
+        self.session_factory = session_factory
+        self.model = model
+
+    def _memory_get(self, cep):
+        with self._lock:
+            entry = self._entries.get(cep)
+            if entry is None:
+                return None
+            expires_at, coords = entry
+            if expires_at < time.monotonic():
+                del self._entries[cep]
+                return None
+            self._entries.move_to_end(cep)
+            self.memory_hits += 1
+            return coords
+
+    def _memory_set(self, cep, coords):
+        with self._lock:
+            self._entries[cep] = (time.monotonic() + self.ttl, coords)
+            self._entries.move_to_end(cep)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _db_get(self, cep):
+        if not self.session_factory:
+            return None
+        try:
+            with self.session_factory() as db:
+                row = db.execute(
+                    select(self.model.lat, self.model.lon, self.model.updated_at).where(self.model.cep == cep)
+                ).first()
+        except SQLAlchemyError as e:
+            logger.warning("Falha ao ler cep_geocache para %s: %s", cep, e)
+            return None
+        if row is None:
+            return None
+        if row.updated_at and row.updated_at < datetime.utcnow() - self.db_ttl:
+            return None
+        with self._lock:
+            self.db_hits += 1
+        return (row.lat, row.lon)
+
+    def _db_set(self, cep, coords):
+        if not self.session_factory:
+            return
+        try:
+            with self.session_factory() as db:
+                db.merge(self.model(cep=cep, lat=coords[0], lon=coords[1], updated_at=datetime.utcnow()))
+                db.commit()
+        except SQLAlchemyError as e:
+            # outro worker pode ter gravado o mesmo CEP ao mesmo tempo — não é um erro real
+            logger.warning("Falha ao gravar cep_geocache para %s: %s", cep, e)
+
+    def get(self, cep):
+        """Consulta apenas as camadas de cache (sem I/O de rede). Retorna (lat, lon) ou None."""
+        cep_clean = normalize_cep(cep)
+        if not cep_clean:
+            return None
+        coords = self._memory_get(cep_clean)
+        if coords is not None:
+            return coords
+        coords = self._db_get(cep_clean)
+        if coords is not None:
+            self._memory_set(cep_clean, coords)
+        return coords
+
+    def put(self, cep, coords):
+        """Grava coordenadas já resolvidas nas duas camadas."""
+        cep_clean = normalize_cep(cep)
+        if not cep_clean or not coords:
+            return
+        self._memory_set(cep_clean, coords)
+        self._db_set(cep_clean, coords)
+
+    def record_miss(self):
+        """Contabiliza uma consulta externa feita fora de lookup() (ex.: caminho assíncrono)."""
+        with self._lock:
+            self.misses += 1
+
+    def lookup(self, cep, resolver=None):
+        """
+        Retorna (lat, lon) para o CEP, consultando memória -> tabela -> resolver.
+        Falhas do resolver (None) não são armazenadas.
+        """
+        cep_clean = normalize_cep(cep)
+        if not cep_clean:
+            logger.warning("CEP inválido: %s", cep)
+            return None
+        coords = self.get(cep_clean)
+        if coords is not None:
+            return coords
+        self.record_miss()
+        coords = (resolver or get_cep_coordinates)(cep_clean)
+        if coords:
+            self.put(cep_clean, coords)
+        return coords
+
+    def stats(self):
+        """Contadores de acerto/erro do cache (por worker)."""
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "hits": hits,
+                "misses": self.misses,
+                "hit_ratio": round(hits / total, 4) if total else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        """Esvazia apenas a camada em memória (a tabela persistente é mantida)."""
+        with self._lock:
+            self._entries.clear()
+
+
+geocache = CepGeoCache()
+
+_pickup_coords = None
+# ponto de retirada não resolvido: novas tentativas com espera crescente (segundos)
+PICKUP_RETRY_MIN_SECONDS = 30
+PICKUP_RETRY_MAX_SECONDS = 600
+_pickup_retry_delay = 0
+_pickup_retry_at = 0.0
+
+
+def parse_coords(value):
+    """Converte 'lat,lon' em tuple (lat, lon). Retorna None se inválido."""
+    try:
+        lat, lon = (float(part) for part in value.split(","))
+        return (lat, lon)
+    except (AttributeError, ValueError):
+        return None
+
+
+def record_pickup_coordinates(coords):
+    """Guarda as coordenadas do ponto de retirada; se None, agenda a próxima tentativa (backoff)."""
+    global _pickup_coords, _pickup_retry_delay, _pickup_retry_at
+    if coords is None:
+        _pickup_retry_delay = min(max(_pickup_retry_delay * 2, PICKUP_RETRY_MIN_SECONDS), PICKUP_RETRY_MAX_SECONDS)
+        _pickup_retry_at = time.monotonic() + _pickup_retry_delay
+        logger.warning(
+            "Não foi possível resolver coordenadas do ponto de retirada (%s); nova tentativa em %ds",
+            PICKUP_POINT_CEP, _pickup_retry_delay,
+        )
+    else:
+        _pickup_retry_delay = 0
+    _pickup_coords = coords
+    return coords
+
+
+def pickup_retry_due():
+    """True se o ponto de retirada ainda não foi resolvido e já pode ser tentado de novo."""
+    return _pickup_coords is None and time.monotonic() >= _pickup_retry_at
+
+
+def resolve_pickup_coordinates():
+    """
+    Resolve as coordenadas do ponto de retirada uma única vez (na inicialização).
+    PICKUP_POINT_COORDS="lat,lon" no .env evita qualquer consulta externa.
+    """
+    coords = parse_coords(os.environ.get("PICKUP_POINT_COORDS"))
+    if coords is None:
+        coords = geocache.lookup(PICKUP_POINT_CEP)
+    return record_pickup_coordinates(coords)
+
+
+def get_pickup_coordinates(resolve=True):
+    """
+    Coordenadas do ponto de retirada (resolvidas na inicialização). Se falhou, tenta de novo
+    de forma síncrona, respeitando o backoff; resolve=False só devolve o valor já resolvido
+    (as rotas assíncronas tentam de novo pelo async_geocoder).
+    """
+    if resolve and pickup_retry_due():
+        return resolve_pickup_coordinates()
+    return _pickup_coords
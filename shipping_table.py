@@ -0,0 +1,214 @@
+"""
+Tabela pré-calculada de fretes por prefixo de CEP (5 dígitos).
+
+O custo do frete depende apenas das coordenadas do cliente, que são praticamente
+constantes dentro de um mesmo prefixo de CEP. Este módulo:
+
+  * constrói (offline) um arquivo binário ordenado com distância e preço por prefixo,
+    a partir de um dataset CEP -> coordenadas;
+  * carrega o arquivo via mmap e responde cotações por busca binária, sem I/O de rede.
+
+Uso do builder:
+    python shipping_table.py build ceps.csv data/shipping_quotes.bin [--pickup "-4.86,-43.35"]
+
+O dataset é um CSV (vírgula ou ponto-e-vírgula) com as colunas cep, lat, lon
+(cabeçalho opcional). Prefixos fora do arquivo continuam usando o cálculo ao vivo.
+"""
+
+import argparse
+import csv
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+from shipping_service import (
+    PICKUP_POINT_CEP, COST_PER_KM, BASE_SHIPPING_FEE, normalize_cep, haversine_distance,
+    shipping_cost_for_distance, get_cep_coordinates, parse_coords,
+)
+
+logger = logging.getLogger(__name__)
+
+SHIPPING_TABLE_PATH = os.environ.get(
+    "SHIPPING_TABLE_PATH", os.path.join(os.path.dirname(__file__), "data", "shipping_quotes.bin")
+)
+
+# Cabeçalho: magic, versão, nº de registros, custo/km, taxa fixa, lat/lon do ponto de retirada
+MAGIC = b"AMFQ"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxIdddd")
+# Registro: prefixo (uint32), distância em km (float32), custo em R$ (float32)
+RECORD = struct.Struct("<Iff")
+
+
+class ShippingQuoteTable:
+    """Tabela de cotações memory-mapped com busca binária por prefixo de CEP."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:  # vazio ou menor que o cabeçalho (mmap falharia)
+                raise ValueError(f"Arquivo de fretes truncado: {path}")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, count, cost_per_km, base_fee, pickup_lat, pickup_lon = HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Arquivo de fretes inválido: {path}")
+            if len(self._mm) < HEADER.size + count * RECORD.size:
+                raise ValueError(f"Arquivo de fretes truncado: {path}")
+        except BaseException:
+            self._mm.close()
+            raise
+        self.count = count
+        self.pickup_coords = (pickup_lat, pickup_lon)
+        # se as constantes de frete mudaram depois do build, recalcula o preço a partir da distância
+        self.stale_prices = (cost_per_km != COST_PER_KM or base_fee != BASE_SHIPPING_FEE)
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, index):
+        return RECORD.unpack_from(self._mm, HEADER.size + index * RECORD.size)
+
+    def lookup(self, cep):
+        """
+        Retorna (distance_km, shipping_cost) para o prefixo do CEP, ou None se o
+        prefixo não estiver na tabela.
+        """
+        cep_clean = normalize_cep(cep)
+        if not cep_clean:
+            return None
+        prefix = int(cep_clean[:5])
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key, distance_km, cost = self._record(mid)
+            if key < prefix:
+                lo = mid + 1
+            elif key > prefix:
+                hi = mid
+            else:
+                if self.stale_prices:
+                    cost = shipping_cost_for_distance(distance_km)
+                return (distance_km, cost)
+        return None
+
+    def close(self):
+        self._mm.close()
+
+
+def load_quote_table(path=SHIPPING_TABLE_PATH):
+    """Carrega a tabela de fretes se o arquivo existir; retorna None caso contrário."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        table = ShippingQuoteTable(path)
+    except (OSError, ValueError) as e:
+        logger.warning("Tabela de fretes ignorada: %s", e)
+        return None
+    logger.info("Tabela de fretes carregada: %d prefixos de CEP (%s)", len(table), path)
+    return table
+
+
+# =========================================================================
+# BUILDER OFFLINE
+# =========================================================================
+
+def read_dataset(path):
+    """Lê o CSV de CEPs e agrupa as coordenadas por prefixo de 5 dígitos (centroide)."""
+    sums = {}  # prefixo -> [soma_lat, soma_lon, n]
+    skipped = 0
+    with open(path, newline="", encoding="utf-8") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        delimiter = ";" if sample.count(";") > sample.count(",") else ","
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) < 3:
+                skipped += 1
+                continue
+            cep_clean = normalize_cep(row[0])
+            try:
+                lat, lon = float(row[1]), float(row[2])
+            except ValueError:
+                cep_clean = None  # cabeçalho ou linha malformada
+            if not cep_clean:
+                skipped += 1
+                continue
+            acc = sums.setdefault(int(cep_clean[:5]), [0.0, 0.0, 0])
+            acc[0] += lat
+            acc[1] += lon
+            acc[2] += 1
+    centroids = {prefix: (s_lat / n, s_lon / n) for prefix, (s_lat, s_lon, n) in sums.items()}
+    return centroids, skipped
+
+
+def build_quote_table(dataset_path, output_path, pickup_coords=None):
+    """
+    Pré-calcula distância e preço para todos os prefixos do dataset e grava o
+    arquivo binário ordenado. Retorna o número de prefixos gravados.
+    """
+    centroids, skipped = read_dataset(dataset_path)
+    if pickup_coords is None:
+        pickup_coords = parse_coords(os.environ.get("PICKUP_POINT_COORDS"))
+    if pickup_coords is None:
+        pickup_coords = centroids.get(int(normalize_cep(PICKUP_POINT_CEP)[:5]))
+    if pickup_coords is None:
+        pickup_coords = get_cep_coordinates(PICKUP_POINT_CEP)
+    if pickup_coords is None:
+        raise SystemExit("Não foi possível determinar as coordenadas do ponto de retirada (use --pickup lat,lon)")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, VERSION, len(centroids), COST_PER_KM, BASE_SHIPPING_FEE, *pickup_coords))
+        for prefix in sorted(centroids):
+            lat, lon = centroids[prefix]
+            distance_km = haversine_distance(pickup_coords[0], pickup_coords[1], lat, lon)
+            out.write(RECORD.pack(prefix, distance_km, shipping_cost_for_distance(distance_km)))
+    os.replace(tmp_path, output_path)  # troca atômica: workers nunca leem um arquivo pela metade
+    if skipped:
+        print(f"[warn] {skipped} linha(s) ignorada(s) no dataset")
+    return len(centroids)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tabela pré-calculada de fretes por prefixo de CEP")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="gera o arquivo binário a partir de um CSV cep,lat,lon")
+    build.add_argument("dataset")
+    build.add_argument("output", nargs="?", default=SHIPPING_TABLE_PATH)
+    build.add_argument("--pickup", help="coordenadas do ponto de retirada no formato lat,lon")
+
+    query = sub.add_parser("lookup", help="consulta um CEP no arquivo gerado")
+    query.add_argument("cep")
+    query.add_argument("--table", default=SHIPPING_TABLE_PATH)
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        pickup = parse_coords(args.pickup) if args.pickup else None
+        if args.pickup and pickup is None:
+            parser.error("--pickup deve estar no formato lat,lon")
+        started = time.perf_counter()
+        count = build_quote_table(args.dataset, args.output, pickup)
+        print(f"[info] {count} prefixos gravados em {args.output} ({time.perf_counter() - started:.2f}s)")
+        return 0
+
+    table = load_quote_table(args.table)
+    if table is None:
+        print(f"[error] Tabela não encontrada: {args.table}")
+        return 1
+    started = time.perf_counter()
+    quote = table.lookup(args.cep)
+    elapsed_us = (time.perf_counter() - started) * 1e6
+    if quote is None:
+        print(f"[info] Prefixo de {args.cep} não está na tabela ({elapsed_us:.1f}µs)")
+        return 1
+    print(f"[info] {args.cep}: {quote[0]:.2f}km = R$ {quote[1]:.2f} ({elapsed_us:.1f}µs)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
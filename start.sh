@@ -1,4 +1,9 @@
 #!/usr/bin/env bash
 # Inicia a aplicação Flask usando Gunicorn
-# gunicorn app:app
-gunicorn --workers 4 app:app
\ No newline at end of file
+set -e
+# esquema do banco (tabelas, colunas, busca, admin): uma vez por deploy, não em cada worker
+flask --app app init-db
+# static/ minificado, com hash no nome e .gz/.br (ver asset_service.py)
+flask --app app build-assets
+# workers/threads/preload: ver gunicorn.conf.py (ajustável por WEB_CONCURRENCY, GUNICORN_THREADS...)
+exec gunicorn -c gunicorn.conf.py
@@ -5,6 +5,22 @@
     const getCart = () => { try { return JSON.parse(localStorage.getItem('cart_v1') || '[]'); } catch (e) { return []; } };
     const setCart = (c) => { localStorage.setItem('cart_v1', JSON.stringify(c)); window.dispatchEvent(new Event('storage')); };
 
+    // Cotação de frete: o servidor responde 202 (pending) enquanto o CEP é geocodificado
+    // em segundo plano; tenta de novo após retry_after_ms até obter a resposta final.
+    window.fetchShippingQuote = async function (cep, method = 'delivery', attempts = 8) {
+        for (let i = 0; i < attempts; i++) {
+            const res = await fetch('/api/calculate-shipping', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ cep: cep, method: method })
+            });
+            const data = await res.json();
+            if (res.status !== 202 || !data.pending) return data;
+            await new Promise(resolve => setTimeout(resolve, data.retry_after_ms || 700));
+        }
+        return { success: false, shipping_cost: 0, distance_km: 0, message: 'Tempo esgotado ao calcular frete. Tente novamente.' };
+    };
+
     window.updateCartCount = function () {
         const cart = getCart();
         const count = cart.reduce((sum, item) => sum + (item.qty || 0), 0);
@@ -143,12 +159,7 @@
         localStorage.setItem('user_cep', cep);
 
         // CHAMADA REAL À API DO BACKEND
-        fetch('/api/calculate-shipping', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ cep: cep, method: 'delivery' })
-        })
-            .then(res => res.json())
+        window.fetchShippingQuote(cep)
             .then(data => {
                 if (data.success) {
                     const shippingCostWithFee = (data.shipping_cost || 0);
@@ -226,6 +237,27 @@
             });
     }
 
+    // --- ESTOQUE EM TEMPO REAL (Server-Sent Events, se habilitado no servidor) ---
+    let stockSource = null;
+    let stockSourceIds = '';
+    function watchStock(variantIds) {
+        if (!window.EventSource || document.body.dataset.stockStream !== '1') return;
+        const ids = variantIds.slice().sort((a, b) => a - b).join(',');
+        if (ids === stockSourceIds) return;
+        stockSource && stockSource.close();
+        stockSource = null;
+        stockSourceIds = ids;
+        if (!ids) return;
+        let lastVersion = null;
+        stockSource = new EventSource('/api/stock-stream?ids=' + ids);
+        stockSource.addEventListener('stock', (event) => {
+            const data = JSON.parse(event.data);
+            // primeiro evento é o estado atual; re-renderiza só quando o estoque mudar
+            if (lastVersion !== null && data.version !== lastVersion) window.renderCartPage();
+            lastVersion = data.version;
+        });
+    }
+
     // --- FUNÇÃO DE RENDERIZAÇÃO PRINCIPAL ---
 
     window.renderCartPage = function () {
@@ -251,11 +283,8 @@
         const variantIds = cart.map(item => item.variant_id);
 
         if (variantIds.length > 0) {
-            fetch('/api/check-stock', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ variant_ids: variantIds })
-            })
+            // GET com ETag: se o estoque não mudou, o navegador revalida e recebe 304 (sem consulta ao banco)
+            fetch('/api/check-stock?ids=' + variantIds.join(','), { cache: 'no-cache' })
                 .then(res => res.json())
                 .then(data => {
                     if (data.success && data.stock) {
@@ -307,6 +336,8 @@
                 });
         }
 
+        watchStock(variantIds);
+
         function renderCartItems(cartItems) {
             list.innerHTML = '';
             summaryList && (summaryList.innerHTML = '');
@@ -323,7 +354,9 @@
                 div.className = 'flex flex-col sm:flex-row items-start sm:items-center justify-between gap-4 p-4 bg-white border rounded';
 
                 const imgFile = item.image || 'placeholder.jpg';
-                const imgSrc = '/static/images/' + imgFile;
+                // URLs do Storage (http...) e do armazenamento local (/media/...) já vêm prontas;
+                // nomes antigos ficam em /static/images
+                const imgSrc = /^(https?:)?\//.test(imgFile) ? imgFile : '/static/images/' + imgFile;
 
                 // Função para criar placeholder personalizado com nome do produto
                 const createPlaceholderSVG = (name, size = 80) => {
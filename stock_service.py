@@ -0,0 +1,180 @@
+"""
+Único ponto de alteração de estoque (variantes e products.total_stock).
+
+`products.total_stock` é um contador desnormalizado: a soma de `product_stock.quantity`
+do produto. Em vez de recalculá-lo carregando as variantes, toda alteração de quantidade
+passa por este módulo e aplica o MESMO delta ao produto, na mesma transação (que também
+incrementa `products.revision`, a versão da página do produto):
+
+  * adjust_quantity — soma/subtrai unidades (baixas só com saldo; usado pelas reservas);
+  * set_quantity    — define a quantidade (admin); compare-and-set contra o valor lido,
+                      então uma reserva concorrente nunca faz o total divergir;
+  * add_variant / delete_variant — somam/subtraem a quantidade da variante.
+
+`verify` e `repair` reconciliam todos os produtos com uma única query agregada:
+    python stock_service.py verify
+    python stock_service.py repair
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, table, column, select, update, insert, delete, and_, func
+
+# tabelas em Core "leve": o serviço não depende dos modelos ORM do app
+product_stock = table(
+    "product_stock",
+    column("id"), column("product_id"), column("size"), column("color"),
+    column("quantity"), column("price"), column("is_available"),
+)
+products = table("products", column("id"), column("total_stock"), column("revision"), column("updated_at"))
+
+SET_QUANTITY_RETRIES = 5
+
+
+def _product_changed(delta):
+    """Valores do UPDATE em products: soma o delta ao total e abre uma nova revisão da página."""
+    return {
+        "total_stock": func.coalesce(products.c.total_stock, 0) + delta,
+        "revision": products.c.revision + 1,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def _adjust_total(conn, product_id, delta):
+    conn.execute(update(products).where(products.c.id == product_id).values(**_product_changed(delta)))
+
+
+def adjust_quantity(conn, variant_id, delta):
+    """
+    Soma `delta` à variante (negativo = baixa) e ao total_stock do produto, na transação
+    de `conn`. Baixas só acontecem se houver saldo. Retorna True se a variante foi alterada.
+    """
+    condition = product_stock.c.id == variant_id
+    if delta < 0:
+        condition = and_(condition, product_stock.c.quantity >= -delta)
+    result = conn.execute(
+        update(product_stock).where(condition).values(quantity=product_stock.c.quantity + delta)
+    )
+    if result.rowcount != 1:
+        return False
+    product_id = select(product_stock.c.product_id).where(product_stock.c.id == variant_id).scalar_subquery()
+    conn.execute(update(products).where(products.c.id == product_id).values(**_product_changed(delta)))
+    return True
+
+
+def set_quantity(conn, variant_id, quantity):
+    """
+    Define a quantidade da variante e aplica a diferença ao total_stock.
+    Retorna a quantidade anterior, ou None se a variante não existe.
+    """
+    for _ in range(SET_QUANTITY_RETRIES):
+        row = conn.execute(
+            select(product_stock.c.product_id, product_stock.c.quantity).where(product_stock.c.id == variant_id)
+        ).first()
+        if row is None:
+            return None
+        previous = row.quantity
+        # compare-and-set: só grava se ninguém alterou a quantidade depois da leitura
+        matches_previous = (
+            product_stock.c.quantity.is_(None) if previous is None else product_stock.c.quantity == previous
+        )
+        result = conn.execute(
+            update(product_stock).where(product_stock.c.id == variant_id, matches_previous)
+            .values(quantity=quantity)
+        )
+        if result.rowcount == 1:
+            _adjust_total(conn, row.product_id, quantity - (previous or 0))
+            return previous or 0
+    raise RuntimeError(f"Estoque da variante {variant_id} mudou durante a atualização; tente novamente")
+
+
+def add_variant(conn, product_id, size, quantity=0, color=None, price=None, is_available=None):
+    """Cria a variante e soma sua quantidade ao total_stock. Retorna o id da variante."""
+    variant_id = conn.execute(insert(product_stock).values(
+        product_id=product_id, size=size, color=color, quantity=quantity, price=price,
+        is_available=quantity > 0 if is_available is None else is_available,
+    ).returning(product_stock.c.id)).scalar_one()
+    _adjust_total(conn, product_id, quantity)
+    return variant_id
+
+
+def delete_variant(conn, variant_id):
+    """Remove a variante e subtrai sua quantidade do total_stock. Retorna False se não existe."""
+    for _ in range(SET_QUANTITY_RETRIES):
+        row = conn.execute(
+            select(product_stock.c.product_id, product_stock.c.quantity).where(product_stock.c.id == variant_id)
+        ).first()
+        if row is None:
+            return False
+        matches_previous = (
+            product_stock.c.quantity.is_(None) if row.quantity is None else product_stock.c.quantity == row.quantity
+        )
+        result = conn.execute(delete(product_stock).where(product_stock.c.id == variant_id, matches_previous))
+        if result.rowcount == 1:
+            _adjust_total(conn, row.product_id, -(row.quantity or 0))
+            return True
+    raise RuntimeError(f"Estoque da variante {variant_id} mudou durante a remoção; tente novamente")
+
+
+def _actual_totals():
+    """Soma real das variantes por produto (0 para produtos sem variantes)."""
+    return (
+        select(func.coalesce(func.sum(product_stock.c.quantity), 0))
+        .where(product_stock.c.product_id == products.c.id)
+        .scalar_subquery()
+    )
+
+
+def verify(engine):
+    """Lista (product_id, total_stock, soma_real) dos produtos com contador divergente."""
+    actual = _actual_totals()
+    stmt = (
+        select(products.c.id, products.c.total_stock, actual.label("actual"))
+        .where(products.c.total_stock.is_distinct_from(actual))
+        .order_by(products.c.id)
+    )
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(stmt)]
+
+
+def repair(engine):
+    """Recalcula total_stock de todos os produtos divergentes em um único UPDATE. Retorna o nº corrigido."""
+    actual = _actual_totals()
+    with engine.begin() as conn:
+        result = conn.execute(
+            update(products).where(products.c.total_stock.is_distinct_from(actual)).values(total_stock=actual)
+        )
+        return result.rowcount
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verifica/corrige products.total_stock")
+    parser.add_argument("command", choices=["verify", "repair"])
+    parser.add_argument("--database-url", default=None, help="padrão: DATABASE_URL do ambiente/.env")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    database_url = args.database_url or os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("[error] Configure DATABASE_URL no .env")
+        return 2
+    engine = create_engine(database_url, future=True)
+
+    if args.command == "repair":
+        fixed = repair(engine)
+        print(f"[info] total_stock corrigido em {fixed} produto(s)")
+        return 0
+
+    drift = verify(engine)
+    for product_id, total_stock, actual in drift:
+        print(f"[warn] Produto {product_id}: total_stock={total_stock}, soma das variantes={actual}")
+    print(f"[info] {len(drift)} produto(s) com total_stock divergente")
+    return 1 if drift else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Backends de armazenamento das imagens de produto.
+
+Mesma interface para os dois backends:
+    upload_many([(file_object, path), ...], max_workers=None, upsert=False) -> [UploadResult, ...]
+                                         (mesma ordem; upsert=True sobrescreve o caminho)
+    delete(url) -> bool
+    delete_many([url, ...])              (um lote; levanta exceção se falhar)
+    list_objects() -> [(chave, mtime), ...]
+    owns(url) / key_for_url(url) / url_for_key(chave)
+
+  * SupabaseStorage — o Supabase Storage de sempre (supabase_service.py).
+  * LocalStorage    — sistema de arquivos local, endereçado por conteúdo: o nome do
+    arquivo é o SHA-256 dos bytes, então reenviar a mesma foto não duplica nada.
+    Os arquivos são servidos pela rota /media do app, com cache imutável, ETag forte
+    (o próprio hash), Range e, se configurado, repasse ao servidor web via
+    X-Sendfile (Apache/lighttpd) ou X-Accel-Redirect (nginx).
+
+STORAGE_BACKEND=supabase (padrão) ou local. URLs antigas continuam sendo apagadas
+pelo backend dono delas (delete_url), mesmo depois de trocar de backend.
+"""
+
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import tempfile
+import time
+from datetime import datetime
+
+from supabase_service import (
+    UploadResult, upload_files_to_supabase, delete_files_from_supabase, list_files_in_supabase,
+    path_from_public_url, public_url_for, UPLOAD_CHUNK_SIZE, UPLOAD_MAX_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase").lower()
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "media")
+MEDIA_URL_PREFIX = os.environ.get("MEDIA_URL_PREFIX", "/media").rstrip("/")
+# "" (o Flask envia o arquivo), "x-sendfile" ou "x-accel-redirect"
+MEDIA_SENDFILE = os.environ.get("MEDIA_SENDFILE", "").lower()
+# location interna do nginx que aponta para MEDIA_ROOT (usada com X-Accel-Redirect)
+MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_PREFIX", "/_media").rstrip("/")
+MEDIA_MAX_AGE = 365 * 24 * 3600
+
+# chave de um objeto local: "ab/<sha256>.ext"
+MEDIA_KEY_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]{1,5})?$")
+
+
+class SupabaseStorage:
+    name = "supabase"
+
+    def upload_many(self, uploads, max_workers=None, upsert=False):
+        return upload_files_to_supabase(uploads, max_workers or UPLOAD_MAX_WORKERS, upsert=upsert)
+
+    def key_for_url(self, url):
+        return path_from_public_url(url)
+
+    def url_for_key(self, key):
+        return public_url_for(key)
+
+    def delete_many(self, urls):
+        # uma única chamada remove([...]) para o lote inteiro
+        delete_files_from_supabase([key for key in map(self.key_for_url, urls) if key])
+
+    def delete(self, url):
+        try:
+            self.delete_many([url])
+            return True
+        except Exception as e:
+            logger.warning("Erro ao deletar arquivo do Supabase: %s", e)
+            return False
+
+    def list_objects(self):
+        for key, created_at in list_files_in_supabase("products"):
+            try:
+                mtime = datetime.fromisoformat(created_at).timestamp() if created_at else 0.0
+            except ValueError:
+                mtime = 0.0
+            yield key, mtime
+
+    def owns(self, url):
+        return self.key_for_url(url) is not None
+
+
+class LocalStorage:
+    """Arquivos em `root`, nomeados pelo SHA-256 do conteúdo (deduplicados)."""
+
+    name = "local"
+
+    def __init__(self, root=MEDIA_ROOT, url_prefix=MEDIA_URL_PREFIX):
+        self.root = root
+        self.url_prefix = url_prefix
+
+    def url_for_key(self, key):
+        return f"{self.url_prefix}/{key}"
+
+    def key_for_url(self, url):
+        prefix = self.url_prefix + "/"
+        if not url or not url.startswith(prefix):
+            return None
+        key = url[len(prefix):]
+        return key if MEDIA_KEY_RE.match(key) else None
+
+    def path_for_key(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def _store(self, file_object, path_on_storage):
+        """Grava em streaming calculando o hash; se o conteúdo já existe, descarta a cópia."""
+        ext = posixpath.splitext(path_on_storage)[1].lower()
+        ext = ext if re.fullmatch(r"\.[a-z0-9]{1,5}", ext or "") else ""
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                file_object.seek(0)
+                while True:
+                    chunk = file_object.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+            sha = digest.hexdigest()
+            key = f"{sha[:2]}/{sha}{ext}"
+            final_path = self.path_for_key(key)
+            if os.path.exists(final_path):
+                os.unlink(tmp_path)  # mesmo conteúdo já armazenado
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, final_path)
+            return key
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def upload_many(self, uploads, max_workers=None, upsert=False):
+        # gravação local: sequencial; o endereçamento por conteúdo já torna o reenvio idempotente
+        results = []
+        for file_object, path_on_storage in uploads:
+            filename = getattr(file_object, "filename", None) or path_on_storage
+            started = time.perf_counter()
+            try:
+                key = self._store(file_object, path_on_storage)
+                results.append(UploadResult(filename, key, self.url_for_key(key), None, time.perf_counter() - started))
+            except OSError as e:
+                logger.error("Erro ao gravar %s no armazenamento local: %s", filename, e)
+                results.append(UploadResult(filename, path_on_storage, None, str(e), time.perf_counter() - started))
+        return results
+
+    def delete_many(self, urls):
+        for url in urls:
+            key = self.key_for_url(url)
+            if key is None:
+                continue
+            try:
+                os.unlink(self.path_for_key(key))
+            except FileNotFoundError:
+                pass
+
+    def delete(self, url):
+        if self.key_for_url(url) is None:
+            return False
+        self.delete_many([url])
+        return True
+
+    def list_objects(self):
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                key = os.path.relpath(os.path.join(directory, filename), self.root).replace(os.sep, "/")
+                if MEDIA_KEY_RE.match(key):
+                    yield key, os.path.getmtime(os.path.join(directory, filename))
+
+    def owns(self, url):
+        return self.key_for_url(url) is not None
+
+
+supabase_storage = SupabaseStorage()
+local_storage = LocalStorage()
+storage = local_storage if STORAGE_BACKEND == "local" else supabase_storage
+
+
+def backend_for_url(url):
+    """Backend dono da URL (independe do backend ativo), ou None."""
+    for backend in (local_storage, supabase_storage):
+        if backend.owns(url):
+            return backend
+    return None
+
+
+def delete_url(url):
+    """Apaga o objeto no backend dono da URL."""
+    backend = backend_for_url(url)
+    return backend.delete(url) if backend else False
@@ -1,5 +1,10 @@
-from supabase import create_client, Client
+import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+import httpx
 from werkzeug.utils import secure_filename # Para garantir nomes de arquivo seguros
 import uuid
 
@@ -7,22 +12,40 @@ import uuid
 from dotenv import load_dotenv
 load_dotenv()
 
+from metrics_service import track_outbound
+
+logger = logging.getLogger(__name__)
+
 # Configurações do Supabase
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
 BUCKET_NAME = "product_images" # Use o nome que você definiu
 
+# Upload em lote: nº de envios simultâneos e tamanho dos blocos lidos do arquivo
+UPLOAD_MAX_WORKERS = int(os.environ.get("UPLOAD_MAX_WORKERS", "4"))
+UPLOAD_CHUNK_SIZE = 256 * 1024
+UPLOAD_TIMEOUT = float(os.environ.get("UPLOAD_TIMEOUT", "60"))
+UPLOAD_CACHE_CONTROL = "max-age=3600"
+
 # Validação das credenciais
 if not SUPABASE_URL or not SUPABASE_KEY:
-    print("[ERROR] SUPABASE_URL ou SUPABASE_SERVICE_KEY não configurados no .env")
-    print(f"[DEBUG] SUPABASE_URL: {SUPABASE_URL}")
-    print(f"[DEBUG] SUPABASE_KEY: {'configurada' if SUPABASE_KEY else 'NÃO configurada'}")
+    logger.error("SUPABASE_URL ou SUPABASE_SERVICE_KEY não configurados no .env")
+    logger.debug("SUPABASE_URL: %s | SUPABASE_KEY: %s", SUPABASE_URL, "configurada" if SUPABASE_KEY else "NÃO configurada")
+
+# Cliente Supabase (SDK): criado no primeiro uso — importar o SDK é caro e só as funções
+# legadas abaixo o usam (o upload/remoção em lote falam HTTP direto com a API do Storage)
+_supabase_client = None
+_supabase_client_lock = threading.Lock()
+
+
+def get_supabase_client():
+    global _supabase_client
+    with _supabase_client_lock:
+        if _supabase_client is None:
+            from supabase import create_client
 
-# Inicializa o cliente Supabase
-try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-except Exception as e:
-    print(f"[ERROR] Falha ao criar cliente Supabase: {e}")
+            _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        return _supabase_client
 
 def upload_file_to_supabase(file_object, folder_path="products", custom_filename=None):
     """
@@ -52,36 +75,33 @@ def upload_file_to_supabase(file_object, folder_path="products", custom_filename
     try:
         # 2. Verifica credenciais
         if not SUPABASE_URL or not SUPABASE_KEY:
-            print("[error] Credenciais do Supabase não configuradas")
+            logger.error("Credenciais do Supabase não configuradas")
             return None
         
         # 3. Lê o conteúdo do arquivo
         file_object.seek(0)  # Garante que estamos no início do arquivo
         file_data = file_object.read()
         
-        print(f"[info] Tentando upload: {file_object.filename} ({len(file_data)} bytes)")
+        logger.debug("Tentando upload: %s (%d bytes)", file_object.filename, len(file_data))
         
         # 4. Faz o upload do arquivo
-        response = supabase.storage.from_(BUCKET_NAME).upload(
+        response = get_supabase_client().storage.from_(BUCKET_NAME).upload(
             file=file_data,
             path=path_on_storage,
             file_options={"content-type": file_object.content_type or "image/jpeg"}
         )
         
         # 5. Obtém a URL pública para salvar no PostgreSQL
-        public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(path_on_storage)
+        public_url = get_supabase_client().storage.from_(BUCKET_NAME).get_public_url(path_on_storage)
         
-        print(f"[info] ✅ Upload bem-sucedido: {path_on_storage}")
-        print(f"[info] URL pública: {public_url}")
+        logger.debug("Upload bem-sucedido: %s (URL pública: %s)", path_on_storage, public_url)
         return public_url
         
     except Exception as e:
-        print(f"[error] ❌ Erro ao fazer upload para Supabase: {e}")
-        print(f"[debug] Arquivo: {file_object.filename}")
-        print(f"[debug] Bucket: {BUCKET_NAME}")
-        print(f"[debug] Path: {path_on_storage}")
-        print(f"[debug] URL configurada: {SUPABASE_URL}")
-        print(f"[debug] Key configurada: {'Sim' if SUPABASE_KEY else 'Não'}")
+        logger.error(
+            "Erro ao fazer upload para Supabase: %s", e,
+            extra={"file": file_object.filename, "bucket": BUCKET_NAME, "path": path_on_storage},
+        )
         return None
     
 
@@ -104,13 +124,13 @@ def delete_file_from_supabase(public_url):
         # Padrão da URL do Supabase Storage para extração do caminho
         path_segments = public_url.split(f"/{BUCKET_NAME}/")
         if len(path_segments) < 2:
-            print("URL inválida ou não pertence a este bucket.")
+            logger.warning("URL inválida ou não pertence a este bucket: %s", public_url)
             return False
             
         file_path_in_bucket = path_segments[1]
         
         # 2. Faz a remoção no Storage
-        response = supabase.storage.from_(BUCKET_NAME).remove([file_path_in_bucket])
+        response = get_supabase_client().storage.from_(BUCKET_NAME).remove([file_path_in_bucket])
         
         # O Supabase retorna uma lista de objetos vazios em caso de sucesso
         if response and not response[0].get('error'):
@@ -119,5 +139,184 @@ def delete_file_from_supabase(public_url):
         return False
         
     except Exception as e:
-        print(f"Erro ao deletar arquivo do Supabase: {e}")
-        return False
\ No newline at end of file
+        logger.warning("Erro ao deletar arquivo do Supabase: %s", e)
+        return False
+
+
+# =========================================================================
+# UPLOAD EM LOTE (paralelo, em streaming)
+# =========================================================================
+
+class UploadResult(NamedTuple):
+    """Resultado do envio de um arquivo (url=None e error preenchido em caso de falha)."""
+    filename: str
+    path: str
+    url: Optional[str]
+    error: Optional[str]
+    seconds: float
+
+    @property
+    def ok(self):
+        return self.url is not None
+
+
+def public_url_for(path_on_storage):
+    """URL pública do objeto, calculada localmente (mesmo formato de get_public_url)."""
+    return f"{(SUPABASE_URL or '').rstrip('/')}/storage/v1/object/public/{BUCKET_NAME}/{path_on_storage}"
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def _get_http_client():
+    """Cliente HTTP compartilhado (thread-safe, conexões keep-alive reaproveitadas entre lotes)."""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                timeout=UPLOAD_TIMEOUT,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=UPLOAD_MAX_WORKERS),
+                headers={"Authorization": f"Bearer {SUPABASE_KEY}", "apikey": SUPABASE_KEY},
+            )
+        return _http_client
+
+
+def _iter_chunks(file_object):
+    file_object.seek(0)
+    while True:
+        chunk = file_object.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _content_length(file_object):
+    file_object.seek(0, os.SEEK_END)
+    size = file_object.tell()
+    file_object.seek(0)
+    return size
+
+
+def _upload_one(client, file_object, path_on_storage, upsert=False):
+    filename = getattr(file_object, "filename", None) or path_on_storage
+    started = time.perf_counter()
+    try:
+        # o corpo vai em blocos direto do arquivo (não é lido inteiro para a memória)
+        with track_outbound("supabase") as call:
+            response = client.post(
+                f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/{BUCKET_NAME}/{path_on_storage}",
+                content=_iter_chunks(file_object),
+                headers={
+                    "Content-Type": getattr(file_object, "content_type", None) or "image/jpeg",
+                    "Content-Length": str(_content_length(file_object)),
+                    "cache-control": UPLOAD_CACHE_CONTROL,
+                    "x-upsert": "true" if upsert else "false",
+                },
+            )
+            call["status"] = response.status_code
+        if response.status_code >= 400:
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+        else:
+            return UploadResult(filename, path_on_storage, public_url_for(path_on_storage), None,
+                                time.perf_counter() - started)
+    except (httpx.HTTPError, OSError) as e:
+        error = str(e) or e.__class__.__name__
+    return UploadResult(filename, path_on_storage, None, error, time.perf_counter() - started)
+
+
+def upload_files_to_supabase(uploads, max_workers=UPLOAD_MAX_WORKERS, upsert=False):
+    """
+    Envia vários arquivos ao Supabase Storage em paralelo (até `max_workers` simultâneos).
+
+    Args:
+        uploads: lista de (file_object, path_on_storage), ex.: [(f, "products/nome_01.jpg"), ...]
+        max_workers: envios simultâneos.
+        upsert: sobrescreve objetos existentes no mesmo caminho (reenvio idempotente).
+
+    Returns:
+        Lista de UploadResult na mesma ordem de `uploads` (sucesso ou erro por arquivo).
+    """
+    if not uploads:
+        return []
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        logger.error("Credenciais do Supabase não configuradas")
+        return [
+            UploadResult(getattr(f, "filename", None) or path, path, None, "Supabase não configurado", 0.0)
+            for f, path in uploads
+        ]
+
+    workers = max(1, min(max_workers, len(uploads)))
+    client = _get_http_client()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload") as pool:
+        futures = [pool.submit(_upload_one, client, f, path, upsert) for f, path in uploads]
+        results = [future.result() for future in futures]
+
+    for r in results:
+        if r.ok:
+            logger.debug("Upload bem-sucedido: %s (%.2fs)", r.path, r.seconds)
+        else:
+            logger.error("Erro ao fazer upload de %s: %s", r.filename, r.error)
+    return results
+
+
+# =========================================================================
+# REMOÇÃO EM LOTE E LISTAGEM
+# =========================================================================
+
+SUPABASE_LIST_PAGE_SIZE = 1000
+
+
+def path_from_public_url(public_url):
+    """'https://.../object/public/product_images/products/x.jpg' -> 'products/x.jpg' (ou None)."""
+    segments = (public_url or "").split(f"/{BUCKET_NAME}/", 1)
+    if len(segments) < 2 or not segments[1]:
+        return None
+    return segments[1].split("?", 1)[0]
+
+
+def delete_files_from_supabase(paths):
+    """
+    Remove vários objetos com UMA chamada (DELETE /object/<bucket> com a lista de caminhos).
+    Objetos inexistentes não são erro. Levanta exceção se a chamada falhar.
+    """
+    if not paths:
+        return
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise RuntimeError("Credenciais do Supabase não configuradas")
+    with track_outbound("supabase") as call:
+        response = _get_http_client().request(
+            "DELETE",
+            f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/{BUCKET_NAME}",
+            json={"prefixes": list(paths)},
+        )
+        call["status"] = response.status_code
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+
+def list_files_in_supabase(folder_path="products"):
+    """Itera (caminho, datetime ISO de criação) de todos os objetos da pasta, paginando."""
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise RuntimeError("Credenciais do Supabase não configuradas")
+    offset = 0
+    while True:
+        with track_outbound("supabase") as call:
+            response = _get_http_client().post(
+                f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/list/{BUCKET_NAME}",
+                json={
+                    "prefix": folder_path, "limit": SUPABASE_LIST_PAGE_SIZE, "offset": offset,
+                    "sortBy": {"column": "name", "order": "asc"},
+                },
+            )
+            call["status"] = response.status_code
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        entries = response.json()
+        for entry in entries:
+            if entry.get("id") is None:  # subpasta
+                continue
+            yield f"{folder_path}/{entry['name']}", entry.get("created_at") or entry.get("updated_at")
+        if len(entries) < SUPABASE_LIST_PAGE_SIZE:
+            return
+        offset += len(entries)
@@ -0,0 +1,133 @@
+"""
+Testes de migrate_images_to_supabase.migrate() com SQLite e LocalStorage (sem rede).
+
+    python -m pytest -q tests
+"""
+
+import pytest
+from sqlalchemy import create_engine, select, text
+
+from migrate_images_to_supabase import migrate, product_images, products
+from storage_service import LocalStorage
+
+JPEG_A = b"\xff\xd8\xff\xe0" + b"imagem-a" * 64
+JPEG_B = b"\xff\xd8\xff\xe0" + b"imagem-b" * 64
+
+
+@pytest.fixture
+def env(tmp_path):
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    (images_dir / "a.jpg").write_bytes(JPEG_A)
+    (images_dir / "a-copia.jpg").write_bytes(JPEG_A)  # mesmo conteúdo de a.jpg
+    (images_dir / "b.jpg").write_bytes(JPEG_B)
+    (tmp_path / "segredo.jpg").write_bytes(JPEG_B)  # fora de images_dir
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", future=True)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE products (id INTEGER PRIMARY KEY, revision INTEGER NOT NULL, updated_at DATETIME)"))
+        conn.execute(text("CREATE TABLE product_images (id INTEGER PRIMARY KEY, product_id INTEGER, image_url TEXT)"))
+        conn.execute(text("INSERT INTO products (id, revision) VALUES (1, 1), (2, 1), (3, 1)"))
+        conn.execute(text(
+            "INSERT INTO product_images (id, product_id, image_url) VALUES "
+            "(1, 1, 'a.jpg'), (2, 2, 'a-copia.jpg'), (3, 3, 'b.jpg'), "
+            "(4, 3, '../segredo.jpg'), (5, 3, 'https://cdn.example.com/x.jpg')"
+        ))
+
+    return {
+        "engine": engine,
+        "backend": LocalStorage(root=str(tmp_path / "media")),
+        "images_dir": str(images_dir),
+        "checkpoint_path": str(tmp_path / "checkpoint.json"),
+    }
+
+
+def run(env, **kwargs):
+    return migrate(
+        env["engine"], env["backend"], images_dir=env["images_dir"],
+        checkpoint_path=env["checkpoint_path"], workers=2, **kwargs,
+    )
+
+
+def image_urls(engine):
+    with engine.connect() as conn:
+        return dict(conn.execute(select(product_images.c.id, product_images.c.image_url)).all())
+
+
+def revisions(engine):
+    with engine.connect() as conn:
+        return dict(conn.execute(select(products.c.id, products.c.revision)).all())
+
+
+def test_conteudo_repetido_sobe_uma_vez(env):
+    stats = run(env)
+
+    assert stats["images"] == 4  # a URL https:// já está migrada
+    assert stats["uploaded"] == 2
+    assert stats["reused"] == 1
+    assert stats["migrated"] == 3
+    urls = image_urls(env["engine"])
+    assert urls[1] == urls[2]
+    assert urls[1] != urls[3]
+    assert all(env["backend"].owns(urls[image_id]) for image_id in (1, 2, 3))
+    assert len(list(env["backend"].list_objects())) == 2
+    assert revisions(env["engine"]) == {1: 2, 2: 2, 3: 2}
+
+
+def test_caminho_fora_da_pasta_e_ignorado(env):
+    stats = run(env)
+
+    assert stats["missing"] == 1
+    assert image_urls(env["engine"])[4] == "../segredo.jpg"
+
+
+def test_update_condicional_preserva_alteracao_do_admin(env, monkeypatch):
+    backend = env["backend"]
+    upload_many = backend.upload_many
+
+    def upload_and_edit(uploads, **kwargs):
+        # o admin troca a imagem 3 enquanto os arquivos estão sendo enviados
+        with env["engine"].begin() as conn:
+            conn.execute(text("UPDATE product_images SET image_url = 'https://cdn.example.com/nova.jpg' WHERE id = 3"))
+        return upload_many(uploads, **kwargs)
+
+    monkeypatch.setattr(backend, "upload_many", upload_and_edit)
+    stats = run(env)
+
+    assert stats["conflicts"] == 1
+    assert stats["migrated"] == 2
+    assert image_urls(env["engine"])[3] == "https://cdn.example.com/nova.jpg"
+    assert revisions(env["engine"])[3] == 1
+
+
+def test_segunda_execucao_nao_altera_nada(env):
+    run(env)
+    urls = image_urls(env["engine"])
+    objects = sorted(env["backend"].list_objects())
+
+    stats = run(env)
+
+    assert stats["images"] == 1  # só sobra a URL rejeitada
+    assert stats["migrated"] == stats["uploaded"] == stats["conflicts"] == 0
+    assert image_urls(env["engine"]) == urls
+    assert sorted(env["backend"].list_objects()) == objects
+    assert revisions(env["engine"]) == {1: 2, 2: 2, 3: 2}
+
+
+def test_checkpoint_evita_reenvio_apos_queda(env, monkeypatch):
+    import migrate_images_to_supabase
+
+    def queda(*args, **kwargs):
+        raise RuntimeError("conexão perdida")
+
+    # cai depois do upload (checkpoint já salvo) e antes do commit das URLs
+    monkeypatch.setattr(migrate_images_to_supabase, "update", queda)
+    with pytest.raises(RuntimeError):
+        run(env)
+    monkeypatch.undo()
+
+    stats = run(env)
+
+    assert stats["uploaded"] == 0
+    assert stats["reused"] == 3
+    assert stats["migrated"] == 3